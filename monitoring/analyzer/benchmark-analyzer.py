@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+
+"""
+Proxmox Health Check Analyzer Benchmark
+Synthesizes collector snapshots of a given size from a real sample and times
+loading, analysis, report rendering and history ingestion on them
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterator, List, Optional
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SAMPLE = os.path.join(SCRIPT_DIR, '..', 'data', 'jan-1-example.json')
+DEFAULT_ANALYZER = os.path.join(SCRIPT_DIR, 'proxmox-analyzer.py')
+
+# Outputs whose content lines are mostly journal/dmesg entries grow with the snapshot size
+LOG_LINE_RE = re.compile(r'^([A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d|\[\s*\d+\.\d+\])')
+LOG_OUTPUT_MIN_SHARE = 0.9
+PID_RE = re.compile(r'\[(\d+)\]:')
+WRITE_CHUNK_LINES = 10000
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+STAGES = ('load', 'analyze', 'markdown', 'json', 'ingest')
+# Stages whose cost scales with the snapshot; the others only see the report
+INPUT_STAGES = ('load', 'analyze')
+# Flag stages that got 10% and at least 5 ms slower
+REGRESSION_THRESHOLD = 1.10
+REGRESSION_MIN_SECONDS = 0.005
+
+def parse_size(value: str) -> int:
+    """Parse 1M, 500K, 1G or a plain byte count"""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([KMG]?)B?', value.strip().upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size: {value}")
+    return int(float(match.group(1)) * SIZE_UNITS.get(match.group(2), 1))
+
+def format_size(size: int) -> str:
+    for unit in ('G', 'M', 'K'):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return str(size)
+
+def split_output(text: str):
+    """(header lines, content lines, trailer lines) of a collector output"""
+    lines = text.split('\n')
+    head = [line for line in lines[:1] if line.startswith('===')]
+    tail_start = len(lines)
+    while tail_start > len(head) and (not lines[tail_start - 1].strip() or lines[tail_start - 1].startswith('===')):
+        tail_start -= 1
+    return head, lines[len(head):tail_start], lines[tail_start:]
+
+def log_outputs(outputs: Dict[str, str]) -> List[str]:
+    """Keys of outputs that are journal or kernel log excerpts"""
+    keys = []
+    for key, text in outputs.items():
+        content = [line for line in split_output(text)[1] if line.strip()]
+        if content and sum(1 for line in content if LOG_LINE_RE.match(line)) >= LOG_OUTPUT_MIN_SHARE * len(content):
+            keys.append(key)
+    return sorted(keys)
+
+def guest_lists(guests: int, rng: random.Random) -> Dict[str, str]:
+    """qm list / pct list outputs with the given number of guests (two thirds VMs)"""
+    vms = guests - guests // 3
+    qm = ["=== Command: qm list ===",
+          "      VMID NAME                 STATUS     MEM(MB)    BOOTDISK(GB) PID       "]
+    for i in range(vms):
+        running = rng.random() < 0.7
+        qm.append(f"{100 + i:>10} {'vm-' + str(100 + i):<20} {'running' if running else 'stopped':<10} "
+                  f"{rng.choice([1024, 2048, 4096, 8192, 16384]):<10} {rng.choice([16, 32, 64, 150, 750]):>12.2f} "
+                  f"{rng.randint(1000, 99999) if running else 0:<10}")
+    pct = ["=== Command: pct list ===",
+           "VMID       Status     Lock         Name                "]
+    for i in range(guests - vms):
+        pct.append(f"{100 + vms + i:<10} {'running' if rng.random() < 0.7 else 'stopped':<10} "
+                   f"{'':<12} {'ct-' + str(100 + vms + i):<20}")
+    return {"qm_list": '\n'.join(qm + ["=== Exit Code: 0 ===", ""]),
+            "pct_list": '\n'.join(pct + ["=== Exit Code: 0 ===", ""])}
+
+def smart_outputs(outputs: Dict[str, str], disks: int) -> Dict[str, str]:
+    """Clone the sample's smart_* outputs to the requested number of disks"""
+    samples = sorted(key for key in outputs if key.startswith('smart_'))
+    if not samples or disks <= 0:
+        return {}
+    result = {}
+    counters = {'sd': 0, 'nvme': 0}
+    for i in range(disks):
+        source = samples[i % len(samples)]
+        kind = 'nvme' if source.startswith('smart_nvme') else 'sd'
+        n = counters[kind]
+        counters[kind] += 1
+        if kind == 'nvme':
+            device = f"nvme{n}"
+        else:
+            device = 'sd' + (chr(ord('a') + n // 26 - 1) if n >= 26 else '') + chr(ord('a') + n % 26)
+        result[f"smart_{device}"] = outputs[source].replace(f"/dev/{source[6:]}", f"/dev/{device}")
+    return result
+
+def scaled_lines(content: List[str], target_bytes: int, rng: random.Random) -> Iterator[str]:
+    """Cycle through log lines, varying PIDs, until target_bytes are produced"""
+    produced = 0
+    lines = [line for line in content if line.strip()] or ['']
+    i = 0
+    while produced < target_bytes:
+        line = lines[i % len(lines)]
+        if i >= len(lines):
+            line = PID_RE.sub(lambda m: f"[{rng.randint(100, 4194304)}]:", line, count=1)
+        produced += len(line) + 1
+        i += 1
+        yield line
+
+def write_json_string(f, head: List[str], lines: Iterator[str], tail: List[str]):
+    """Write one JSON string value in chunks so huge outputs never sit in memory"""
+    f.write('"')
+    if head:
+        f.write(json.dumps('\n'.join(head) + '\n', ensure_ascii=False)[1:-1])
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= WRITE_CHUNK_LINES:
+            f.write(json.dumps('\n'.join(chunk) + '\n', ensure_ascii=False)[1:-1])
+            chunk = []
+    if chunk:
+        f.write(json.dumps('\n'.join(chunk) + '\n', ensure_ascii=False)[1:-1])
+    f.write(json.dumps('\n'.join(tail), ensure_ascii=False)[1:-1])
+    f.write('"')
+
+def generate_snapshot(sample: Dict[str, Any], path: str, size: int, guests: int, disks: int,
+                      seed: int = 0) -> int:
+    """Write a synthetic snapshot of about `size` bytes; returns the actual size"""
+    rng = random.Random(seed)
+    outputs = dict(sample['raw_outputs'])
+    for key in [key for key in outputs if key.startswith('smart_')]:
+        del outputs[key]
+    outputs.update(smart_outputs(sample['raw_outputs'], disks))
+    outputs.update(guest_lists(guests, rng))
+
+    metadata = dict(sample.get('metadata', {}), synthetic=True)
+    fixed = len(json.dumps({"metadata": metadata, "raw_outputs": outputs}, ensure_ascii=False))
+    logs = log_outputs(outputs)
+    log_bytes = sum(len(outputs[key]) for key in logs) or 1
+    extra = max(0, size - fixed)
+
+    with open(path, 'w') as f:
+        f.write('{"metadata": ' + json.dumps(metadata) + ', "raw_outputs": {')
+        for index, key in enumerate(sorted(outputs)):
+            f.write((', ' if index else '') + json.dumps(key) + ': ')
+            if key in logs:
+                head, content, tail = split_output(outputs[key])
+                target = len('\n'.join(content)) + extra * len(outputs[key]) // log_bytes
+                write_json_string(f, head, scaled_lines(content, target, rng), tail)
+            else:
+                f.write(json.dumps(outputs[key], ensure_ascii=False))
+        f.write('}}')
+    return os.path.getsize(path)
+
+def load_analyzer(path: str):
+    # The script imports its modules (proxmox_analyzer.py, ...) from its own directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    spec = importlib.util.spec_from_file_location('proxmox_analyzer', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(analyzer_path: str, snapshot: str, hosts: int, repeat: int) -> Dict[str, Any]:
+    """Time every stage on one snapshot (runs in a fresh process per size)
+
+    With several hosts the snapshot is analyzed once per host name, as a
+    fleet of identical machines; stage times are summed over hosts and the
+    best of `repeat` runs is kept.
+    """
+    pa = load_analyzer(analyzer_path)
+    load = getattr(pa, 'load_snapshot', None) or (lambda p: json.load(open(p)))
+    best: Dict[str, float] = {}
+    rss_after: Dict[str, float] = {}
+    for _ in range(repeat):
+        totals = dict.fromkeys(STAGES, 0.0)
+        history_dir = tempfile.mkdtemp(prefix='analyzer-bench-history-')
+        try:
+            store = pa.MetricStore(history_dir) if hasattr(pa, 'MetricStore') else None
+            for host in range(hosts):
+                started = time.perf_counter()
+                data = load(snapshot)
+                totals['load'] += time.perf_counter() - started
+                rss_after['load'] = peak_rss_mb()
+                if hosts > 1:
+                    data['metadata'] = dict(data.get('metadata', {}), hostname=f"pve{host:03d}")
+
+                started = time.perf_counter()
+                report = pa.ProxmoxAnalyzer(data).analyze_all()
+                totals['analyze'] += time.perf_counter() - started
+                rss_after['analyze'] = peak_rss_mb()
+
+                started = time.perf_counter()
+                pa.generate_markdown_report(report)
+                totals['markdown'] += time.perf_counter() - started
+
+                started = time.perf_counter()
+                json.dumps(report, indent=2)
+                totals['json'] += time.perf_counter() - started
+
+                if store is not None:
+                    started = time.perf_counter()
+                    store.ingest_report(report)
+                    totals['ingest'] += time.perf_counter() - started
+                del data, report
+        finally:
+            shutil.rmtree(history_dir, ignore_errors=True)
+        for stage, seconds in totals.items():
+            best[stage] = min(best.get(stage, seconds), seconds)
+    if not hasattr(pa, 'MetricStore'):
+        del best['ingest']
+    return {"stages": best, "rss_after_mb": rss_after, "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+def analyzer_version(path: str) -> Dict[str, Optional[str]]:
+    """Identify the analyzer build being measured"""
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    try:
+        commit = subprocess.run(['git', '-C', os.path.dirname(os.path.abspath(path)), 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"analyzer": os.path.abspath(path), "analyzer_sha256": digest, "git_commit": commit}
+
+def params_key(result: Dict[str, Any]) -> str:
+    params = result['params']
+    return f"{params['size']}/{params['guests']}/{params['disks']}/{params['hosts']}"
+
+def print_result(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    params = result['params']
+    print(f"{format_size(params['size'])} snapshot ({result['snapshot_bytes']} bytes, "
+          f"{params['guests']} guests, {params['disks']} disks, {params['hosts']} hosts): "
+          f"peak RSS {result['peak_rss_mb']} MB")
+    for stage, stats in result['stages'].items():
+        throughput = f"{stats['mb_per_s']:>10.1f} MB/s" if stats['mb_per_s'] else ' ' * 15
+        line = f"  {stage:<10} {stats['seconds']:>10.4f} s {throughput}"
+        old = (baseline or {}).get('stages', {}).get(stage)
+        if old and old['seconds'] > 0:
+            ratio = stats['seconds'] / old['seconds']
+            line += f"   {ratio:>5.2f}x vs {baseline.get('git_commit') or baseline['analyzer_sha256']}"
+            if ratio > REGRESSION_THRESHOLD and stats['seconds'] - old['seconds'] > REGRESSION_MIN_SECONDS:
+                line += "  REGRESSION"
+        print(line)
+
+def load_baselines(path: str) -> Dict[str, Dict[str, Any]]:
+    """Latest result per parameter set from an earlier results file"""
+    baselines = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                baselines[params_key(result)] = result
+    return baselines
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analyzer on synthetic snapshots')
+    parser.add_argument('--sample', default=DEFAULT_SAMPLE, help='Real snapshot to synthesize from')
+    parser.add_argument('--analyzer', default=DEFAULT_ANALYZER,
+                        help='proxmox-analyzer.py to measure (e.g. from an older checkout)')
+    parser.add_argument('--sizes', default='1M,10M,100M',
+                        help='Comma-separated snapshot sizes, e.g. 1M,10M,100M,1G (default: %(default)s)')
+    parser.add_argument('--guests', type=int, default=20, help='VMs and containers per host (default: %(default)s)')
+    parser.add_argument('--disks', type=int, default=4, help='Disks with SMART output per host (default: %(default)s)')
+    parser.add_argument('--hosts', type=int, default=1, help='Hosts analyzed per size (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per size; the fastest counts (default: %(default)s)')
+    parser.add_argument('--results', default='benchmark-results.jsonl',
+                        help='Append one JSON line per size to this file (default: %(default)s)')
+    parser.add_argument('--compare', metavar='RESULTS', help='Earlier results file to compare against')
+    parser.add_argument('--keep', metavar='DIR', help='Keep the generated snapshots in this directory')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(args.analyzer, args.measure, args.hosts, args.repeat)))
+        return
+
+    try:
+        sizes = [parse_size(size) for size in args.sizes.split(',')]
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    with open(args.sample, 'r') as f:
+        sample = json.load(f)
+    baselines = load_baselines(args.compare) if args.compare else {}
+    version = analyzer_version(args.analyzer)
+    work_dir = args.keep or tempfile.mkdtemp(prefix='analyzer-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+
+    print(f"Analyzer: {version['analyzer']} ({version['git_commit'] or 'no git'}, sha256 {version['analyzer_sha256']})")
+    try:
+        for size in sizes:
+            snapshot = os.path.join(work_dir, f"synthetic-{format_size(size)}.json")
+            started = time.perf_counter()
+            actual = generate_snapshot(sample, snapshot, size, args.guests, args.disks)
+            print(f"Generated {snapshot} in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+
+            # A fresh interpreter per size keeps peak RSS attributable to that size
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), '--analyzer', args.analyzer,
+                                    '--measure', snapshot, '--hosts', str(args.hosts), '--repeat', str(args.repeat)],
+                                   capture_output=True, text=True)
+            if child.returncode != 0:
+                print(f"Error: Measuring {snapshot} failed:\n{child.stderr}", file=sys.stderr)
+                sys.exit(1)
+            measured = json.loads(child.stdout)
+
+            total_mb = actual * args.hosts / (1024 * 1024)
+            result = {
+                "timestamp": datetime.now(UTC).isoformat().replace('+00:00', 'Z'),
+                **version,
+                "python": platform.python_version(),
+                "params": {"size": size, "guests": args.guests, "disks": args.disks,
+                           "hosts": args.hosts, "repeat": args.repeat},
+                "snapshot_bytes": actual,
+                "stages": {
+                    stage: {"seconds": round(seconds, 6),
+                            "mb_per_s": round(total_mb / seconds, 2) if stage in INPUT_STAGES and seconds > 0 else None}
+                    for stage, seconds in measured['stages'].items()
+                },
+                "rss_after_mb": measured['rss_after_mb'],
+                "peak_rss_mb": measured['peak_rss_mb']
+            }
+            print_result(result, baselines.get(params_key(result)))
+            with open(args.results, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+            if not args.keep:
+                os.remove(snapshot)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"Results appended to {args.results}")
+
+if __name__ == "__main__":
+    main()
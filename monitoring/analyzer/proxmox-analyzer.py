@@ -7,564 +7,748 @@ Runs locally - takes JSON input from data collector script
 """
 
 import json
+import os
 import sys
 import argparse
+import asyncio
+import cProfile
+import glob
+import pstats
 import re
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, UTC
-from typing import Dict, List, Any, Tuple
-from dataclasses import dataclass
-import textwrap
-
-@dataclass
-class HealthIssue:
-    severity: str  # critical, warning, info
-    category: str
-    message: str
-    recommendation: str
-    source_command: str = "unknown"
-    evidence: List[str] = None
-    
-    def __post_init__(self):
-        if self.evidence is None:
-            self.evidence = []
-
-class ProxmoxAnalyzer:
-    def __init__(self, raw_data: Dict[str, Any]):
-        self.raw_data = raw_data
-        self.metadata = raw_data.get('metadata', {})
-        self.outputs = raw_data.get('raw_outputs', {})
-        self.issues: List[HealthIssue] = []
-        
-    def analyze_all(self) -> Dict[str, Any]:
-        """Run all analysis modules and return comprehensive report"""
-        
-        # Run analysis modules
-        system_analysis = self.analyze_system_overview()
-        hardware_analysis = self.analyze_hardware_health()
-        storage_analysis = self.analyze_storage_filesystem()
-        network_analysis = self.analyze_network_diagnostics()
-        virtualization_analysis = self.analyze_proxmox_virtualization()
-        performance_analysis = self.analyze_performance_monitoring()
-        log_analysis = self.analyze_log_analysis()
-        security_analysis = self.analyze_security_updates()
-        
-        # Generate recommendations
-        recommendations = self.generate_recommendations()
-        
-        # Create final report
-        report = {
-            "metadata": {
-                "analyzer_version": "1.0.0",
-                "analysis_timestamp": datetime.now(UTC).isoformat().replace('+00:00', 'Z'),
-                "source_hostname": self.metadata.get('hostname', 'unknown'),
-                "source_timestamp": self.metadata.get('timestamp', 'unknown')
-            },
-            "analysis": {
-                "system_overview": system_analysis,
-                "hardware_health": hardware_analysis,
-                "storage_filesystem": storage_analysis,
-                "network_diagnostics": network_analysis,
-                "proxmox_virtualization": virtualization_analysis,
-                "performance_monitoring": performance_analysis,
-                "log_analysis": log_analysis,
-                "security_updates": security_analysis
-            },
-            "summary": {
-                "total_issues": len(self.issues),
-                "critical_issues": len([i for i in self.issues if i.severity == "critical"]),
-                "warning_issues": len([i for i in self.issues if i.severity == "warning"]),
-                "info_issues": len([i for i in self.issues if i.severity == "info"]),
-                "overall_health": self.calculate_overall_health(),
-                "recommendations": recommendations
-            },
-            "issues": [
-                {
-                    "severity": issue.severity,
-                    "category": issue.category,
-                    "message": issue.message,
-                    "recommendation": issue.recommendation,
-                    "source_command": issue.source_command,
-                    "evidence": issue.evidence
-                }
-                for issue in self.issues
-            ]
-        }
-        
-        return report
-    
-    def analyze_system_overview(self) -> Dict[str, Any]:
-        """Analyze system overview data"""
-        
-        pve_version = self.extract_first_line('pveversion')
-        kernel_info = self.extract_first_line('uname')
-        
-        # Check boot errors
-        boot_errors_output = self.outputs.get('boot_errors', '')
-        boot_errors = self.count_non_header_lines('boot_errors')
-        if boot_errors > 0:
-            evidence = [line.strip() for line in boot_errors_output.split('\n') 
-                       if line.strip() and not line.startswith('===')][:5]  # First 5 lines
-            self.add_issue("warning", "system", 
-                         f"Found {boot_errors} boot errors",
-                         "Review boot logs and investigate error causes",
-                         source_command=self.extract_command('boot_errors'),
-                         evidence=evidence)
-        
-        # Check service status
-        services = {}
-        for service in ['pve_cluster', 'pvedaemon', 'pveproxy', 'pvestatd', 'pve_firewall']:
-            status_output = self.outputs.get(service, '')
-            if 'active (running)' in status_output:
-                services[service] = "running"
-            else:
-                services[service] = "not_running"
-                evidence = [line.strip() for line in status_output.split('\n') if line.strip()][:3]
-                self.add_issue("critical", "services",
-                             f"Service {service} is not running",
-                             f"Investigate and restart {service} service",
-                             source_command=self.extract_command(service),
-                             evidence=evidence)
-        
-        return {
-            "pve_version": pve_version,
-            "kernel_info": kernel_info,
-            "boot_errors_count": boot_errors,
-            "services": services
-        }
-    
-    def analyze_hardware_health(self) -> Dict[str, Any]:
-        """Analyze hardware health data"""
-        
-        # CPU analysis
-        cpu_model = self.extract_value_after_colon('lscpu', 'Model name')
-        cpu_cores = self.extract_value_after_colon('lscpu', 'CPU(s)')
-        
-        # Memory analysis
-        mem_total = self.extract_meminfo_value('MemTotal')
-        mem_available = self.extract_meminfo_value('MemAvailable')
-        
-        if mem_total and mem_available:
-            mem_usage_percent = ((mem_total - mem_available) / mem_total) * 100
-            meminfo_output = self.outputs.get('meminfo', '')
-            mem_evidence = [line.strip() for line in meminfo_output.split('\n') if 'Mem' in line][:5]
-            if mem_usage_percent > 95:
-                self.add_issue("critical", "memory",
-                             f"Memory usage at {mem_usage_percent:.1f}%",
-                             "Investigate high memory usage and consider adding RAM",
-                             source_command=self.extract_command('meminfo'),
-                             evidence=mem_evidence)
-            elif mem_usage_percent > 85:
-                self.add_issue("warning", "memory",
-                             f"Memory usage at {mem_usage_percent:.1f}%",
-                             "Monitor memory usage trends",
-                             source_command=self.extract_command('meminfo'),
-                             evidence=mem_evidence)
-        
-        # Check for memory errors
-        memory_errors_output = self.outputs.get('memory_errors', '')
-        memory_errors = self.count_pattern_matches('memory_errors', r'error|corrupt|fail')
-        if memory_errors > 0:
-            error_lines = [line.strip() for line in memory_errors_output.split('\n') 
-                          if re.search(r'error|corrupt|fail', line, re.IGNORECASE) and line.strip()][:5]
-            self.add_issue("warning", "memory",
-                         f"Found {memory_errors} memory-related errors",
-                         "Check memory hardware and run memory tests",
-                         source_command=self.extract_command('memory_errors'),
-                         evidence=error_lines)
-        
-        # Check memory pressure
-        memory_pressure = self.outputs.get('memory_pressure', '')
-        if 'some' in memory_pressure or 'full' in memory_pressure:
-            pressure_lines = [line.strip() for line in memory_pressure.split('\n') if line.strip()][:3]
-            self.add_issue("warning", "memory",
-                         "Memory pressure detected",
-                         "Monitor memory usage and consider optimization",
-                         source_command=self.extract_command('memory_pressure'),
-                         evidence=pressure_lines)
-        
-        return {
-            "cpu": {
-                "model": cpu_model,
-                "cores": cpu_cores
-            },
-            "memory": {
-                "total_kb": mem_total,
-                "available_kb": mem_available,
-                "usage_percent": round(mem_usage_percent, 1) if mem_total and mem_available else 0,
-                "errors_detected": memory_errors > 0
-            }
-        }
-    
-    def analyze_storage_filesystem(self) -> Dict[str, Any]:
-        """Analyze storage and filesystem data"""
-        
-        # Check for EFI corruption (critical issue from original report)
-        fsck_logs = self.outputs.get('fsck_logs', '')
-        efi_corruption_patterns = [
-            r'dirty.*corrupt',
-            r'boot.*sector.*backup',
-            r'Filesystem was changed',
-            r'not properly unmounted'
-        ]
-        
-        efi_issues = 0
-        efi_evidence_lines = []
-        for pattern in efi_corruption_patterns:
-            matches = re.findall(f".*{pattern}.*", fsck_logs, re.IGNORECASE)
-            efi_issues += len(matches)
-            efi_evidence_lines.extend([m.strip() for m in matches])
-        
-        if efi_issues > 0:
-            self.add_issue("critical", "storage",
-                         "EFI boot partition corruption detected",
-                         "Investigate improper shutdowns and repair EFI partition",
-                         source_command=self.extract_command('fsck_logs'),
-                         evidence=efi_evidence_lines[:5])
-        
-        # Check storage errors
-        storage_errors_output = self.outputs.get('storage_errors', '')
-        storage_errors = self.count_non_header_lines('storage_errors')
-        if storage_errors > 0:
-            error_evidence = [line.strip() for line in storage_errors_output.split('\n') 
-                             if line.strip() and not line.startswith('===')][:5]
-            self.add_issue("warning", "storage",
-                         f"Found {storage_errors} storage-related errors",
-                         "Check SMART data and hardware connections",
-                         source_command=self.extract_command('storage_errors'),
-                         evidence=error_evidence)
-        
-        # Check disk usage
-        df_output = self.outputs.get('df_h', '')
-        high_usage_filesystems = []
-        for line in df_output.split('\n'):
-            if '%' in line and not line.startswith('==='):
-                parts = line.split()
-                if len(parts) >= 5:
-                    try:
-                        usage_str = parts[4].rstrip('%')
-                        usage = int(usage_str)
-                        filesystem = parts[5] if len(parts) > 5 else parts[0]
-                        
-                        if usage > 95:
-                            high_usage_filesystems.append((filesystem, usage))
-                            self.add_issue("critical", "storage",
-                                         f"Filesystem {filesystem} at {usage}% capacity",
-                                         f"Free up space on {filesystem} immediately",
-                                         source_command=self.extract_command('df_h'),
-                                         evidence=[line.strip()])
-                        elif usage > 85:
-                            high_usage_filesystems.append((filesystem, usage))
-                            self.add_issue("warning", "storage",
-                                         f"Filesystem {filesystem} at {usage}% capacity",
-                                         f"Monitor and plan cleanup for {filesystem}",
-                                         source_command=self.extract_command('df_h'),
-                                         evidence=[line.strip()])
-                    except (ValueError, IndexError):
-                        continue
-        
-        return {
-            "efi_corruption_detected": efi_issues > 0,
-            "storage_errors_count": storage_errors,
-            "high_usage_filesystems": high_usage_filesystems,
-            "zfs_available": 'zpool_status' in self.outputs,
-            "lvm_available": 'pvs' in self.outputs
-        }
-    
-    def analyze_network_diagnostics(self) -> Dict[str, Any]:
-        """Analyze network diagnostics data"""
-        
-        # Check connectivity
-        ping_output = self.outputs.get('ping_test', '')
-        ping_success = '0% packet loss' in ping_output
-        
-        if not ping_success:
-            ping_evidence = [line.strip() for line in ping_output.split('\n') if line.strip()][-3:]
-            self.add_issue("warning", "network",
-                         "Internet connectivity test failed",
-                         "Check network configuration and routing",
-                         source_command=self.extract_command('ping_test'),
-                         evidence=ping_evidence)
-        
-        # Check DNS
-        dns_output = self.outputs.get('dns_test', '')
-        dns_success = 'Address:' in dns_output
-        
-        if not dns_success:
-            dns_evidence = [line.strip() for line in dns_output.split('\n') if line.strip()]
-            self.add_issue("warning", "network",
-                         "DNS resolution test failed",
-                         "Check DNS configuration in /etc/resolv.conf",
-                         source_command=self.extract_command('dns_test'),
-                         evidence=dns_evidence)
-        
-        # Count network interfaces
-        ip_addr = self.outputs.get('ip_addr', '')
-        interface_count = len(re.findall(r'inet \d+\.\d+\.\d+\.\d+', ip_addr))
-        
-        return {
-            "ping_test_success": ping_success,
-            "dns_test_success": dns_success,
-            "interface_count": interface_count
-        }
-    
-    def analyze_proxmox_virtualization(self) -> Dict[str, Any]:
-        """Analyze Proxmox virtualization data"""
-        
-        # Count VMs and containers
-        vm_count = 0
-        container_count = 0
-        
-        qm_list = self.outputs.get('qm_list', '')
-        if qm_list:
-            vm_count = len([line for line in qm_list.split('\n') 
-                           if 'running' in line or 'stopped' in line])
-        
-        pct_list = self.outputs.get('pct_list', '')
-        if pct_list:
-            container_count = len([line for line in pct_list.split('\n') 
-                                 if 'running' in line or 'stopped' in line])
-        
-        return {
-            "vm_count": vm_count,
-            "container_count": container_count,
-            "cluster_available": 'pvecm_status' in self.outputs
-        }
-    
-    def analyze_performance_monitoring(self) -> Dict[str, Any]:
-        """Analyze performance monitoring data"""
-        
-        # Load average analysis
-        loadavg = self.outputs.get('loadavg', '')
-        load_1min = 0.0
-        
-        if loadavg:
-            try:
-                load_1min = float(loadavg.split()[0])
-                load_evidence = [loadavg.strip()]
-                if load_1min > 8.0:
-                    self.add_issue("critical", "performance",
-                                 f"High system load: {load_1min}",
-                                 "Investigate high CPU usage and resource contention",
-                                 source_command=self.extract_command('loadavg'),
-                                 evidence=load_evidence)
-                elif load_1min > 4.0:
-                    self.add_issue("warning", "performance",
-                                 f"Elevated system load: {load_1min}",
-                                 "Monitor system load trends",
-                                 source_command=self.extract_command('loadavg'),
-                                 evidence=load_evidence)
-            except (ValueError, IndexError):
-                pass
-        
-        # Uptime analysis
-        uptime_output = self.outputs.get('uptime', '')
-        uptime_days = 0
-        if 'days' in uptime_output:
-            try:
-                uptime_days = int(re.search(r'(\d+) days', uptime_output).group(1))
-            except (AttributeError, ValueError):
-                pass
-        
-        return {
-            "load_average_1min": load_1min,
-            "uptime_days": uptime_days
-        }
-    
-    def analyze_log_analysis(self) -> Dict[str, Any]:
-        """Analyze log data"""
-        
-        recent_errors_output = self.outputs.get('recent_errors', '')
-        recent_errors = self.count_non_header_lines('recent_errors')
-        boot_issues = self.count_non_header_lines('boot_issues')
-        kernel_issues = self.count_non_header_lines('kernel_issues')
-        
-        if recent_errors > 10:
-            error_evidence = [line.strip() for line in recent_errors_output.split('\n') 
-                             if line.strip() and not line.startswith('===')][:5]
-            self.add_issue("warning", "logs",
-                         f"High number of recent errors: {recent_errors}",
-                         "Review system logs for recurring issues",
-                         source_command=self.extract_command('recent_errors'),
-                         evidence=error_evidence)
-        
-        return {
-            "recent_errors_count": recent_errors,
-            "boot_issues_count": boot_issues,
-            "kernel_issues_count": kernel_issues
-        }
-    
-    def analyze_security_updates(self) -> Dict[str, Any]:
-        """Analyze security and updates data"""
-        
-        # Count available updates
-        upgradable = self.count_non_header_lines('apt_upgradable')
-        security_updates_output = self.outputs.get('security_updates', '')
-        security_updates = self.count_non_header_lines('security_updates')
-        
-        if security_updates > 0:
-            sec_evidence = [line.strip() for line in security_updates_output.split('\n') 
-                           if line.strip() and not line.startswith('===')][:5]
-            self.add_issue("warning", "security",
-                         f"{security_updates} security updates available",
-                         "Apply security updates as soon as possible",
-                         source_command=self.extract_command('security_updates'),
-                         evidence=sec_evidence)
-        
-        if upgradable > 20:
-            upgradable_output = self.outputs.get('apt_upgradable', '')
-            upgrade_evidence = [line.strip() for line in upgradable_output.split('\n') 
-                               if line.strip() and not line.startswith('===')][:5]
-            self.add_issue("info", "maintenance",
-                         f"{upgradable} packages can be upgraded",
-                         "Schedule maintenance window for system updates",
-                         source_command=self.extract_command('apt_upgradable'),
-                         evidence=upgrade_evidence)
-        
-        # Check certificate validity
-        cert_check = self.outputs.get('cert_check', '')
-        cert_valid = 'Certificate will not expire' in cert_check
-        
-        if not cert_valid:
-            cert_evidence = [line.strip() for line in cert_check.split('\n') if line.strip()][:3]
-            self.add_issue("warning", "security",
-                         "SSL certificate may be expiring soon",
-                         "Check certificate expiration and renew if needed",
-                         source_command=self.extract_command('cert_check'),
-                         evidence=cert_evidence)
-        
-        # Check failed logins
-        failed_logins_output = self.outputs.get('failed_logins', '')
-        failed_logins = self.count_non_header_lines('failed_logins')
-        if failed_logins > 10:
-            login_evidence = [line.strip() for line in failed_logins_output.split('\n') 
-                             if line.strip() and not line.startswith('===')][:5]
-            self.add_issue("warning", "security",
-                         f"High number of failed logins: {failed_logins}",
-                         "Review security logs and consider fail2ban",
-                         source_command=self.extract_command('failed_logins'),
-                         evidence=login_evidence)
-        
-        return {
-            "upgradable_packages": upgradable,
-            "security_updates": security_updates,
-            "certificate_valid": cert_valid,
-            "failed_logins_count": failed_logins
-        }
-    
-    def generate_recommendations(self) -> List[str]:
-        """Generate prioritized recommendations based on issues found"""
-        
-        recommendations = []
-        
-        # Critical issues first
-        critical_issues = [i for i in self.issues if i.severity == "critical"]
-        if critical_issues:
-            recommendations.append("CRITICAL: Address the following issues immediately:")
-            for issue in critical_issues[:5]:  # Top 5 critical
-                recommendations.append(f"  - {issue.recommendation}")
-        
-        # Warning issues
-        warning_issues = [i for i in self.issues if i.severity == "warning"]
-        if warning_issues:
-            recommendations.append("WARNING: Address these issues during next maintenance:")
-            for issue in warning_issues[:5]:  # Top 5 warnings
-                recommendations.append(f"  - {issue.recommendation}")
-        
-        # General recommendations
-        if not critical_issues and not warning_issues:
-            recommendations.append("System appears healthy - continue regular monitoring")
-        
-        return recommendations
-    
-    def calculate_overall_health(self) -> str:
-        """Calculate overall system health status"""
-        
-        critical_count = len([i for i in self.issues if i.severity == "critical"])
-        warning_count = len([i for i in self.issues if i.severity == "warning"])
-        
-        if critical_count > 0:
-            return "critical"
-        elif warning_count > 3:
-            return "degraded"
-        elif warning_count > 0:
-            return "warning"
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from proxmox_snapshot import (
+    CONTAINER_SUFFIX, convert_snapshot_file, expand_snapshot_paths, load_snapshot, parse_timestamp,
+    snapshot_base_path
+)
+from proxmox_analyzer import (
+    AGGREGATE_WINDOWS, ANALYSIS_MODULES, AnalysisProfiler, ClusterAnalyzer, DEFAULT_RULES_PATH,
+    MODULE_ALIASES, MetricStore, PARSE_CACHE_MAX_BYTES, ParseCache, ProxmoxAnalyzer, RuleSet, diff_snapshots,
+    generate_markdown_cluster, generate_markdown_diff, generate_markdown_report, load_rules, module_outputs,
+    print_profile, select_modules
+)
+from proxmox_index import IssueIndex, SEARCH_LIMIT, expand_report_paths, search_query
+from proxmox_workers import (
+    analyze_cluster_node, analyze_snapshot_file, close_worker_parse_cache, init_batch_worker, init_watch_worker,
+    read_snapshot_identity
+)
+from proxmox_watch import InboxWatcher, WATCH_DEBOUNCE_SECONDS, WATCH_POLL_INTERVAL
+from proxmox_collect import (
+    COLLECT_CONCURRENCY, COLLECT_TIMEOUT_SECONDS, CollectionOrchestrator, DEFAULT_COLLECTOR_PATH,
+    LocalTransport, SSHTransport, SSH_CONTROL_PERSIST
+)
+
+def batch_main(argv: List[str]):
+    """Analyze many snapshots across a process pool and stream NDJSON results"""
+    parser = argparse.ArgumentParser(prog='proxmox-analyzer.py batch',
+                                     description='Analyze many Proxmox health check snapshots')
+    parser.add_argument('inputs', nargs='+', help='Snapshot files, directories or glob patterns')
+    parser.add_argument('--output-file', help='NDJSON output file (default: stdout)')
+    parser.add_argument('--errors-file', help='Write a JSON report of failed files')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--history-dir', help='Record each report\'s metrics in this metric history store')
+    add_index_argument(parser)
+    add_module_arguments(parser)
+    add_rules_argument(parser)
+    add_parse_cache_arguments(parser)
+    add_profile_arguments(parser)
+
+    args = parser.parse_args(argv)
+    modules = select_modules_or_exit(args)
+    history = MetricStore(args.history_dir) if args.history_dir else None
+    index = IssueIndex(args.index_db) if args.index_db else None
+    parse_cache_size = args.parse_cache_size * 1024 * 1024
+    # Fail on a broken rule file before starting any workers
+    load_rules_or_exit(args.rules)
+    if args.profile == 'cprofile':
+        # Leftover per-worker stats of an interrupted run would be merged in
+        for part in glob.glob(glob.escape(args.profile_output) + '.[0-9]*'):
+            os.remove(part)
+
+    paths = expand_snapshot_paths(args.inputs)
+    if not paths:
+        print("Error: No snapshot files matched the given inputs", file=sys.stderr)
+        sys.exit(1)
+
+    workers = max(1, min(args.workers, len(paths)))
+    # Batch several files per task so IPC overhead stays small on large archives
+    chunksize = max(1, min(16, len(paths) // (workers * 4)))
+
+    errors = []
+    cache_stats = {"hits": 0, "misses": 0}
+    out = open(args.output_file, 'w') if args.output_file else sys.stdout
+    try:
+        if workers == 1:
+            init_batch_worker(args.parse_cache, parse_cache_size, args.rules,
+                              args.profile, args.profile_output, args.history_dir, modules)
+            results = map(analyze_snapshot_file, paths)
+            executor = None
         else:
-            return "healthy"
-    
-    # Utility methods
-    def add_issue(self, severity: str, category: str, message: str, recommendation: str, 
-                  source_command: str = "unknown", evidence: List[str] = None):
-        """Add an issue to the issues list"""
-        self.issues.append(HealthIssue(severity, category, message, recommendation, source_command, evidence or []))
-    
-    def extract_first_line(self, output_key: str) -> str:
-        """Extract first non-header line from output"""
-        output = self.outputs.get(output_key, '')
-        for line in output.split('\n'):
-            if not line.startswith('===') and line.strip():
-                return line.strip()
-        return "unknown"
-    
-    def extract_value_after_colon(self, output_key: str, search_term: str) -> str:
-        """Extract value after colon for a given search term"""
-        output = self.outputs.get(output_key, '')
-        for line in output.split('\n'):
-            if search_term in line and ':' in line:
-                return line.split(':', 1)[1].strip()
-        return "unknown"
-    
-    def extract_meminfo_value(self, key: str) -> int:
-        """Extract memory value from meminfo output"""
-        meminfo = self.outputs.get('meminfo', '')
-        for line in meminfo.split('\n'):
-            if line.startswith(key):
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker,
+                                           initargs=(args.parse_cache, parse_cache_size, args.rules,
+                                                     args.profile, args.profile_output, args.history_dir,
+                                                     modules))
+            # map() yields in submission order, so output is deterministic
+            results = executor.map(analyze_snapshot_file, paths, chunksize=chunksize)
+        for path, ok, line, stats in results:
+            cache_stats["hits"] += stats["hits"]
+            cache_stats["misses"] += stats["misses"]
+            out.write(line + '\n')
+            if not ok:
+                errors.append(json.loads(line))
+            elif history is not None or index is not None:
+                # Ingest in the parent so each host file and the index have a single writer
+                report = json.loads(line)['report']
+                if history is not None:
+                    history.ingest_report(report)
+                if index is not None:
+                    index.add_report(report, os.path.abspath(path))
+        if executor:
+            executor.shutdown()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if index is not None:
+            index.close()
+
+    print(f"Analyzed {len(paths) - len(errors)}/{len(paths)} snapshots "
+          f"({len(errors)} failed, {workers} workers)", file=sys.stderr)
+    if args.parse_cache:
+        # Workers only flush; eviction runs once here
+        if not close_worker_parse_cache():
+            ParseCache(args.parse_cache, parse_cache_size).close()
+        print_cache_stats(cache_stats)
+    for error in errors:
+        print(f"  {error['file']}: {error['error']}", file=sys.stderr)
+    if args.profile == 'cprofile':
+        merge_cprofile_stats(args.profile_output)
+
+    if args.errors_file:
+        with open(args.errors_file, 'w') as f:
+            json.dump({"total_files": len(paths), "failed_files": len(errors), "errors": errors}, f, indent=2)
+
+    sys.exit(1 if errors else 0)
+
+def parse_module_list(value: str) -> List[str]:
+    """Comma-separated analysis modules, by section or short name"""
+    modules = []
+    for name in filter(None, (part.strip() for part in value.split(','))):
+        module = MODULE_ALIASES.get(name, name)
+        if module not in ANALYSIS_MODULES:
+            raise argparse.ArgumentTypeError(f"unknown module {name!r} (choose from {', '.join(MODULE_ALIASES)})")
+        modules.append(module)
+    return modules
+
+def add_module_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--only', type=parse_module_list, metavar='MODULES',
+                        help=f"Run only these analysis modules, comma-separated ({', '.join(MODULE_ALIASES)}); "
+                             f"outputs no selected module needs are not loaded")
+    parser.add_argument('--skip', type=parse_module_list, metavar='MODULES',
+                        help='Skip these analysis modules')
+
+def select_modules_or_exit(args: argparse.Namespace) -> Optional[List[str]]:
+    """Modules selected by --only/--skip, or None for all of them"""
+    if args.only is None and args.skip is None:
+        return None
+    modules = select_modules(args.only, args.skip)
+    if not modules:
+        print("Error: --only/--skip leave no analysis modules to run", file=sys.stderr)
+        sys.exit(1)
+    return modules
+
+def add_rules_argument(parser: argparse.ArgumentParser):
+    parser.add_argument('--rules', metavar='PATH',
+                        help='Rule file (TOML, or YAML with PyYAML installed; default: rules.toml)')
+
+def load_rules_or_exit(path: Optional[str]) -> RuleSet:
+    try:
+        return load_rules(path)
+    except OSError as e:
+        print(f"Error: Cannot read rule file: {e}", file=sys.stderr)
+    except ValueError as e:
+        print(f"Error: Invalid rule file: {e}", file=sys.stderr)
+    sys.exit(1)
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--profile', nargs='?', const='basic', choices=['basic', 'cprofile'],
+                        help='Time every analysis module and record the results in metadata.profile; '
+                             '--profile=cprofile also writes cProfile stats')
+    parser.add_argument('--profile-output', metavar='PATH', default='proxmox-analyzer.pstats',
+                        help='pstats file for --profile=cprofile (default: %(default)s)')
+
+def merge_cprofile_stats(path: str):
+    """Combine the per-worker stats files into one and print the top functions"""
+    parts = sorted(glob.glob(glob.escape(path) + '.[0-9]*'))
+    if not parts:
+        return
+    stats = pstats.Stats(*parts, stream=sys.stderr)
+    stats.dump_stats(path)
+    for part in parts:
+        os.remove(part)
+    stats.sort_stats('cumulative').print_stats(25)
+    print(f"cProfile stats saved to: {path} (python3 -m pstats {path})", file=sys.stderr)
+
+def add_parse_cache_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--parse-cache', metavar='PATH',
+                        help='Persistent parse cache file; unchanged outputs are not re-parsed')
+    parser.add_argument('--parse-cache-size', type=int, metavar='MB',
+                        default=PARSE_CACHE_MAX_BYTES // (1024 * 1024),
+                        help='Evict least recently used parse results beyond this size (default: %(default)s)')
+
+def add_index_argument(parser: argparse.ArgumentParser):
+    parser.add_argument('--index-db', help='Issue index database: record every report\'s issues for search')
+
+def print_cache_stats(stats: Dict[str, int]):
+    total = stats["hits"] + stats["misses"]
+    rate = stats["hits"] / total * 100 if total else 0.0
+    print(f"Parse cache: {stats['hits']} hits, {stats['misses']} misses ({rate:.1f}% hit rate)",
+          file=sys.stderr)
+
+def parse_time_arg(value: str) -> int:
+    """Parse a --since/--until value: ISO date/time or relative like 30d, 12h"""
+    match = re.fullmatch(r'(\d+)([hdw])', value)
+    if match:
+        seconds = int(match.group(1)) * {'h': 3600, 'd': 86400, 'w': 7 * 86400}[match.group(2)]
+        return int(datetime.now(UTC).timestamp()) - seconds
+    timestamp = parse_timestamp(value)
+    if timestamp is None:
+        raise argparse.ArgumentTypeError(f"invalid time: {value}")
+    return timestamp
+
+def history_main(argv: List[str]):
+    """Query the metric history store"""
+    parser = argparse.ArgumentParser(prog='proxmox-analyzer.py history',
+                                     description='Query recorded analyzer metrics')
+    parser.add_argument('--history-dir', required=True, help='Metric history store directory')
+    parser.add_argument('host', nargs='?', help='Host to query (lists hosts if omitted)')
+    parser.add_argument('metric', nargs='?', help='Metric to query (lists metrics if omitted)')
+    parser.add_argument('--since', type=parse_time_arg, help='Start time (ISO timestamp or e.g. 30d)')
+    parser.add_argument('--until', type=parse_time_arg, help='End time (ISO timestamp or e.g. 1d)')
+    parser.add_argument('--window', choices=sorted(AGGREGATE_WINDOWS),
+                        help='Aggregate samples per window instead of listing them')
+
+    args = parser.parse_args(argv)
+    store = MetricStore(args.history_dir)
+
+    if not args.host:
+        result: Any = store.hosts()
+    elif not args.metric:
+        result = store.metrics(args.host)
+    elif args.window:
+        result = store.aggregate(args.host, args.metric, AGGREGATE_WINDOWS[args.window],
+                                 args.since, args.until)
+    else:
+        result = [
+            {"timestamp": datetime.fromtimestamp(ts, UTC).isoformat().replace('+00:00', 'Z'), "value": value}
+            for ts, value in store.query(args.host, args.metric, args.since, args.until)
+        ]
+    print(json.dumps(result, indent=2))
+
+def search_main(argv: List[str]):
+    """Full-text search over the issues of indexed reports"""
+    parser = argparse.ArgumentParser(prog='proxmox-analyzer.py search',
+                                     description='Search the issues and evidence of analyzed snapshots')
+    parser.add_argument('--index-db', required=True, help='Issue index database')
+    parser.add_argument('query', nargs='?',
+                        help="Words to find in messages, recommendations, commands and evidence, "
+                             "e.g. 'EXT4-fs error', 'pvestatd OR pveproxy', 'fail*'")
+    parser.add_argument('--add', nargs='+', metavar='PATH',
+                        help='Index report files (*.report.json, batch NDJSON output), directories or '
+                             'globs first; files unchanged since they were indexed are skipped')
+    parser.add_argument('--raw', action='store_true', help='Pass the query to FTS5 unchanged')
+    parser.add_argument('--host', action='append', help='Only this host (repeatable)')
+    parser.add_argument('--severity', action='append', choices=['critical', 'warning', 'info'],
+                        help='Only this severity (repeatable)')
+    parser.add_argument('--category', action='append', help='Only this category (repeatable)')
+    parser.add_argument('--since', type=parse_time_arg, help='Start time (ISO timestamp or e.g. 30d)')
+    parser.add_argument('--until', type=parse_time_arg, help='End time (ISO timestamp or e.g. 1d)')
+    parser.add_argument('--limit', type=int, default=SEARCH_LIMIT,
+                        help='Maximum number of issues (default: %(default)s)')
+    parser.add_argument('--oldest', action='store_true', help='Oldest snapshots first')
+    parser.add_argument('--hosts', action='store_true',
+                        help='Per host: first and last snapshot with a match and the number of snapshots')
+    parser.add_argument('--format', choices=['text', 'json'], default='text',
+                        help='Output format (default: text)')
+
+    args = parser.parse_args(argv)
+    index = IssueIndex(args.index_db)
+    try:
+        if args.add:
+            paths = expand_report_paths(args.add)
+            indexed = unchanged = 0
+            for path in paths:
                 try:
-                    return int(line.split()[1])
-                except (IndexError, ValueError):
-                    pass
-        return 0
-    
-    def count_non_header_lines(self, output_key: str) -> int:
-        """Count non-header lines in output"""
-        output = self.outputs.get(output_key, '')
-        return len([line for line in output.split('\n') 
-                   if line.strip() and not line.startswith('===')])
-    
-    def count_pattern_matches(self, output_key: str, pattern: str) -> int:
-        """Count regex pattern matches in output"""
-        output = self.outputs.get(output_key, '')
-        return len(re.findall(pattern, output, re.IGNORECASE))
-    
-    def extract_command(self, output_key: str) -> str:
-        """Extract the actual command from the output header"""
-        output = self.outputs.get(output_key, '')
-        match = re.search(r'=== Command: (.+?) ===', output)
-        if match:
-            return match.group(1)
-        return output_key  # Fallback to the key name
+                    count = index.add_file(path)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Skipping {path}: {type(e).__name__}: {e}", file=sys.stderr)
+                    continue
+                if count is None:
+                    unchanged += 1
+                else:
+                    indexed += count
+            stats = index.stats()
+            print(f"Indexed {indexed} snapshots from {len(paths) - unchanged} files ({unchanged} unchanged); "
+                  f"index: {stats['snapshots']} snapshots of {stats['hosts']} hosts, {stats['issues']} issues",
+                  file=sys.stderr)
+
+        filters = dict(hosts=args.host, severities=args.severity, categories=args.category,
+                       since=args.since, until=args.until)
+        if not (args.query or args.hosts or any(value is not None for value in filters.values())):
+            if not args.add:
+                print(json.dumps(index.stats(), indent=2))
+            return
+        query = args.query if args.raw or not args.query else search_query(args.query)
+        try:
+            if args.hosts:
+                results = index.search_hosts(query, **filters)
+            else:
+                results = index.search(query, limit=args.limit, oldest_first=args.oldest, **filters)
+        except sqlite3.OperationalError as e:
+            print(f"Error: Invalid search query: {e}", file=sys.stderr)
+            sys.exit(1)
+    finally:
+        index.close()
+
+    if args.format == 'json':
+        print(json.dumps(results, indent=2))
+    elif args.hosts:
+        for result in results:
+            print(f"{result['host']}: first {result['first_seen']}, last {result['last_seen']} "
+                  f"({result['snapshots']} snapshots, {result['issues']} issues)")
+    else:
+        for result in results:
+            print(f"{result['timestamp']} {result['host']} [{result['severity']}] "
+                  f"{result['category']}: {result['message']}")
+            if 'evidence_match' in result:
+                print(f"    {result['evidence_match']}")
+
+def diff_main(argv: List[str]):
+    """Compare two snapshots, or every same-named snapshot in two directories"""
+    parser = argparse.ArgumentParser(prog='proxmox-analyzer.py diff',
+                                     description='Compare two Proxmox health check snapshots')
+    parser.add_argument('before', help='Earlier snapshot (or directory of snapshots)')
+    parser.add_argument('after', help='Later snapshot (or directory of snapshots)')
+    parser.add_argument('--output-file', help='Output file for the diff')
+    parser.add_argument('--format', choices=['json', 'markdown'], default='json',
+                        help='Output format (default: json; directory pairs are written as NDJSON)')
+    parser.add_argument('--context', type=int, default=3, help='Context lines in raw output diffs')
+    parser.add_argument('--no-raw', action='store_true', help='Skip line diffs of raw outputs')
+    add_rules_argument(parser)
+    add_parse_cache_arguments(parser)
+
+    args = parser.parse_args(argv)
+    rules = load_rules_or_exit(args.rules)
+    parse_cache = ParseCache(args.parse_cache, args.parse_cache_size * 1024 * 1024) if args.parse_cache else None
+
+    if os.path.isdir(args.before) and os.path.isdir(args.after):
+        before_files = {os.path.relpath(p, args.before) for p in expand_snapshot_paths([args.before])}
+        after_files = {os.path.relpath(p, args.after) for p in expand_snapshot_paths([args.after])}
+        pairs = [(os.path.join(args.before, name), os.path.join(args.after, name))
+                 for name in sorted(before_files & after_files)]
+        for name in sorted(before_files ^ after_files):
+            print(f"Skipping {name}: only present in one directory", file=sys.stderr)
+    else:
+        pairs = [(args.before, args.after)]
+
+    out = open(args.output_file, 'w') if args.output_file else sys.stdout
+    try:
+        for before_path, after_path in pairs:
+            try:
+                result = diff_snapshots(load_snapshot(before_path), load_snapshot(after_path),
+                                        context=args.context, include_raw=not args.no_raw,
+                                        parse_cache=parse_cache, rules=rules)
+            except (OSError, ValueError) as e:
+                print(f"Error: Cannot compare {before_path} and {after_path}: {e}", file=sys.stderr)
+                if len(pairs) == 1:
+                    sys.exit(1)
+                continue
+            result["metadata"]["before_file"] = before_path
+            result["metadata"]["after_file"] = after_path
+            if args.format == 'markdown':
+                out.write(generate_markdown_diff(result) + '\n')
+            elif len(pairs) > 1:
+                out.write(json.dumps(result, separators=(',', ':')) + '\n')
+            else:
+                out.write(json.dumps(result, indent=2) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if parse_cache is not None:
+            parse_cache.close()
+
+def cluster_main(argv: List[str]):
+    """Join the latest snapshot of every node into one cluster report"""
+    parser = argparse.ArgumentParser(prog='proxmox-analyzer.py cluster',
+                                     description='Analyze the latest snapshot of every Proxmox node as a cluster')
+    parser.add_argument('inputs', nargs='+',
+                        help='Snapshot files, directories or glob patterns; the newest snapshot per host is used')
+    parser.add_argument('--output-file', help='Output file for the cluster report')
+    parser.add_argument('--format', choices=['json', 'markdown'], default='json',
+                        help='Output format (default: json)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    add_rules_argument(parser)
+    add_parse_cache_arguments(parser)
+
+    args = parser.parse_args(argv)
+    rules = load_rules_or_exit(args.rules)
+    parse_cache_size = args.parse_cache_size * 1024 * 1024
+
+    paths = expand_snapshot_paths(args.inputs)
+    if not paths:
+        print("Error: No snapshot files matched the given inputs", file=sys.stderr)
+        sys.exit(1)
+
+    workers = max(1, min(args.workers, len(paths)))
+    executor = None
+    if workers == 1:
+        init_batch_worker(args.parse_cache, parse_cache_size, args.rules)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker,
+                                       initargs=(args.parse_cache, parse_cache_size, args.rules))
+
+    def run(function: Callable, items: List[str]) -> Iterator:
+        if executor is None:
+            return map(function, items)
+        return executor.map(function, items, chunksize=max(1, min(16, len(items) // (workers * 4))))
+
+    errors = []
+    nodes = []
+    try:
+        # Only metadata is read to find each host's newest snapshot; just those are analyzed
+        latest: Dict[str, Tuple[int, str]] = {}
+        for path, host, timestamp, error in run(read_snapshot_identity, paths):
+            if error:
+                errors.append((path, error))
+            elif host not in latest or (timestamp, path) > latest[host]:
+                latest[host] = (timestamp, path)
+        for path, node, error in run(analyze_cluster_node, [path for _, path in latest.values()]):
+            if error:
+                errors.append((path, error))
+            else:
+                nodes.append(node)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    print(f"Cluster view of {len(nodes)} hosts from {len(paths)} snapshots "
+          f"({len(errors)} failed, {workers} workers)", file=sys.stderr)
+    for path, error in errors:
+        print(f"  {path}: {error}", file=sys.stderr)
+    if args.parse_cache:
+        if not close_worker_parse_cache():
+            ParseCache(args.parse_cache, parse_cache_size).close()
+    if not nodes:
+        print("Error: No snapshot could be analyzed", file=sys.stderr)
+        sys.exit(1)
+
+    report = ClusterAnalyzer(nodes, rules).analyze()
+    if args.format == 'markdown':
+        output = generate_markdown_cluster(report)
+    else:
+        output = json.dumps(report, indent=2)
+    if args.output_file:
+        with open(args.output_file, 'w') as f:
+            f.write(output)
+        print(f"Cluster report saved to: {args.output_file}", file=sys.stderr)
+    else:
+        print(output)
+    sys.exit(1 if errors else 0)
+
+def convert_main(argv: List[str]):
+    """Convert snapshots between JSON (plain or compressed) and the container format"""
+    parser = argparse.ArgumentParser(prog='proxmox-analyzer.py convert',
+                                     description='Convert Proxmox health check snapshots')
+    parser.add_argument('inputs', nargs='+', help='Snapshot files, directories or glob patterns')
+    parser.add_argument('--to', choices=['container', 'json'], default='container',
+                        help=f'Target format (default: container, written as *{CONTAINER_SUFFIX})')
+    parser.add_argument('--codec', choices=['zlib', 'gzip', 'zstd', 'none'], default='zlib',
+                        help='Per-output compression of containers (default: zlib)')
+    parser.add_argument('--level', type=int, help='Compression level (default: the codec\'s own)')
+    parser.add_argument('--output-dir', help='Write converted files here (default: next to each input)')
+    parser.add_argument('--delete', action='store_true', help='Remove each input once it is converted')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+
+    args = parser.parse_args(argv)
+    if args.codec == 'zstd' and zstandard is None:
+        print("Error: --codec zstd requires the zstandard package (pip install zstandard)", file=sys.stderr)
+        sys.exit(1)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    suffix = CONTAINER_SUFFIX if args.to == 'container' else '.json'
+    jobs = []
+    for path in expand_snapshot_paths(args.inputs):
+        if path.endswith(suffix):
+            print(f"Skipping {path}: already in {args.to} format", file=sys.stderr)
+            continue
+        target = snapshot_base_path(path) + suffix
+        if args.output_dir:
+            target = os.path.join(args.output_dir, os.path.basename(target))
+        jobs.append((path, target))
+    if not jobs:
+        print("Error: No snapshot files to convert", file=sys.stderr)
+        sys.exit(1)
+
+    workers = max(1, min(args.workers, len(jobs)))
+    paths, targets = zip(*jobs)
+    options = [[args.to] * len(jobs), [args.codec] * len(jobs), [args.level] * len(jobs)]
+    if workers == 1:
+        results = map(convert_snapshot_file, paths, targets, *options)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(convert_snapshot_file, paths, targets, *options)
+
+    failed = 0
+    total_before = total_after = 0
+    for (path, error, before, after), target in zip(results, targets):
+        if error:
+            failed += 1
+            print(f"  {path}: {error}", file=sys.stderr)
+            continue
+        total_before += before
+        total_after += after
+        print(f"{path} -> {target} ({before} -> {after} bytes)", file=sys.stderr)
+        if args.delete and os.path.abspath(path) != os.path.abspath(target):
+            os.remove(path)
+    if executor:
+        executor.shutdown()
+
+    print(f"Converted {len(jobs) - failed}/{len(jobs)} snapshots "
+          f"({total_before} -> {total_after} bytes, {failed} failed)", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+def parse_listen_address(value: str) -> Tuple[str, int]:
+    """HOST:PORT or PORT (binds to localhost)"""
+    host, _, port = value.rpartition(':')
+    if not port.isdigit():
+        raise argparse.ArgumentTypeError(f"invalid listen address: {value}")
+    return host.strip('[]') or '127.0.0.1', int(port)
+
+def watch_main(argv: List[str]):
+    """Run as a daemon that analyzes snapshots dropped into an inbox directory"""
+    parser = argparse.ArgumentParser(prog='proxmox-analyzer.py watch',
+                                     description='Analyze snapshots as they arrive in an inbox directory')
+    parser.add_argument('inbox', help='Directory the collectors copy snapshots into')
+    parser.add_argument('--format', choices=['json', 'markdown', 'both'], default='both',
+                        help='Reports written next to each snapshot (default: both)')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help='Number of worker processes (default: CPU count, at most 4)')
+    parser.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE_SECONDS,
+                        help='Seconds without writes before a file written in place is analyzed '
+                             '(default: %(default)s)')
+    parser.add_argument('--poll', action='store_true', help='Poll the inbox instead of using inotify')
+    parser.add_argument('--poll-interval', type=float, default=WATCH_POLL_INTERVAL,
+                        help='Polling interval in seconds (default: %(default)s)')
+    parser.add_argument('--history-dir',
+                        help='Metric history store: flag usage trends and record every snapshot')
+    parser.add_argument('--metrics-listen', type=parse_listen_address, metavar='[HOST:]PORT',
+                        help='Serve the latest results per host as Prometheus metrics on /metrics')
+    add_index_argument(parser)
+    add_rules_argument(parser)
+    add_parse_cache_arguments(parser)
+
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.inbox):
+        print(f"Error: Inbox directory '{args.inbox}' not found", file=sys.stderr)
+        sys.exit(1)
+    rules_path = os.path.abspath(args.rules or DEFAULT_RULES_PATH)
+    load_rules_or_exit(rules_path)
+    parse_cache_size = args.parse_cache_size * 1024 * 1024
+    formats = ['json', 'markdown'] if args.format == 'both' else [args.format]
+
+    executor = ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=init_watch_worker,
+                                   initargs=(args.parse_cache, parse_cache_size, rules_path))
+    # Start the workers before the event loop exists so they do not inherit it
+    executor.submit(os.getpid).result()
+    watcher = InboxWatcher(args.inbox, executor, formats, rules_path, history_dir=args.history_dir,
+                           debounce=args.debounce, poll_interval=args.poll_interval,
+                           use_inotify=not args.poll, metrics_listen=args.metrics_listen,
+                           index_db=args.index_db)
+    try:
+        asyncio.run(watcher.run())
+    finally:
+        executor.shutdown()
+
+    print(f"Analyzed {watcher.stats['analyzed']} snapshots ({watcher.stats['failed']} failed)",
+          file=sys.stderr)
+    if args.parse_cache:
+        ParseCache(args.parse_cache, parse_cache_size).close()
+        print_cache_stats(watcher.stats)
+
+def collect_main(argv: List[str]):
+    """Collect fresh snapshots from many nodes over SSH and analyze them"""
+    parser = argparse.ArgumentParser(prog='proxmox-analyzer.py collect', fromfile_prefix_chars='@',
+                                     description='Run the data collector on Proxmox nodes and analyze the snapshots')
+    parser.add_argument('nodes', nargs='+',
+                        help='SSH destinations ([user@]host or ssh_config aliases); @FILE reads one per line')
+    parser.add_argument('--output-dir', required=True, help='Directory for the snapshots and their reports')
+    parser.add_argument('--collector', default=DEFAULT_COLLECTOR_PATH,
+                        help='Collector script pushed to the nodes (default: the bundled one)')
+    parser.add_argument('--concurrency', type=int, default=COLLECT_CONCURRENCY,
+                        help='Nodes collecting at the same time (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=COLLECT_TIMEOUT_SECONDS,
+                        help='Seconds before a node\'s collection is aborted (default: %(default)s)')
+    parser.add_argument('--jobs', type=int, help='Parallel commands per node (collector --jobs)')
+    parser.add_argument('--compress', choices=['gzip', 'zstd', 'none'], default='gzip',
+                        help='Compression of the streamed outputs (default: gzip)')
+    parser.add_argument('--transport', choices=['ssh', 'local'], default='ssh',
+                        help='local runs the collector on this machine for every node (for testing)')
+    parser.add_argument('--ssh-option', action='append', metavar='OPTION',
+                        help='Extra ssh -o option, e.g. User=root (repeatable)')
+    parser.add_argument('--control-dir', default=os.path.expanduser('~/.ssh/proxmox-analyzer'),
+                        help='Directory for the SSH control sockets (default: %(default)s)')
+    parser.add_argument('--control-persist', default=SSH_CONTROL_PERSIST,
+                        help='How long idle SSH connections stay open for the next run (default: %(default)s)')
+    parser.add_argument('--format', choices=['json', 'markdown', 'both'], default='both',
+                        help='Reports written next to each snapshot (default: both)')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help='Analysis worker processes (default: CPU count, at most 4)')
+    parser.add_argument('--history-dir',
+                        help='Metric history store: flag usage trends and record every snapshot')
+    add_index_argument(parser)
+    add_rules_argument(parser)
+    add_parse_cache_arguments(parser)
+
+    args = parser.parse_args(argv)
+    try:
+        with open(args.collector, 'rb') as f:
+            collector = f.read()
+    except OSError as e:
+        print(f"Error: Cannot read collector script: {e}", file=sys.stderr)
+        sys.exit(1)
+    rules_path = os.path.abspath(args.rules or DEFAULT_RULES_PATH)
+    load_rules_or_exit(rules_path)
+    os.makedirs(args.output_dir, exist_ok=True)
+    parse_cache_size = args.parse_cache_size * 1024 * 1024
+    formats = ['json', 'markdown'] if args.format == 'both' else [args.format]
+    collector_args = ['--compress', args.compress] + (['--jobs', str(args.jobs)] if args.jobs else [])
+    transport = (LocalTransport() if args.transport == 'local'
+                 else SSHTransport(args.control_dir, args.ssh_option, args.control_persist))
+    index = IssueIndex(args.index_db) if args.index_db else None
+
+    started = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=init_watch_worker,
+                                   initargs=(args.parse_cache, parse_cache_size, rules_path))
+    # Start the workers before the event loop exists so they do not inherit it
+    executor.submit(os.getpid).result()
+    orchestrator = CollectionOrchestrator(transport, collector, args.output_dir, executor, formats, rules_path,
+                                          collector_args=collector_args, history_dir=args.history_dir,
+                                          index=index, concurrency=max(1, args.concurrency),
+                                          timeout=args.timeout)
+    try:
+        results = asyncio.run(orchestrator.run(list(dict.fromkeys(args.nodes))))
+    finally:
+        executor.shutdown()
+        if index is not None:
+            index.close()
+
+    for result in results:
+        print(json.dumps(result, separators=(',', ':')))
+    failed = sum(result['status'] != 'ok' for result in results)
+    print(f"Collected {len(results) - failed}/{len(results)} nodes in {time.perf_counter() - started:.1f} s "
+          f"({failed} failed)", file=sys.stderr)
+    if args.parse_cache:
+        ParseCache(args.parse_cache, parse_cache_size).close()
+    sys.exit(1 if failed else 0)
+
+SUBCOMMANDS = {
+    'batch': batch_main,
+    'cluster': cluster_main,
+    'collect': collect_main,
+    'convert': convert_main,
+    'diff': diff_main,
+    'history': history_main,
+    'search': search_main,
+    'watch': watch_main,
+}
 
 def main():
-    parser = argparse.ArgumentParser(description='Analyze Proxmox health check data')
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description='Analyze Proxmox health check data',
+                                     epilog=f"Subcommands: {', '.join(SUBCOMMANDS)} "
+                                            "(run '<subcommand> --help' for details)")
     parser.add_argument('input_file', help='JSON file from data collector')
     parser.add_argument('--output-file', help='Output file for analysis report')
     parser.add_argument('--format', choices=['json', 'summary', 'markdown'], default='json',
                        help='Output format (default: json)')
+    parser.add_argument('--history-dir',
+                       help='Metric history store: flag usage trends and record this snapshot')
+    add_index_argument(parser)
+    add_module_arguments(parser)
+    add_rules_argument(parser)
+    add_parse_cache_arguments(parser)
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
+    rules = load_rules_or_exit(args.rules)
+    modules = select_modules_or_exit(args)
+    wanted = module_outputs(modules, rules) if modules is not None else None
+    
+    profiler = None
+    cprofile = None
+    if args.profile:
+        profiler = AnalysisProfiler(count_regex=args.profile == 'basic', trace_memory=args.profile == 'basic')
+        profiler.start()
+    if args.profile == 'cprofile':
+        cprofile = cProfile.Profile()
+        cprofile.enable()
     
     try:
-        with open(args.input_file, 'r') as f:
-            raw_data = json.load(f)
+        raw_data = (profiler.run('load_snapshot', load_snapshot, args.input_file, wanted) if profiler
+                    else load_snapshot(args.input_file, wanted))
     except FileNotFoundError:
         print(f"Error: Input file '{args.input_file}' not found", file=sys.stderr)
         sys.exit(1)
     except json.JSONDecodeError as e:
         print(f"Error: Invalid JSON in input file: {e}", file=sys.stderr)
         sys.exit(1)
+    except ValueError as e:
+        print(f"Error: Invalid snapshot container: {e}", file=sys.stderr)
+        sys.exit(1)
+    except OSError as e:
+        print(f"Error: Cannot read input file: {e}", file=sys.stderr)
+        sys.exit(1)
     
     # Run analysis
-    analyzer = ProxmoxAnalyzer(raw_data)
+    history = MetricStore(args.history_dir) if args.history_dir else None
+    parse_cache = ParseCache(args.parse_cache, args.parse_cache_size * 1024 * 1024) if args.parse_cache else None
+    analyzer = ProxmoxAnalyzer(raw_data, history=history, parse_cache=parse_cache, rules=rules,
+                               profiler=profiler, modules=modules)
     report = analyzer.analyze_all()
+    if cprofile is not None:
+        cprofile.disable()
+        cprofile.dump_stats(args.profile_output)
+        pstats.Stats(cprofile, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+        print(f"cProfile stats saved to: {args.profile_output} (python3 -m pstats {args.profile_output})",
+              file=sys.stderr)
+    if profiler is not None:
+        profiler.stop()
+        print_profile(report['metadata']['profile'])
+    if history is not None:
+        history.ingest_report(report)
+    if args.index_db:
+        index = IssueIndex(args.index_db)
+        index.add_report(report, os.path.abspath(args.input_file))
+        index.close()
+    if parse_cache is not None:
+        parse_cache.close()
+        print_cache_stats(analyzer.cache_stats)
     
     # Output results
     if args.format == 'summary':
@@ -603,248 +787,5 @@ def main():
         else:
             print(output)
 
-def generate_markdown_report(report: Dict[str, Any]) -> str:
-    """Generate a comprehensive markdown report from the analysis results"""
-    
-    # Extract metadata
-    hostname = report['metadata']['source_hostname']
-    timestamp = report['metadata']['analysis_timestamp']
-    analyzer_version = report['metadata']['analyzer_version']
-    
-    # Extract summary data
-    overall_health = report['summary']['overall_health'].upper()
-    critical_issues = report['summary']['critical_issues']
-    warning_issues = report['summary']['warning_issues']
-    info_issues = report['summary']['info_issues']
-    total_issues = critical_issues + warning_issues + info_issues
-    
-    # Health status emoji
-    health_emoji = "🔴" if overall_health == "CRITICAL" else "🟠" if overall_health == "WARNING" else "🟢"
-    
-    # Start building markdown
-    md = []
-    
-    # Title and metadata
-    md.append(f"# Proxmox Health Check Report: {hostname} {health_emoji}")
-    md.append(f"")
-    md.append(f"**Generated:** {timestamp}")
-    md.append(f"**Analyzer Version:** {analyzer_version}")
-    md.append(f"**Overall Health:** {overall_health}")
-    md.append(f"")
-    
-    # Executive summary
-    md.append(f"## Executive Summary")
-    md.append(f"")
-    md.append(f"| Category | Count |")
-    md.append(f"| -------- | ----- |")
-    md.append(f"| 🔴 Critical Issues | {critical_issues} |")
-    md.append(f"| 🟠 Warning Issues | {warning_issues} |")
-    md.append(f"| 🔵 Info Items | {info_issues} |")
-    md.append(f"| **Total** | **{total_issues}** |")
-    md.append(f"")
-    
-    # Recommendations
-    if report['summary']['recommendations']:
-        md.append(f"### Recommendations")
-        md.append(f"")
-        for i, rec in enumerate(report['summary']['recommendations'], 1):
-            md.append(f"{i}. {rec}")
-        md.append(f"")
-    
-    # Issues list
-    if report['issues']:
-        md.append(f"## Detected Issues")
-        md.append(f"")
-        
-        # Group issues by severity
-        critical = [i for i in report['issues'] if i['severity'] == 'critical']
-        warning = [i for i in report['issues'] if i['severity'] == 'warning']
-        info = [i for i in report['issues'] if i['severity'] == 'info']
-        
-        # Critical issues
-        if critical:
-            md.append(f"### 🔴 Critical Issues")
-            md.append(f"")
-            for i, issue in enumerate(critical, 1):
-                md.append(f"**{i}. {issue['message']}**")
-                md.append(f"   - **Category:** {issue['category']}")
-                md.append(f"   - **Recommendation:** {issue['recommendation']}")
-                md.append(f"   - **Source Command:** `{issue['source_command']}`")
-                if issue.get('evidence'):
-                    md.append(f"   - **Evidence:**")
-                    for evidence_line in issue['evidence']:
-                        md.append(f"     ```")
-                        md.append(f"     {evidence_line}")
-                        md.append(f"     ```")
-                md.append(f"")
-        
-        # Warning issues
-        if warning:
-            md.append(f"### 🟠 Warning Issues")
-            md.append(f"")
-            for i, issue in enumerate(warning, 1):
-                md.append(f"**{i}. {issue['message']}**")
-                md.append(f"   - **Category:** {issue['category']}")
-                md.append(f"   - **Recommendation:** {issue['recommendation']}")
-                md.append(f"   - **Source Command:** `{issue['source_command']}`")
-                if issue.get('evidence'):
-                    md.append(f"   - **Evidence:**")
-                    for evidence_line in issue['evidence']:
-                        md.append(f"     ```")
-                        md.append(f"     {evidence_line}")
-                        md.append(f"     ```")
-                md.append(f"")
-        
-        # Info issues
-        if info:
-            md.append(f"### 🔵 Information")
-            md.append(f"")
-            for i, issue in enumerate(info, 1):
-                md.append(f"**{i}. {issue['message']}**")
-                md.append(f"   - **Category:** {issue['category']}")
-                md.append(f"   - **Recommendation:** {issue['recommendation']}")
-                md.append(f"   - **Source Command:** `{issue['source_command']}`")
-                if issue.get('evidence'):
-                    md.append(f"   - **Evidence:**")
-                    for evidence_line in issue['evidence']:
-                        md.append(f"     ```")
-                        md.append(f"     {evidence_line}")
-                        md.append(f"     ```")
-                md.append(f"")
-    
-    # Detailed Analysis Sections
-    md.append(f"## Detailed Analysis")
-    md.append(f"")
-    
-    # System Overview
-    if 'system_overview' in report['analysis']:
-        md.append(f"### System Overview")
-        md.append(f"")
-        sys_data = report['analysis']['system_overview']
-        md.append(f"- **Proxmox Version:** {sys_data.get('pve_version', 'Unknown')}")
-        md.append(f"- **Kernel:** {sys_data.get('kernel_info', 'Unknown')}")
-        
-        # Services status
-        if 'services' in sys_data:
-            md.append(f"")
-            md.append(f"#### Services Status")
-            md.append(f"")
-            md.append(f"| Service | Status |")
-            md.append(f"| ------- | ------ |")
-            for service, status in sys_data['services'].items():
-                status_emoji = "✅" if status == "running" else "❌"
-                md.append(f"| {service} | {status_emoji} {status} |")
-        md.append(f"")
-    
-    # Hardware Health
-    if 'hardware_health' in report['analysis']:
-        md.append(f"### Hardware Health")
-        md.append(f"")
-        hw_data = report['analysis']['hardware_health']
-        
-        if 'cpu' in hw_data:
-            md.append(f"**CPU:** {hw_data['cpu'].get('model', 'Unknown')} ({hw_data['cpu'].get('cores', 'Unknown')} cores)")
-        
-        if 'memory' in hw_data:
-            mem = hw_data['memory']
-            total_gb = round(mem.get('total_kb', 0) / 1024 / 1024, 2)
-            avail_gb = round(mem.get('available_kb', 0) / 1024 / 1024, 2)
-            usage_pct = mem.get('usage_percent', 0)
-            md.append(f"**Memory:** {avail_gb}GB available of {total_gb}GB total ({usage_pct}% used)")
-            
-            if mem.get('errors_detected', False):
-                md.append(f"⚠️ **Memory errors detected**")
-        md.append(f"")
-    
-    # Storage and Filesystem
-    if 'storage_filesystem' in report['analysis']:
-        md.append(f"### Storage and Filesystem")
-        md.append(f"")
-        storage_data = report['analysis']['storage_filesystem']
-        
-        if storage_data.get('efi_corruption_detected', False):
-            md.append(f"⚠️ **EFI corruption detected**")
-        
-        if storage_data.get('high_usage_filesystems'):
-            md.append(f"")
-            md.append(f"#### High Usage Filesystems")
-            md.append(f"")
-            md.append(f"| Filesystem | Usage |")
-            md.append(f"| ---------- | ----- |")
-            for fs, usage in storage_data['high_usage_filesystems']:
-                usage_emoji = "🔴" if usage > 95 else "🟠"
-                md.append(f"| {fs} | {usage_emoji} {usage}% |")
-        
-        md.append(f"")
-        md.append(f"**Storage Technologies:**")
-        md.append(f"- ZFS: {'Available' if storage_data.get('zfs_available', False) else 'Not available'}")
-        md.append(f"- LVM: {'Available' if storage_data.get('lvm_available', False) else 'Not available'}")
-        md.append(f"")
-    
-    # Network Diagnostics
-    if 'network_diagnostics' in report['analysis']:
-        md.append(f"### Network Diagnostics")
-        md.append(f"")
-        net_data = report['analysis']['network_diagnostics']
-        
-        md.append(f"| Test | Status |")
-        md.append(f"| ---- | ------ |")
-        ping_status = "✅ Success" if net_data.get('ping_test_success', False) else "❌ Failed"
-        dns_status = "✅ Success" if net_data.get('dns_test_success', False) else "❌ Failed"
-        md.append(f"| Internet Connectivity | {ping_status} |")
-        md.append(f"| DNS Resolution | {dns_status} |")
-        md.append(f"")
-        md.append(f"**Network Interfaces:** {net_data.get('interface_count', 0)}")
-        md.append(f"")
-    
-    # Virtualization
-    if 'proxmox_virtualization' in report['analysis']:
-        md.append(f"### Virtualization")
-        md.append(f"")
-        virt_data = report['analysis']['proxmox_virtualization']
-        
-        md.append(f"**Virtual Machines:** {virt_data.get('vm_count', 0)}")
-        md.append(f"**Containers:** {virt_data.get('container_count', 0)}")
-        md.append(f"**Cluster:** {'Available' if virt_data.get('cluster_available', False) else 'Not available'}")
-        md.append(f"")
-    
-    # Performance
-    if 'performance_monitoring' in report['analysis']:
-        md.append(f"### Performance")
-        md.append(f"")
-        perf_data = report['analysis']['performance_monitoring']
-        
-        load = perf_data.get('load_average_1min', 0)
-        load_emoji = "🔴" if load > 8.0 else "🟠" if load > 4.0 else "🟢"
-        md.append(f"**Load Average:** {load_emoji} {load}")
-        md.append(f"**Uptime:** {perf_data.get('uptime_days', 0)} days")
-        md.append(f"")
-    
-    # Security and Updates
-    if 'security_updates' in report['analysis']:
-        md.append(f"### Security and Updates")
-        md.append(f"")
-        sec_data = report['analysis']['security_updates']
-        
-        updates = sec_data.get('upgradable_packages', 0)
-        security = sec_data.get('security_updates', 0)
-        
-        updates_emoji = "🔴" if security > 0 else "🟠" if updates > 20 else "🟢"
-        md.append(f"**Available Updates:** {updates_emoji} {updates} packages ({security} security updates)")
-        
-        cert_status = "✅ Valid" if sec_data.get('certificate_valid', True) else "❌ Expiring or invalid"
-        md.append(f"**SSL Certificate:** {cert_status}")
-        
-        logins = sec_data.get('failed_logins_count', 0)
-        login_emoji = "🟠" if logins > 10 else "🟢"
-        md.append(f"**Failed Logins:** {login_emoji} {logins}")
-        md.append(f"")
-    
-    # Footer
-    md.append(f"---")
-    md.append(f"*Report generated by Proxmox Health Check Analyzer v{analyzer_version}*")
-    
-    return "\n".join(md)
-
 if __name__ == '__main__':
     main()
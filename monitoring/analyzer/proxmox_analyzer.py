@@ -0,0 +1,3764 @@
+"""
+Proxmox Health Check Analyzer
+Parses the collector's outputs, checks them against the rules and the metric
+history and renders the reports; proxmox-analyzer.py is its command line
+"""
+
+import json
+import os
+import sys
+import bisect
+import difflib
+import fcntl
+from collections import defaultdict
+import hashlib
+import math
+import re
+import sqlite3
+import struct
+import time
+import tracemalloc
+import types
+from array import array
+from datetime import datetime, UTC
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from dataclasses import dataclass
+from functools import cached_property
+from itertools import compress
+import tomllib
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from proxmox_snapshot import LazyOutput, parse_timestamp
+
+COMMAND_HEADER_RE = re.compile(r'=== Command: (.+?) ===')
+EXIT_CODE_RE = re.compile(r'=== Exit Code: (-?\d+) ===')
+NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+# Trend analysis over the metric history
+# Projected metric prefix -> label of the thing filling up
+TREND_METRICS = {
+    'filesystem_usage_percent': '{}',
+    'memory_usage_percent': 'Memory',
+    'zfs_capacity_percent': 'ZFS pool {}',
+    'thin_pool_data_percent': '{} thin pool data',
+    'thin_pool_metadata_percent': '{} thin pool metadata',
+}
+TREND_WINDOW_DAYS = 14
+TREND_MIN_SAMPLES = 3
+# Structured journal records (collector --journal-cursor): 'journalctl -o json', one entry per line
+JOURNAL_OUTPUT = 'journal'
+JOURNAL_PRIORITIES = ('emerg', 'alert', 'crit', 'err', 'warning', 'notice', 'info', 'debug')
+JOURNAL_CRITICAL_PRIORITY = 2
+JOURNAL_ERROR_PRIORITY = 3
+JOURNAL_UNIT_REPORT = 10
+# Log template mining over journal/dmesg outputs (Drain: fixed-depth prefix tree + token similarity)
+LOG_TEMPLATE_OUTPUTS = ('boot_errors', 'recent_errors', 'boot_issues', 'kernel_issues', 'storage_errors',
+                        JOURNAL_OUTPUT)
+LOG_TEMPLATE_SIMILARITY = 0.4
+LOG_TEMPLATE_DEPTH = 2
+LOG_TEMPLATE_MAX_CHILDREN = 100
+# Messages remembered per analysis before the exact-match cache is reset
+LOG_TEMPLATE_CACHE_SIZE = 100000
+# Messages differing only in digit values mask to the same template
+LOG_DIGITS = str.maketrans('123456789', '000000000')
+# Templates kept per host in the history store (least recently seen are dropped)
+LOG_TEMPLATE_LIMIT = 5000
+LOG_TEMPLATE_REPORT = 20
+
+LOG_LINE_RE = re.compile(
+    r'^(?:(?P<time>[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d|\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\S*) \S+ '
+    r'(?P<source>[^\s\[:]+)(?:\[\d+\])?: |\[\s*(?P<uptime>\d+\.\d+)\] )?(?P<message>.*)$', re.M)
+LOG_MASKS = (
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.I), '<uuid>'),
+    (re.compile(r'\b(?:[0-9a-f]{2}:){5}[0-9a-f]{2}\b', re.I), '<mac>'),
+    (re.compile(r'(?:::ffff:)?\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b'), '<ip>'),
+    (re.compile(r'\b0x[0-9a-f]+\b|\b(?=[0-9a-f]*\d)(?=[0-9a-f]*[a-f])[0-9a-f]{8,}\b', re.I), '<hex>'),
+    (re.compile(r'\b(?:sd[a-z]{1,2}\d*|x?vd[a-z]\d*|nvme\d+(?:n\d+)?(?:p\d+)?|mmcblk\d+(?:p\d+)?'
+                r'|(?:dm-|md|loop|nbd|zd|ata|sr)\d+(?:\.\d+)?)\b'), '<dev>'),
+    (re.compile(r'\b\d+(?:\.\d+)*[a-zA-Z]{0,3}\b'), '<num>'),
+)
+LOG_MONTHS = {month: index for index, month in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'))}
+
+# Analysis modules in report order: section -> raw outputs its analyze_<section> method reads.
+# The outputs of the section's rules in rules.toml are added when selecting modules;
+# a trailing '*' matches every output key with that prefix.
+ANALYSIS_MODULES = {
+    'system_overview': ('pveversion', 'uname', 'boot_errors',
+                        'pve_cluster', 'pvedaemon', 'pveproxy', 'pvestatd', 'pve_firewall'),
+    'hardware_health': ('lscpu', 'meminfo'),
+    'storage_filesystem': ('storage_errors', 'df_h', 'zpool_status', 'zpool_list', 'zfs_arcstats',
+                           'pvs', 'lvs', 'smart_*'),
+    'network_diagnostics': ('ping_test', 'dns_test', 'ip_addr'),
+    'proxmox_virtualization': ('qm_list', 'pct_list', 'pvecm_status', 'lscpu', 'meminfo',
+                               'guest_processes', 'top_cpu', 'top_mem', 'lxc_cgroups'),
+    'performance_monitoring': ('loadavg', 'uptime', 'iostat_perf', 'iostat', 'diskstats_perf', 'diskstats',
+                               'zpool_iostat', 'samples'),
+    'log_analysis': ('recent_errors', 'boot_issues', 'kernel_issues') + LOG_TEMPLATE_OUTPUTS,
+    'security_updates': ('apt_upgradable', 'security_updates', 'cert_check', 'failed_logins'),
+}
+# Short module names for --only/--skip
+MODULE_ALIASES = {
+    'system': 'system_overview',
+    'hardware': 'hardware_health',
+    'storage': 'storage_filesystem',
+    'network': 'network_diagnostics',
+    'virtualization': 'proxmox_virtualization',
+    'performance': 'performance_monitoring',
+    'logs': 'log_analysis',
+    'security': 'security_updates',
+}
+
+# Aggregation windows are aligned to 1970-01-05, a Monday, so weeks start on Monday
+AGGREGATE_WINDOWS = {'hour': 3600, 'day': 86400, 'week': 7 * 86400}
+AGGREGATE_ORIGIN = 4 * 86400
+
+# Persistent parse cache
+PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Issue rules, see rules.toml
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.toml')
+RULE_SEVERITIES = ('critical', 'warning', 'info')
+# Overall health of a report, from best to worst
+HEALTH_STATUSES = ('healthy', 'warning', 'degraded', 'critical')
+
+ZPOOL_FIELD_RE = re.compile(r'^\s*(pool|state|status|action|scan|config|errors):\s?(.*)$')
+ZPOOL_GROUPS = ('logs', 'cache', 'spares', 'special', 'dedup')
+# zpool list column -> record field; percent columns are converted to numbers
+ZPOOL_LIST_COLUMNS = {
+    'NAME': 'name',
+    'SIZE': 'size',
+    'ALLOC': 'alloc',
+    'FREE': 'free',
+    'FRAG': 'fragmentation_percent',
+    'CAP': 'capacity_percent',
+    'HEALTH': 'health',
+}
+ARCSTATS_RE = re.compile(r'^(\w+)\s+\d+\s+(\d+)$')
+SMART_HEALTH_RE = re.compile(r'(?:self-assessment test result|SMART Health Status):\s*(\S+)')
+SMART_ATTRIBUTE_RE = re.compile(
+    r'^\s*(\d{1,3})\s+(\S+)\s+0x[0-9a-fA-F]+\s+(\d+)\s+(\d+)\s+(\d+|---)\s+\S+\s+\S+\s+(\S+)\s+(\d+)')
+SMART_FIELD_RE = re.compile(r'^([A-Z][\w /.-]*?):\s+(\S.*)$')
+# ATA attribute ID -> record field (raw value)
+SMART_ATA_ATTRIBUTES = {
+    5: 'reallocated_sectors',
+    9: 'power_on_hours',
+    187: 'reported_uncorrect',
+    194: 'temperature_c',
+    197: 'pending_sectors',
+    198: 'offline_uncorrectable',
+    199: 'crc_errors',
+}
+# NVMe health log field -> record field
+SMART_NVME_FIELDS = {
+    'Critical Warning': 'critical_warning',
+    'Temperature': 'temperature_c',
+    'Available Spare': 'available_spare',
+    'Available Spare Threshold': 'available_spare_threshold',
+    'Percentage Used': 'percentage_used',
+    'Power On Hours': 'power_on_hours',
+    'Unsafe Shutdowns': 'unsafe_shutdowns',
+    'Media and Data Integrity Errors': 'media_errors',
+}
+PVECM_MEMBER_RE = re.compile(r'^(0x[0-9a-fA-F]+)\s+(\d+)\s+(\S+)(\s+\(local\))?$')
+# Guest processes: kvm -id <vmid> for VMs, lxc-start -n <vmid> or [lxc monitor] <path> <vmid> for containers
+GUEST_PROCESS_RE = re.compile(r'^(?:\S*/)?kvm -id (\d+)|^\S*lxc-start\s.*?-n (\d+)|^\[lxc monitor\] \S+ (\d+)')
+KVM_SMP_RE = re.compile(r' -smp (\d+)')
+LXC_CGROUP_RE = re.compile(r'^/sys/fs/cgroup/lxc/(\d+)/([\w.]+):(.*)$')
+# ps header -> record field ('ps aux' and 'ps -eo pid,etimes,pcpu,rss,args')
+PS_COLUMNS = {'PID': 'pid', '%CPU': 'cpu_percent', 'RSS': 'rss_kb', 'ELAPSED': 'elapsed_seconds', 'COMMAND': 'command'}
+PS_COMMAND_LIMIT = 200
+# iostat -x column -> device field (old sysstat: avgqu-sz and a combined await)
+IOSTAT_COLUMNS = {
+    'r/s': 'reads_per_s',
+    'w/s': 'writes_per_s',
+    'rkB/s': 'read_kb_per_s',
+    'wkB/s': 'write_kb_per_s',
+    'r_await': 'read_await_ms',
+    'w_await': 'write_await_ms',
+    'await': 'await_ms',
+    'aqu-sz': 'queue_depth',
+    'avgqu-sz': 'queue_depth',
+    '%util': 'util_percent',
+}
+# /proc/diskstats counter -> offset after the device name
+DISKSTATS_COUNTERS = {
+    'reads': 0,
+    'read_sectors': 2,
+    'read_ms': 3,
+    'writes': 4,
+    'write_sectors': 6,
+    'write_ms': 7,
+    'io_ms': 9,
+    'weighted_io_ms': 10,
+}
+# Counter samples kept per host to compute rates against the previous snapshot (see DiskCounterStore)
+DISKSTATS_STATE_SAMPLES = 32
+DISK_PARTITION_RE = re.compile(r'^(?:[hsv]d[a-z]+|xvd[a-z]+)\d+$|^(?:nvme\d+n\d+|mmcblk\d+|zd\d+|nbd\d+|loop\d+)p\d+$')
+# Physical disks get the load checks; dm-* and zvols (zd*) only pass their I/O on
+DISK_PHYSICAL_RE = re.compile(r'^(?:(?P<sd>[hsv]d|xvd)[a-z]+|(?P<nvme>nvme)\d+n\d+|(?P<mmc>mmcblk)\d+)$')
+# Latency outliers: a disk's await against the median of the other active disks of its kind
+DISK_ACTIVE_IOPS = 1.0
+DISK_OUTLIER_MIN_AWAIT_MS = 5.0
+# Series of server/proxmox-sampler.py (collector --samples), checked by their highest bucket average
+SAMPLED_PEAK_METRICS = {
+    'sampled_load_peak': 'load1',
+    'sampled_memory_pressure_percent': 'psi_memory_full',
+    'sampled_io_pressure_percent': 'psi_io_full',
+}
+# pvesm storage types backed by the same store on every node that lists them
+SHARED_STORAGE_TYPES = ('nfs', 'cifs', 'glusterfs', 'cephfs', 'rbd', 'iscsi', 'iscsidirect', 'zfs', 'pbs')
+
+@dataclass
+class HealthIssue:
+    severity: str  # critical, warning, info
+    category: str
+    message: str
+    recommendation: str
+    source_command: str = "unknown"
+    evidence: List[str] = None
+    
+    def __post_init__(self):
+        if self.evidence is None:
+            self.evidence = []
+
+class CommandOutput:
+    """Lazily parsed view of a single collector output
+
+    Each derived form (text, line list, command header, exit code) is
+    computed on first access and cached, so every output is decoded, split
+    and scanned at most once no matter how many checks read it.
+    """
+
+    def __init__(self, key: str, raw: Union[str, LazyOutput, None]):
+        self.key = key
+        self._raw = raw or ''
+
+    def __bool__(self) -> bool:
+        return len(self._raw) > 0
+
+    @cached_property
+    def text(self) -> str:
+        """Full output text, decoded from the snapshot file on first use if lazy"""
+        if isinstance(self._raw, LazyOutput):
+            return self._raw.read()
+        return self._raw
+
+    def __contains__(self, needle: str) -> bool:
+        return needle in self.text
+
+    @cached_property
+    def lines(self) -> List[str]:
+        """All raw lines, including the command header and exit code trailer"""
+        return self.text.split('\n')
+
+    @cached_property
+    def nonblank_lines(self) -> List[str]:
+        """Stripped non-empty lines, including header and trailer"""
+        return [line.strip() for line in self.lines if line.strip()]
+
+    @cached_property
+    def content_lines(self) -> List[str]:
+        """Stripped non-empty lines with '===' header/trailer lines removed"""
+        return [line.strip() for line in self.lines
+                if line.strip() and not line.startswith('===')]
+
+    @cached_property
+    def command(self) -> str:
+        """Command from the '=== Command: ... ===' header, falling back to the key"""
+        match = COMMAND_HEADER_RE.search(self.lines[0])
+        if not match:
+            match = COMMAND_HEADER_RE.search(self.text)
+        return match.group(1) if match else self.key
+
+    @cached_property
+    def exit_code(self) -> Optional[int]:
+        """Exit code from the '=== Exit Code: N ===' trailer, or None if absent"""
+        for line in reversed(self.lines):
+            if line.startswith('=== Exit Code:'):
+                match = EXIT_CODE_RE.match(line)
+                return int(match.group(1)) if match else None
+        return None
+
+    def matching_lines(self, pattern: str) -> List[str]:
+        """Stripped non-empty lines matching a case-insensitive regex"""
+        regex = re.compile(pattern, re.IGNORECASE)
+        return [line.strip() for line in self.lines if line.strip() and regex.search(line)]
+
+    @cached_property
+    def digest(self) -> str:
+        """Content hash used as the parse cache key
+
+        Lazy outputs are hashed from their encoded bytes in the snapshot so a
+        cache hit never has to decode (or decompress) them.
+        """
+        if isinstance(self._raw, LazyOutput):
+            data = self._raw.encoded()
+        else:
+            data = b'text:' + self._raw.encode('utf-8', 'surrogatepass')
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+# Cacheable output parsers
+#
+# Parsers are pure functions of one CommandOutput returning JSON-serializable
+# data, so ProxmoxAnalyzer.parsed() can cache their results by content hash.
+# Their cache version is derived from their bytecode: editing a parser
+# invalidates its cached results automatically.
+
+def summarize_lines(output: CommandOutput) -> Dict[str, Any]:
+    """Count content lines and keep the first few as evidence"""
+    return {
+        "command": output.command,
+        "count": len(output.content_lines),
+        "head": output.content_lines[:5]
+    }
+
+def journal_field(value: Any) -> str:
+    """A 'journalctl -o json' field as text (byte arrays for non-UTF-8 values, lists for repeated fields)"""
+    if isinstance(value, list):
+        if all(isinstance(item, int) for item in value):
+            return bytes(value).decode('utf-8', 'replace')
+        return journal_field(value[-1]) if value else ''
+    return '' if value is None else str(value)
+
+def parse_journal_entries(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'journalctl -o json' into [time, priority, unit, identifier, message] rows
+
+    The cursor printed by --show-cursor is kept; the read is incremental
+    when it started after the previous run's cursor.
+    """
+    entries = []
+    cursor = None
+    invalid = 0
+    for line in output.content_lines:
+        if line.startswith('-- cursor: '):
+            cursor = line[len('-- cursor: '):]
+            continue
+        if not line.startswith('{'):
+            continue
+        try:
+            record = json.loads(line)
+            timestamp = int(journal_field(record.get('__REALTIME_TIMESTAMP'))) / 1e6
+            priority = int(journal_field(record.get('PRIORITY')) or 6)
+        except ValueError:
+            invalid += 1
+            continue
+        entries.append([timestamp, priority, journal_field(record.get('_SYSTEMD_UNIT')),
+                        journal_field(record.get('SYSLOG_IDENTIFIER')) or journal_field(record.get('_COMM')),
+                        journal_field(record.get('MESSAGE'))])
+    return {
+        "command": output.command,
+        "incremental": '--after-cursor' in output.command,
+        "cursor": cursor,
+        "entries": entries,
+        "invalid": invalid
+    }
+
+def journal_line(entry: List[Any], host: str) -> str:
+    """A journal row as a 'journalctl -o short-iso' line, the form the log template miner reads"""
+    timestamp, _, unit, identifier, message = entry
+    time_text = datetime.fromtimestamp(timestamp, UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return f"{time_text} {host} {identifier or unit or 'unknown'}: {' '.join(message.split())}"
+
+def parse_df_usage(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'df -h' into (filesystem, usage percent, line) rows"""
+    rows = []
+    for line in output.lines:
+        if '%' in line and not line.startswith('==='):
+            parts = line.split()
+            if len(parts) >= 5:
+                try:
+                    usage = int(parts[4].rstrip('%'))
+                    filesystem = parts[5] if len(parts) > 5 else parts[0]
+                except (ValueError, IndexError):
+                    continue
+                rows.append([filesystem, usage, line.strip()])
+    return {"command": output.command, "filesystems": rows}
+
+def parse_zfs_count(token: str) -> Optional[int]:
+    """Convert a zpool error counter ('0', '12', '1.2K') to an integer"""
+    multiplier = 1
+    suffix = token[-1:].upper()
+    if suffix in 'KMGT' and suffix:
+        multiplier = 1024 ** ('KMGT'.index(suffix) + 1)
+        token = token[:-1]
+    try:
+        return int(float(token) * multiplier)
+    except ValueError:
+        return None
+
+def parse_percent(token: Optional[str]) -> Optional[float]:
+    """Convert '6%' or '2.60' to a float, None for '-' or empty cells"""
+    if not token:
+        return None
+    try:
+        return float(token.rstrip('%'))
+    except ValueError:
+        return None
+
+def parse_zpool_status(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'zpool status' into pools with per-vdev state and READ/WRITE/CKSUM counters"""
+    pools = []
+    pool = None
+    field = None
+    group = None
+    for line in output.lines:
+        if line.startswith('==='):
+            continue
+        match = ZPOOL_FIELD_RE.match(line)
+        if match:
+            field, value = match.groups()
+            if field == 'pool':
+                pool = {"name": value.strip(), "state": None, "status": None, "scan": None,
+                        "errors": None, "vdevs": []}
+                pools.append(pool)
+                group = None
+            elif pool is not None and field != 'config':
+                pool[field] = value.strip()
+            continue
+        if pool is None or not line.strip():
+            continue
+        if field != 'config':
+            # Continuation of a wrapped status/action/scan message
+            if field in pool and pool[field] is not None:
+                pool[field] += ' ' + line.strip()
+            continue
+
+        tokens = line.split()
+        if tokens[0] == 'NAME':
+            continue
+        body = line.lstrip('\t')
+        depth = (len(body) - len(body.lstrip(' '))) // 2
+        if len(tokens) == 1 and depth == 0 and tokens[0] in ZPOOL_GROUPS:
+            group = tokens[0]
+            continue
+        counters = [parse_zfs_count(t) for t in tokens[2:5]]
+        if len(counters) < 3 or None in counters:
+            counters = [None, None, None]
+            note = ' '.join(tokens[2:])
+        else:
+            note = ' '.join(tokens[5:])
+        pool["vdevs"].append({
+            "name": tokens[0],
+            "state": tokens[1] if len(tokens) > 1 else None,
+            "read": counters[0],
+            "write": counters[1],
+            "cksum": counters[2],
+            "depth": depth,
+            "group": group,
+            "note": note,
+            "line": line.strip()
+        })
+
+    # Leaves carry the errors of actual devices; parents repeat their children's
+    for pool in pools:
+        vdevs = pool["vdevs"]
+        for i, vdev in enumerate(vdevs):
+            vdev["leaf"] = i + 1 == len(vdevs) or vdevs[i + 1]["depth"] <= vdev["depth"]
+    return {"command": output.command, "pools": pools}
+
+def parse_zpool_list(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'zpool list' rows into pool size, fragmentation, capacity and health"""
+    pools = []
+    columns = None
+    for line in output.content_lines:
+        tokens = line.split()
+        if tokens[0] == 'NAME':
+            columns = tokens
+            continue
+        if columns is None or len(tokens) != len(columns):
+            continue
+        pool = {}
+        for column, value in zip(columns, tokens):
+            name = ZPOOL_LIST_COLUMNS.get(column)
+            if name is not None:
+                pool[name] = parse_percent(value) if name.endswith('_percent') else value
+        pool["line"] = line
+        pools.append(pool)
+    return {"command": output.command, "pools": pools}
+
+def parse_arcstats(output: CommandOutput) -> Dict[str, Any]:
+    """Parse arcstats counters and compute the ARC hit ratio"""
+    stats = {}
+    for line in output.content_lines:
+        match = ARCSTATS_RE.match(line)
+        if match:
+            stats[match.group(1)] = int(match.group(2))
+    hits = stats.get('hits')
+    misses = stats.get('misses')
+    lookups = (hits or 0) + (misses or 0)
+    return {
+        "command": output.command,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio_percent": round(hits / lookups * 100, 1) if lookups else None,
+        "size_bytes": stats.get('size')
+    }
+
+def parse_lvs(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'lvs' into logical volumes with thin pool data/metadata usage
+
+    Empty columns make the table ambiguous when split on whitespace, so the
+    trailing cells are classified instead: numbers are Data%/Meta% and
+    other values are the pool (thin volumes) or origin (snapshots).
+    """
+    volumes = []
+    for line in output.content_lines:
+        tokens = line.split()
+        if len(tokens) < 4 or tokens[0] == 'LV':
+            continue
+        name, vg, attr, size = tokens[:4]
+        numbers = [parse_percent(t) for t in tokens[4:] if parse_percent(t) is not None]
+        names = [t for t in tokens[4:] if parse_percent(t) is None]
+        thin_pool = attr.startswith('t')
+        volumes.append({
+            "name": name,
+            "vg": vg,
+            "attr": attr,
+            "size": size,
+            "thin_pool": thin_pool,
+            "pool": names[0] if attr.startswith('V') and names else None,
+            "data_percent": numbers[0] if numbers else None,
+            "metadata_percent": numbers[1] if thin_pool and len(numbers) > 1 else None,
+            "line": line
+        })
+    return {"command": output.command, "volumes": volumes}
+
+def parse_smart(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'smartctl -a' for ATA or NVMe health, sector and wear counters"""
+    record: Dict[str, Any] = {
+        "command": output.command,
+        "device": output.key[len('smart_'):],
+        "type": None,
+        "health": None,
+        "failing_attributes": [],
+        "evidence": {}
+    }
+    for line in output.lines:
+        if line.startswith('==='):
+            continue
+        match = SMART_HEALTH_RE.search(line)
+        if match:
+            record["health"] = match.group(1)
+            record["evidence"]["health"] = line.strip()
+            continue
+        match = SMART_ATTRIBUTE_RE.match(line)
+        if match:
+            record["type"] = "ata"
+            attr_id = int(match.group(1))
+            if match.group(6) != '-':
+                record["failing_attributes"].append(match.group(2))
+                record["evidence"][match.group(2)] = line.strip()
+            name = SMART_ATA_ATTRIBUTES.get(attr_id)
+            if name is not None:
+                record[name] = int(match.group(7))
+                record["evidence"][name] = line.strip()
+            continue
+        match = SMART_FIELD_RE.match(line)
+        if match and match.group(1) in SMART_NVME_FIELDS:
+            record["type"] = "nvme"
+            name = SMART_NVME_FIELDS[match.group(1)]
+            value = match.group(2).split()[0].replace(',', '').rstrip('%')
+            try:
+                record[name] = int(value, 16) if value.startswith('0x') else int(value)
+            except ValueError:
+                continue
+            record["evidence"][name] = line.strip()
+    return record
+
+def parse_pvecm_status(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'pvecm status' into cluster name, quorum state and membership
+
+    Nodes without a corosync.conf come back with clustered False.
+    """
+    fields = {}
+    members = []
+    for line in output.content_lines:
+        match = PVECM_MEMBER_RE.match(line)
+        if match:
+            members.append({
+                "node_id": int(match.group(1), 16),
+                "votes": int(match.group(2)),
+                "address": match.group(3),
+                "local": bool(match.group(4))
+            })
+            continue
+        key, separator, value = line.partition(':')
+        if separator:
+            fields[key.strip()] = value.strip()
+
+    def number(key: str) -> Optional[int]:
+        tokens = fields.get(key, '').split()
+        return int(tokens[0]) if tokens and tokens[0].isdigit() else None
+
+    return {
+        "command": output.command,
+        "clustered": bool(members) or 'Quorate' in fields,
+        "name": fields.get('Name'),
+        "config_version": number('Config Version'),
+        "transport": fields.get('Transport'),
+        "quorate": fields['Quorate'].lower() == 'yes' if 'Quorate' in fields else None,
+        "nodes": number('Nodes'),
+        "expected_votes": number('Expected votes'),
+        "total_votes": number('Total votes'),
+        "quorum": number('Quorum'),
+        "members": members
+    }
+
+def parse_qm_list(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'qm list' (VMID NAME STATUS MEM(MB) BOOTDISK(GB) PID) into VMs"""
+    guests = []
+    for line in output.content_lines:
+        tokens = line.split()
+        if len(tokens) < 3 or not tokens[0].isdigit():
+            continue
+        guests.append({
+            "vmid": int(tokens[0]),
+            "name": tokens[1],
+            "status": tokens[2],
+            "memory_mb": int(tokens[3]) if len(tokens) > 3 and tokens[3].isdigit() else None,
+            "disk_gb": float(tokens[4]) if len(tokens) > 4 and NUMBER_RE.fullmatch(tokens[4]) else None
+        })
+    return {"command": output.command, "guests": guests}
+
+def parse_pct_list(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'pct list' (VMID Status Lock Name) into containers
+
+    The Lock column is usually empty, so rows have three or four cells.
+    """
+    guests = []
+    for line in output.content_lines:
+        tokens = line.split()
+        if len(tokens) < 2 or not tokens[0].isdigit():
+            continue
+        guests.append({
+            "vmid": int(tokens[0]),
+            "name": tokens[-1] if len(tokens) > 2 else "",
+            "status": tokens[1],
+            "lock": tokens[2] if len(tokens) > 3 else None
+        })
+    return {"command": output.command, "guests": guests}
+
+def parse_ps(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'ps aux' or 'ps -eo ...' output, tagging kvm and lxc processes with their VMID
+
+    Columns come from the header; the last one (the command) may contain
+    spaces and is cut short, since kvm command lines run to kilobytes.
+    """
+    processes = []
+    columns = None
+    for line in output.content_lines:
+        if columns is None:
+            columns = line.split()
+            if 'PID' not in columns:
+                break
+            continue
+        cells = line.split(None, len(columns) - 1)
+        if len(cells) < len(columns):
+            continue
+        process: Dict[str, Any] = {}
+        for column, cell in zip(columns, cells):
+            field = PS_COLUMNS.get(column)
+            if field == 'command':
+                process[field] = cell[:PS_COMMAND_LIMIT]
+            elif field == 'cpu_percent':
+                process[field] = float(cell) if NUMBER_RE.fullmatch(cell) else None
+            elif field:
+                process[field] = int(cell) if cell.isdigit() else None
+        match = GUEST_PROCESS_RE.match(cells[-1])
+        if match:
+            process["vmid"] = int(match.group(1) or match.group(2) or match.group(3))
+            process["guest_type"] = 'vm' if match.group(1) else 'ct'
+            smp = KVM_SMP_RE.search(cells[-1])
+            process["vcpus"] = int(smp.group(1)) if smp else None
+        processes.append(process)
+    return {"command": output.command, "processes": processes}
+
+def parse_lxc_cgroups(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'grep -H' over /sys/fs/cgroup/lxc/<vmid>/ files into per-container usage and limits"""
+    containers: Dict[str, Dict[str, Any]] = {}
+    for line in output.content_lines:
+        match = LXC_CGROUP_RE.match(line)
+        if not match:
+            continue
+        name, value = match.group(2), match.group(3).split()
+        if not value:
+            continue
+        entry = containers.setdefault(match.group(1), {})
+        if name == 'memory.current' and value[0].isdigit():
+            entry["memory_bytes"] = int(value[0])
+        elif name == 'memory.max' and value[0].isdigit():
+            entry["memory_max_bytes"] = int(value[0])
+        elif name == 'cpu.max' and len(value) == 2 and value[0].isdigit() and value[1].isdigit():
+            entry["cpus"] = int(value[0]) / int(value[1])
+        elif name == 'cpu.stat' and value[0] == 'usage_usec' and len(value) == 2:
+            entry["cpu_usage_usec"] = int(value[1])
+    return {"command": output.command, "containers": containers}
+
+def parse_pvesm_status(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'pvesm status' (sizes in KiB) into storages with their usage"""
+    storages = []
+    for line in output.content_lines:
+        tokens = line.split()
+        if len(tokens) < 6 or not all(token.isdigit() for token in tokens[3:6]):
+            continue
+        total, used, available = (int(token) for token in tokens[3:6])
+        storages.append({
+            "name": tokens[0],
+            "type": tokens[1],
+            "status": tokens[2],
+            "total_kb": total,
+            "used_kb": used,
+            "available_kb": available,
+            "usage_percent": round(used / total * 100, 2) if total else None
+        })
+    return {"command": output.command, "storages": storages}
+
+def parse_iostat(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'iostat -x' into the per-device load of its last report
+
+    With an interval ('iostat -x 1 3') the first report averages since
+    boot and every later one covers a single interval, so the last report
+    is the current load.
+    """
+    reports = 0
+    iowait = None
+    devices: Dict[str, Dict[str, Optional[float]]] = {}
+    columns = None
+    cpu_columns = None
+    for line in output.content_lines:
+        tokens = line.split()
+        if tokens[0] == 'avg-cpu:':
+            cpu_columns = tokens[1:]
+            continue
+        if cpu_columns is not None:
+            if '%iowait' in cpu_columns and len(tokens) == len(cpu_columns):
+                iowait = parse_percent(tokens[cpu_columns.index('%iowait')])
+            cpu_columns = None
+            continue
+        if tokens[0] in ('Device', 'Device:'):
+            columns = tokens[1:]
+            reports += 1
+            devices = {}
+            continue
+        if columns is None or len(tokens) != len(columns) + 1:
+            continue
+        device = {field: None for field in IOSTAT_COLUMNS.values()}
+        for column, token in zip(columns, tokens[1:]):
+            if column in IOSTAT_COLUMNS:
+                device[IOSTAT_COLUMNS[column]] = parse_percent(token)
+        reads, writes = device['reads_per_s'], device['writes_per_s']
+        if device['await_ms'] is None and None not in (reads, writes, device['read_await_ms'],
+                                                       device['write_await_ms']):
+            device['await_ms'] = round((reads * device['read_await_ms'] + writes * device['write_await_ms'])
+                                       / (reads + writes), 2) if reads + writes else 0.0
+        devices[tokens[0]] = device
+    return {"command": output.command, "reports": reports, "interval": reports > 1,
+            "iowait_percent": iowait, "devices": devices}
+
+def parse_diskstats(output: CommandOutput) -> Dict[str, Any]:
+    """Parse /proc/diskstats into I/O counters per device, skipping partitions and unused devices"""
+    devices = {}
+    for line in output.content_lines:
+        tokens = line.split()
+        if len(tokens) < 14 or DISK_PARTITION_RE.match(tokens[2]) or not all(t.isdigit() for t in tokens[3:14]):
+            continue
+        counters = {field: int(tokens[3 + offset]) for field, offset in DISKSTATS_COUNTERS.items()}
+        if counters['reads'] or counters['writes']:
+            devices[tokens[2]] = counters
+    return {"command": output.command, "devices": devices}
+
+def parse_zpool_iostat(output: CommandOutput) -> Dict[str, Any]:
+    """Parse 'zpool iostat -v' into pools and vdevs with operations and bandwidth per second
+
+    Without an interval the figures are averages since the pool was imported.
+    """
+    pools = []
+    for line in output.lines:
+        tokens = line.split()
+        if len(tokens) != 7 or line.startswith('='):
+            continue
+        counters = [parse_zfs_count(token) for token in tokens[3:7]]
+        if None in counters:
+            continue
+        entry = {
+            "name": tokens[0],
+            "read_ops": counters[0],
+            "write_ops": counters[1],
+            "read_bytes": counters[2],
+            "write_bytes": counters[3],
+        }
+        depth = (len(line) - len(line.lstrip(' '))) // 2
+        if depth == 0:
+            pools.append(dict(entry, vdevs=[]))
+        elif pools:
+            pools[-1]["vdevs"].append(dict(entry, depth=depth))
+    return {"command": output.command, "pools": pools}
+
+def parse_samples(output: CommandOutput) -> Dict[str, Any]:
+    """Parse the JSON summary of proxmox-sampler.py (min/avg/max/p99 per field and time bucket)"""
+    try:
+        summary = json.loads('\n'.join(output.content_lines))
+    except ValueError:
+        summary = None
+    return {"command": output.command, "summary": summary if isinstance(summary, dict) else None}
+
+_PARSER_VERSIONS: Dict[Callable, str] = {}
+
+def parser_version(parser: Callable) -> str:
+    """Hash of a parser's bytecode, constants and names
+
+    Module-level tables and helper functions the parser refers to are
+    hashed too, so changing a pattern table also invalidates the cache.
+    """
+    version = _PARSER_VERSIONS.get(parser)
+    if version is None:
+        digest = hashlib.blake2b(digest_size=8)
+        seen = set()
+        def feed(code: types.CodeType):
+            digest.update(code.co_code)
+            digest.update(repr(code.co_names).encode())
+            for const in code.co_consts:
+                if isinstance(const, types.CodeType):
+                    feed(const)
+                else:
+                    digest.update(repr(const).encode())
+            for name in code.co_names:
+                value = parser.__globals__.get(name)
+                if name in seen or value is None:
+                    continue
+                seen.add(name)
+                if isinstance(value, types.FunctionType):
+                    feed(value.__code__)
+                elif isinstance(value, (dict, tuple, list, str, int, float, re.Pattern)):
+                    digest.update(repr(value).encode())
+        feed(parser.__code__)
+        version = f"{parser.__name__}:{digest.hexdigest()}"
+        _PARSER_VERSIONS[parser] = version
+    return version
+
+class ParseCache:
+    """Persistent cache of parser results keyed by (output key, content hash, parser version)
+
+    Stored in a SQLite file and bounded to ``max_bytes`` of cached results;
+    least recently used entries are evicted on close().
+    """
+
+    def __init__(self, path: str, max_bytes: int = PARSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._touched: Dict[Tuple[str, str, str], float] = {}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS parsed (
+            output_key TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            parser TEXT NOT NULL,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (output_key, digest, parser))''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS parsed_last_used ON parsed (last_used)')
+
+    def get(self, output_key: str, digest: str, parser: str) -> Tuple[bool, Any]:
+        row = self.db.execute('SELECT value FROM parsed WHERE output_key=? AND digest=? AND parser=?',
+                              (output_key, digest, parser)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        self._touched[(output_key, digest, parser)] = time.time()
+        return True, json.loads(row[0])
+
+    def put(self, output_key: str, digest: str, parser: str, value: Any):
+        """Store a parser result; written to disk on the next flush()"""
+        encoded = json.dumps(value, separators=(',', ':'))
+        self.db.execute('INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?, ?)',
+                        (output_key, digest, parser, encoded, len(encoded), time.time()))
+
+    def flush(self):
+        """Commit new entries and last-used times of hits"""
+        with self.db:
+            self.db.executemany('UPDATE parsed SET last_used=? WHERE output_key=? AND digest=? AND parser=?',
+                                [(used, *key) for key, used in self._touched.items()])
+        self._touched.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM parsed').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        doomed = []
+        for rowid, size in self.db.execute('SELECT rowid, size FROM parsed ORDER BY last_used'):
+            doomed.append((rowid,))
+            excess -= size
+            if excess <= 0:
+                break
+        with self.db:
+            self.db.executemany('DELETE FROM parsed WHERE rowid=?', doomed)
+
+    def close(self):
+        self.flush()
+        self.evict()
+        self.db.close()
+
+@dataclass
+class RuleLevel:
+    severity: str
+    message: str
+    recommendation: str
+    above: Optional[float] = None
+    below: Optional[float] = None
+
+    def __post_init__(self):
+        if self.above is None and self.below is None:
+            self.above = 0
+
+    def holds(self, value: float) -> bool:
+        if self.above is not None and not value > self.above:
+            return False
+        if self.below is not None and not value < self.below:
+            return False
+        return True
+
+@dataclass
+class Rule:
+    id: str
+    category: str
+    levels: List[RuleLevel]
+    section: Optional[str] = None
+    outputs: List[str] = None
+    metric: Optional[str] = None
+    patterns: List[re.Pattern] = None
+    count: str = 'lines'
+    missing: Optional[str] = None
+    contains: List[str] = None
+    evidence: str = 'head'
+    evidence_lines: int = 5
+
+    def __post_init__(self):
+        self.outputs = self.outputs or []
+        self.patterns = self.patterns or []
+        self.contains = self.contains or []
+
+    @classmethod
+    def from_dict(cls, entry: Dict[str, Any]) -> 'Rule':
+        """Validate one rule table and compile its patterns"""
+        rule_id = entry.get('id', '?')
+        def fail(problem: str):
+            raise ValueError(f"rule {rule_id}: {problem}")
+
+        for required in ('id', 'category', 'levels'):
+            if required not in entry:
+                fail(f"missing '{required}'")
+        outputs = entry.get('outputs') or ([entry['output']] if 'output' in entry else [])
+        if bool(outputs) == bool(entry.get('metric')):
+            fail("needs exactly one of 'output'/'outputs' or 'metric'")
+        if outputs and not entry.get('section'):
+            fail("output rules need a 'section'")
+        if entry.get('count', 'lines') not in ('lines', 'matches'):
+            fail("'count' must be 'lines' or 'matches'")
+        if entry.get('evidence', 'head') not in ('head', 'tail', 'all', 'templates'):
+            fail("'evidence' must be 'head', 'tail', 'all' or 'templates'")
+
+        levels = []
+        for level in entry['levels']:
+            if level.get('severity') not in RULE_SEVERITIES:
+                fail(f"severity must be one of {', '.join(RULE_SEVERITIES)}")
+            try:
+                levels.append(RuleLevel(level['severity'], level['message'], level['recommendation'],
+                                        level.get('above'), level.get('below')))
+            except KeyError as e:
+                fail(f"level is missing {e}")
+
+        flags = re.IGNORECASE if entry.get('ignore_case', True) else 0
+        patterns = []
+        for pattern in entry.get('match', []):
+            try:
+                patterns.append(re.compile(pattern, flags))
+            except re.error as e:
+                fail(f"invalid pattern {pattern!r}: {e}")
+
+        text_check = 'missing' in entry or 'contains' in entry
+        return cls(
+            id=entry['id'],
+            category=entry['category'],
+            levels=levels,
+            section=entry.get('section'),
+            outputs=outputs,
+            metric=entry.get('metric'),
+            patterns=patterns,
+            count=entry.get('count', 'lines'),
+            missing=entry.get('missing'),
+            contains=entry.get('contains'),
+            evidence=entry.get('evidence', 'head'),
+            evidence_lines=entry.get('evidence_lines', 3 if text_check else 5)
+        )
+
+    def level_for(self, value: float) -> Optional[RuleLevel]:
+        """First level whose bounds hold for the value"""
+        for level in self.levels:
+            if level.holds(value):
+                return level
+        return None
+
+    def measure(self, view: CommandOutput, hits: List[List[str]]) -> Tuple[int, List[str]]:
+        """Value this output rule measures on one output, plus its evidence lines"""
+        if self.missing is not None:
+            return int(self.missing not in view), self.select_evidence(view.nonblank_lines)
+        if self.contains:
+            return int(any(text in view for text in self.contains)), self.select_evidence(view.nonblank_lines)
+        if not self.patterns:
+            lines = view.content_lines
+            return len(lines), self.select_evidence(lines)
+        lines = [line for pattern_hits in hits for line in pattern_hits]
+        if self.count == 'matches':
+            value = sum(len(pattern.findall(line))
+                        for pattern, pattern_hits in zip(self.patterns, hits) for line in pattern_hits)
+        else:
+            value = len(lines)
+        return value, self.select_evidence(lines)
+
+    def select_evidence(self, lines: List[str]) -> List[str]:
+        if self.evidence == 'all':
+            return list(lines)
+        if self.evidence == 'tail':
+            return lines[-self.evidence_lines:]
+        return lines[:self.evidence_lines]
+
+class RuleSet:
+    """Compiled rule file
+
+    Output rules are grouped by output key and the patterns of all rules on
+    a key are merged into one alternation, so each output is scanned once
+    however many rules target it. Only lines the combined pattern matches
+    are re-checked against the individual patterns to attribute them.
+    Patterns that are valid alone but not together (global inline flags,
+    a group name used twice) are scanned one by one on that output.
+    """
+
+    def __init__(self, rules: List[Rule], source: str = '<rules>'):
+        self.rules = rules
+        self.source = source
+        self.sections: Dict[str, List[Rule]] = defaultdict(list)
+        self.metrics: Dict[str, Rule] = {}
+        seen = set()
+        patterns_by_output = defaultdict(list)
+        for rule in rules:
+            if rule.id in seen:
+                raise ValueError(f"{source}: duplicate rule id {rule.id}")
+            seen.add(rule.id)
+            if rule.metric:
+                if rule.metric in self.metrics:
+                    raise ValueError(f"{source}: more than one rule for metric {rule.metric}")
+                self.metrics[rule.metric] = rule
+                continue
+            self.sections[rule.section].append(rule)
+            for key in rule.outputs:
+                for index, pattern in enumerate(rule.patterns):
+                    patterns_by_output[key].append((rule, index, pattern))
+
+        self.scanners: Dict[str, Tuple[Optional[re.Pattern], List[Tuple[Rule, int, re.Pattern]]]] = {}
+        for key, entries in patterns_by_output.items():
+            combined = '|'.join(
+                f"(?i:{pattern.pattern})" if pattern.flags & re.IGNORECASE else f"(?:{pattern.pattern})"
+                for _, _, pattern in entries
+            )
+            try:
+                self.scanners[key] = (re.compile(combined), entries)
+            except re.error:
+                self.scanners[key] = (None, entries)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'RuleSet':
+        """Load a TOML rule file, or YAML (.yaml/.yml) when PyYAML is installed"""
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ValueError(f"{path}: YAML rule files require PyYAML (pip install pyyaml)")
+            with open(path, 'r') as f:
+                try:
+                    data = yaml.safe_load(f) or {}
+                except yaml.YAMLError as e:
+                    raise ValueError(f"{path}: {e}") from None
+        else:
+            with open(path, 'rb') as f:
+                try:
+                    data = tomllib.load(f)
+                except tomllib.TOMLDecodeError as e:
+                    raise ValueError(f"{path}: {e}") from None
+        try:
+            rules = [Rule.from_dict(entry) for entry in data.get('rules', [])]
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from None
+        return cls(rules, path)
+
+    def scan(self, view: CommandOutput) -> Dict[str, List[List[str]]]:
+        """Content lines matching each pattern of every rule on this output, in one pass"""
+        scanner = self.scanners.get(view.key)
+        if scanner is None:
+            return {}
+        combined, entries = scanner
+        hits = {rule.id: [[] for _ in rule.patterns] for rule, _, _ in entries}
+        search = combined.search if combined is not None else (lambda line: True)
+        for line in view.content_lines:
+            if search(line):
+                for rule, index, pattern in entries:
+                    if pattern.search(line):
+                        hits[rule.id][index].append(line)
+        return hits
+
+_RULE_SETS: Dict[str, RuleSet] = {}
+
+def load_rules(path: Optional[str] = None) -> RuleSet:
+    """Load and compile a rule file once per process"""
+    path = os.path.abspath(path or DEFAULT_RULES_PATH)
+    rules = _RULE_SETS.get(path)
+    if rules is None:
+        rules = RuleSet.from_file(path)
+        _RULE_SETS[path] = rules
+    return rules
+
+class AnalysisProfiler:
+    """Instrumentation for --profile
+
+    Records wall and CPU time, regex calls and the tracemalloc peak of each
+    analysis module, plus how much of every raw output was fed to parsers
+    and rule scans. Regex calls are counted with a sys.setprofile hook on
+    re.Pattern methods, so timings include that overhead; compare modules
+    against each other rather than with unprofiled runs. With
+    count_regex/trace_memory off only timings are taken (cProfile mode,
+    which needs the profile hook for itself).
+    """
+
+    def __init__(self, count_regex: bool = True, trace_memory: bool = True):
+        self.count_regex = count_regex
+        self.trace_memory = trace_memory
+        self.modules: Dict[str, Dict[str, Any]] = {}
+        self.outputs: Dict[str, Dict[str, int]] = defaultdict(lambda: {"parser_runs": 0, "rule_scans": 0,
+                                                                       "bytes_scanned": 0})
+        self.regex_calls: Dict[str, int] = defaultdict(int)
+        self._module_regex_calls = 0
+        self._started_tracemalloc = False
+        self._started = None
+
+    def start(self):
+        self._started = (time.perf_counter(), time.process_time())
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.count_regex:
+            sys.setprofile(self._count_regex_call)
+
+    def stop(self):
+        if self.count_regex:
+            sys.setprofile(None)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _count_regex_call(self, frame, event: str, arg: Any):
+        if event == 'c_call' and isinstance(getattr(arg, '__self__', None), re.Pattern):
+            self.regex_calls[arg.__self__.pattern] += 1
+            self._module_regex_calls += 1
+
+    def run(self, name: str, function: Callable, *args: Any) -> Any:
+        """Call function(*args) and record it as one module"""
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        self._module_regex_calls = 0
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            return function(*args)
+        finally:
+            record = {
+                "wall_ms": round((time.perf_counter() - wall) * 1000, 3),
+                "cpu_ms": round((time.process_time() - cpu) * 1000, 3),
+            }
+            if self.count_regex:
+                record["regex_calls"] = self._module_regex_calls
+            if tracing:
+                record["peak_alloc_kb"] = max(0, tracemalloc.get_traced_memory()[1] - base) // 1024
+            self.modules[name] = record
+
+    def record_scan(self, view: CommandOutput, kind: str):
+        """Count one full pass of a parser or rule scan over an output"""
+        stats = self.outputs[view.key]
+        stats[kind] += 1
+        stats["bytes_scanned"] += len(view.text)
+
+    def to_dict(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"modules": self.modules}
+        if self._started is not None:
+            result["total_wall_ms"] = round((time.perf_counter() - self._started[0]) * 1000, 3)
+            result["total_cpu_ms"] = round((time.process_time() - self._started[1]) * 1000, 3)
+        if self.trace_memory and tracemalloc.is_tracing():
+            result["peak_alloc_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+        result["outputs"] = dict(sorted(self.outputs.items(), key=lambda item: -item[1]["bytes_scanned"]))
+        if self.count_regex:
+            result["regex_calls"] = dict(sorted(self.regex_calls.items(), key=lambda item: -item[1]))
+        return result
+
+def print_profile(profile: Dict[str, Any], top: int = 10):
+    """Human-readable --profile summary on stderr"""
+    out = sys.stderr
+    print(f"\nProfile ({profile.get('total_wall_ms', 0):.1f} ms wall, "
+          f"{profile.get('total_cpu_ms', 0):.1f} ms CPU"
+          + (f", {profile['peak_alloc_kb']} KB peak allocation" if 'peak_alloc_kb' in profile else '')
+          + ")", file=out)
+    print(f"  {'module':<26} {'wall ms':>9} {'cpu ms':>9} {'regex':>8} {'peak KB':>8}", file=out)
+    for name, record in sorted(profile['modules'].items(), key=lambda item: -item[1]['wall_ms']):
+        print(f"  {name:<26} {record['wall_ms']:>9.2f} {record['cpu_ms']:>9.2f} "
+              f"{record.get('regex_calls', '-'):>8} {record.get('peak_alloc_kb', '-'):>8}", file=out)
+    if profile['outputs']:
+        print(f"  {'output':<26} {'bytes':>9} {'parses':>9} {'scans':>8}", file=out)
+        for key, stats in list(profile['outputs'].items())[:top]:
+            print(f"  {key:<26} {stats['bytes_scanned']:>9} {stats['parser_runs']:>9} {stats['rule_scans']:>8}",
+                  file=out)
+    for pattern, calls in list(profile.get('regex_calls', {}).items())[:top]:
+        shown = pattern if len(pattern) <= 60 else pattern[:57] + '...'
+        print(f"  {calls:>9} calls  {shown}", file=out)
+
+class GuestUsage:
+    """Per-guest resource accounting in columnar arrays
+
+    One typed array per field instead of a dict per guest, with each
+    host's guests stored contiguously, so rolling up thousands of guests
+    across a cluster is a few C-level sums over array slices. Unknown
+    numbers (e.g. a running guest missing from the process list) are -1.
+    """
+
+    KINDS = ('vm', 'ct')
+    COLUMNS = ('vmid', 'kind', 'running', 'cpu_percent', 'vcpus', 'rss_kb', 'memory_kb', 'disk_gb')
+
+    def __init__(self):
+        self.hosts: List[str] = []
+        self.offsets = array('q', [0])
+        self.names: List[str] = []
+        self.vmid = array('q')
+        self.kind = array('b')
+        self.running = array('b')
+        self.cpu_percent = array('d')  # average since the guest started, percent of one CPU
+        self.vcpus = array('d')
+        self.rss_kb = array('q')
+        self.memory_kb = array('q')  # configured memory (container: cgroup memory.max)
+        self.disk_gb = array('d')
+
+    def __len__(self) -> int:
+        return len(self.vmid)
+
+    def start_host(self, host: str):
+        """Guests added from now on belong to this host"""
+        self.hosts.append(host)
+        self.offsets.append(len(self.vmid))
+
+    def add(self, vmid: int, kind: str, name: str, running: bool, cpu_percent: Optional[float] = None,
+            vcpus: Optional[float] = None, rss_kb: Optional[int] = None, memory_kb: Optional[int] = None,
+            disk_gb: Optional[float] = None):
+        self.names.append(name)
+        self.vmid.append(vmid)
+        self.kind.append(self.KINDS.index(kind))
+        self.running.append(running)
+        self.cpu_percent.append(-1 if cpu_percent is None else cpu_percent)
+        self.vcpus.append(-1 if vcpus is None else vcpus)
+        self.rss_kb.append(-1 if rss_kb is None else rss_kb)
+        self.memory_kb.append(-1 if memory_kb is None else memory_kb)
+        self.disk_gb.append(-1 if disk_gb is None else disk_gb)
+        self.offsets[-1] = len(self.vmid)
+
+    def extend(self, other: 'GuestUsage'):
+        """Append another table's hosts and guests"""
+        base = len(self.vmid)
+        self.hosts.extend(other.hosts)
+        self.offsets.extend(base + offset for offset in other.offsets[1:])
+        self.names.extend(other.names)
+        for column in self.COLUMNS:
+            getattr(self, column).extend(getattr(other, column))
+
+    def to_columns(self) -> Dict[str, Any]:
+        """Compact JSON form: one list per column"""
+        columns = {column: getattr(self, column).tolist() for column in self.COLUMNS}
+        columns.update(hosts=self.hosts, offsets=self.offsets.tolist(), names=self.names)
+        return columns
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, Any]) -> 'GuestUsage':
+        usage = cls()
+        usage.hosts = list(columns['hosts'])
+        usage.offsets = array('q', columns['offsets'])
+        usage.names = list(columns['names'])
+        for column in cls.COLUMNS:
+            getattr(usage, column).fromlist(columns[column])
+        return usage
+
+    def records(self) -> List[Dict[str, Any]]:
+        """One dict per guest, for reports"""
+        def known(value):
+            return None if value < 0 else value
+        records = []
+        for i in range(len(self.vmid)):
+            memory_kb = known(self.memory_kb[i])
+            rss_kb = known(self.rss_kb[i])
+            records.append({
+                "vmid": self.vmid[i],
+                "type": self.KINDS[self.kind[i]],
+                "name": self.names[i],
+                "status": "running" if self.running[i] else "stopped",
+                "cpu_percent": known(round(self.cpu_percent[i], 1)),
+                "vcpus": known(self.vcpus[i]),
+                "rss_mb": None if rss_kb is None else round(rss_kb / 1024, 1),
+                "memory_mb": None if memory_kb is None else round(memory_kb / 1024, 1),
+                "memory_used_percent": round(rss_kb / memory_kb * 100, 1) if rss_kb is not None and memory_kb else None,
+                "disk_gb": known(self.disk_gb[i])
+            })
+        return records
+
+    def rollup(self, memory_kb: Optional[Dict[str, int]] = None,
+               cpus: Optional[Dict[str, int]] = None) -> Dict[str, Dict[str, Any]]:
+        """Totals per host; with host capacities also memory and vCPU overcommit ratios
+
+        Overcommit compares what the running guests are configured with to
+        the host's physical memory and CPUs.
+        """
+        positive = (0.0).__lt__
+        totals = {}
+        for index, host in enumerate(self.hosts):
+            start, end = self.offsets[index], self.offsets[index + 1]
+            running = self.running[start:end]
+            entry = {
+                "guests": end - start,
+                "running": sum(running),
+                "cpu_percent": round(sum(filter(positive, self.cpu_percent[start:end])), 1),
+                "rss_kb": sum(filter(positive, self.rss_kb[start:end])),
+                "memory_configured_kb": sum(filter(positive, compress(self.memory_kb[start:end], running))),
+                "vcpus": sum(filter(positive, compress(self.vcpus[start:end], running)))
+            }
+            host_memory = (memory_kb or {}).get(host)
+            host_cpus = (cpus or {}).get(host)
+            entry["memory_overcommit_ratio"] = (round(entry['memory_configured_kb'] / host_memory, 2)
+                                                if host_memory else None)
+            entry["cpu_overcommit_ratio"] = round(entry['vcpus'] / host_cpus, 2) if host_cpus else None
+            totals[host] = entry
+        return totals
+
+class IssueReporter:
+    """Issue collection shared by snapshot and cluster analysis; subclasses set rules and issues"""
+
+    def add_issue(self, severity: str, category: str, message: str, recommendation: str, 
+                  source_command: str = "unknown", evidence: List[str] = None):
+        """Add an issue to the issues list"""
+        self.issues.append(HealthIssue(severity, category, message, recommendation, source_command, evidence or []))
+    
+    def check_metric(self, metric: str, value: Optional[float], instance: Optional[str] = None,
+                     source_command: str = "unknown", evidence: List[str] = None) -> Optional[RuleLevel]:
+        """Raise an issue if a metric rule's level holds for this value; returns that level"""
+        rule = self.rules.metrics.get(metric)
+        if rule is None or value is None:
+            return None
+        level = rule.level_for(value)
+        if level is not None:
+            self.add_issue(level.severity, rule.category,
+                         level.message.format(value=value, instance=instance),
+                         level.recommendation.format(value=value, instance=instance),
+                         source_command=source_command,
+                         evidence=evidence)
+        return level
+        
+    def generate_recommendations(self) -> List[str]:
+        """Generate prioritized recommendations based on issues found"""
+        
+        recommendations = []
+        
+        # Critical issues first
+        critical_issues = [i for i in self.issues if i.severity == "critical"]
+        if critical_issues:
+            recommendations.append("CRITICAL: Address the following issues immediately:")
+            for issue in critical_issues[:5]:  # Top 5 critical
+                recommendations.append(f"  - {issue.recommendation}")
+        
+        # Warning issues
+        warning_issues = [i for i in self.issues if i.severity == "warning"]
+        if warning_issues:
+            recommendations.append("WARNING: Address these issues during next maintenance:")
+            for issue in warning_issues[:5]:  # Top 5 warnings
+                recommendations.append(f"  - {issue.recommendation}")
+        
+        # General recommendations
+        if not critical_issues and not warning_issues:
+            recommendations.append("System appears healthy - continue regular monitoring")
+        
+        return recommendations
+    
+    def calculate_overall_health(self) -> str:
+        """Calculate overall system health status"""
+        
+        critical_count = len([i for i in self.issues if i.severity == "critical"])
+        warning_count = len([i for i in self.issues if i.severity == "warning"])
+        healthy, warning, degraded, critical = HEALTH_STATUSES
+        
+        if critical_count > 0:
+            return critical
+        elif warning_count > 3:
+            return degraded
+        elif warning_count > 0:
+            return warning
+        else:
+            return healthy
+    
+    def summarize(self, recommendations: List[str]) -> Dict[str, Any]:
+        """Issue counts and overall health for a report's summary"""
+        return {
+            "total_issues": len(self.issues),
+            "critical_issues": len([i for i in self.issues if i.severity == "critical"]),
+            "warning_issues": len([i for i in self.issues if i.severity == "warning"]),
+            "info_issues": len([i for i in self.issues if i.severity == "info"]),
+            "overall_health": self.calculate_overall_health(),
+            "recommendations": recommendations
+        }
+
+    def issue_records(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "severity": issue.severity,
+                "category": issue.category,
+                "message": issue.message,
+                "recommendation": issue.recommendation,
+                "source_command": issue.source_command,
+                "evidence": issue.evidence
+            }
+            for issue in self.issues
+        ]
+
+class ProxmoxAnalyzer(IssueReporter):
+    def __init__(self, raw_data: Dict[str, Any], history: Optional['MetricStore'] = None,
+                 parse_cache: Optional[ParseCache] = None, rules: Optional[RuleSet] = None,
+                 profiler: Optional[AnalysisProfiler] = None, templates: Optional['TemplateStore'] = None,
+                 modules: Optional[List[str]] = None):
+        self.raw_data = raw_data
+        self.metadata = raw_data.get('metadata', {})
+        self.outputs = raw_data.get('raw_outputs', {})
+        self.history = history
+        self.templates = templates if templates is not None or history is None else history.templates
+        self.parse_cache = parse_cache
+        self.rules = rules or load_rules()
+        self.profiler = profiler
+        self.modules = list(ANALYSIS_MODULES) if modules is None else modules
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self.issues: List[HealthIssue] = []
+        self._views: Dict[str, CommandOutput] = {}
+        self._parsed: Dict[Tuple[str, Callable], Any] = {}
+        self._rule_hits: Dict[str, Dict[str, List[List[str]]]] = {}
+        self._log_templates: Optional['LogTemplateMiner'] = None
+        self._mined_outputs: set = set()
+
+    def output(self, output_key: str) -> CommandOutput:
+        """Return the cached parsed view of a raw output (empty if not collected)"""
+        view = self._views.get(output_key)
+        if view is None:
+            view = CommandOutput(output_key, self.outputs.get(output_key, ''))
+            self._views[output_key] = view
+        return view
+
+    def parsed(self, output_key: str, parser: Callable[[CommandOutput], Any]) -> Any:
+        """Run a cacheable parser over an output, consulting the parse cache first"""
+        memo_key = (output_key, parser)
+        if memo_key in self._parsed:
+            return self._parsed[memo_key]
+        
+        view = self.output(output_key)
+        if self.parse_cache is None:
+            result = self.run_parser(view, parser)
+        else:
+            version = parser_version(parser)
+            hit, result = self.parse_cache.get(output_key, view.digest, version)
+            if hit:
+                self.cache_stats["hits"] += 1
+            else:
+                self.cache_stats["misses"] += 1
+                result = self.run_parser(view, parser)
+                self.parse_cache.put(output_key, view.digest, version, result)
+        
+        self._parsed[memo_key] = result
+        return result
+
+    def run_parser(self, view: CommandOutput, parser: Callable[[CommandOutput], Any]) -> Any:
+        if self.profiler is not None:
+            self.profiler.record_scan(view, "parser_runs")
+        return parser(view)
+
+    def log_templates(self, *output_keys: str) -> 'LogTemplateMiner':
+        """The analysis' log template miner, with the given outputs clustered
+
+        Seeded with the host's stored templates when there is a history
+        store, so templates of earlier snapshots are not reported as new.
+        """
+        if self._log_templates is None:
+            self._log_templates = LogTemplateMiner()
+            if self.templates is not None:
+                self._log_templates.seed(self.templates.load(self.metadata.get('hostname', 'unknown')))
+        for key in output_keys:
+            if key not in self._mined_outputs:
+                self._mined_outputs.add(key)
+                view = self.output(key)
+                if view and key == JOURNAL_OUTPUT:
+                    # Error-level records only, like the other log outputs
+                    host = self.metadata.get('hostname', 'unknown')
+                    entries = self.parsed(key, parse_journal_entries)['entries']
+                    self._log_templates.add_output(key, '\n'.join(
+                        journal_line(entry, host) for entry in entries if entry[1] <= JOURNAL_ERROR_PRIORITY))
+                elif view:
+                    if self.profiler is not None:
+                        self.profiler.record_scan(view, "parser_runs")
+                    self._log_templates.add_output(key, view.text)
+        return self._log_templates
+
+    def template_evidence(self, output_key: str, limit: int) -> List[str]:
+        """Most frequent message templates of an output as evidence lines"""
+        evidence = []
+        for template in self.log_templates(output_key).top(output_key, limit):
+            count, first, last, _ = template.outputs[output_key]
+            seen = f" ({first} to {last})" if count > 1 and first != last else (f" ({first})" if first else "")
+            evidence.append(f"{count}x {template.template}{seen}")
+        return evidence
+
+    def apply_rules(self, section: str) -> Dict[str, int]:
+        """Raise issues for the output rules of one analysis section
+
+        Returns the value each rule measured (summed over its outputs).
+        """
+        values = {}
+        for rule in self.rules.sections.get(section, []):
+            total = 0
+            for key in rule.outputs:
+                view = self.output(key)
+                hits = self._rule_hits.get(key)
+                if hits is None:
+                    hits = self.rules.scan(view)
+                    self._rule_hits[key] = hits
+                    if self.profiler is not None and key in self.rules.scanners:
+                        self.profiler.record_scan(view, "rule_scans")
+                value, evidence = rule.measure(view, hits.get(rule.id, []))
+                total += value
+                level = rule.level_for(value)
+                if level is not None and rule.evidence == 'templates':
+                    evidence = self.template_evidence(key, rule.evidence_lines)
+                if level is not None:
+                    self.add_issue(level.severity, rule.category,
+                                 level.message.format(count=value, output=key),
+                                 level.recommendation.format(count=value, output=key),
+                                 source_command=view.command,
+                                 evidence=evidence)
+            values[rule.id] = total
+        return values
+
+    def analyze_all(self) -> Dict[str, Any]:
+        """Run the selected analysis modules (all by default) and return comprehensive report"""
+        
+        # Run analysis modules (timed per module with --profile)
+        run = self.profiler.run if self.profiler is not None else (lambda name, function, *args: function(*args))
+        analysis = {}
+        for module in self.modules:
+            analysis[module] = run(module, getattr(self, f"analyze_{module}"))
+        
+        # Trend checks need the metric history of this host
+        if self.history is not None:
+            analysis["trends"] = run('trends', self.analyze_trends, analysis)
+        
+        # Generate recommendations
+        recommendations = run('recommendations', self.generate_recommendations)
+
+        # Create final report
+        report: Dict[str, Any] = {
+            "metadata": {
+                "analyzer_version": "1.0.0",
+                "analysis_timestamp": datetime.now(UTC).isoformat().replace('+00:00', 'Z'),
+                "source_hostname": self.metadata.get('hostname', 'unknown'),
+                "source_timestamp": self.metadata.get('timestamp', 'unknown')
+            },
+            "analysis": analysis,
+            "summary": self.summarize(recommendations),
+            "issues": self.issue_records()
+        }
+        
+        if len(self.modules) < len(ANALYSIS_MODULES):
+            report["metadata"]["modules"] = list(self.modules)
+        if self.parse_cache is not None:
+            report["metadata"]["parse_cache"] = dict(self.cache_stats)
+        if self.profiler is not None:
+            report["metadata"]["profile"] = self.profiler.to_dict()
+        
+        return report
+    
+    def analyze_system_overview(self) -> Dict[str, Any]:
+        """Analyze system overview data"""
+        
+        pve_version = self.extract_first_line('pveversion')
+        kernel_info = self.extract_first_line('uname')
+        
+        # Boot errors and service status issues come from the rules
+        self.apply_rules('system_overview')
+        boot_errors = self.parsed('boot_errors', summarize_lines)['count']
+        
+        services = {}
+        for service in ['pve_cluster', 'pvedaemon', 'pveproxy', 'pvestatd', 'pve_firewall']:
+            running = 'active (running)' in self.output(service)
+            services[service] = "running" if running else "not_running"
+        
+        return {
+            "pve_version": pve_version,
+            "kernel_info": kernel_info,
+            "boot_errors_count": boot_errors,
+            "services": services
+        }
+    
+    def analyze_hardware_health(self) -> Dict[str, Any]:
+        """Analyze hardware health data"""
+        
+        # CPU analysis
+        cpu_model = self.extract_value_after_colon('lscpu', 'Model name')
+        cpu_cores = self.extract_value_after_colon('lscpu', 'CPU(s)')
+        
+        # Memory analysis
+        mem_total = self.extract_meminfo_value('MemTotal')
+        mem_available = self.extract_meminfo_value('MemAvailable')
+        
+        if mem_total and mem_available:
+            mem_usage_percent = ((mem_total - mem_available) / mem_total) * 100
+            meminfo_output = self.output('meminfo')
+            mem_evidence = [line.strip() for line in meminfo_output.lines if 'Mem' in line][:5]
+            self.check_metric('memory_usage_percent', mem_usage_percent,
+                              source_command=meminfo_output.command, evidence=mem_evidence)
+        
+        # Memory errors and memory pressure
+        memory_errors = self.apply_rules('hardware_health').get('memory-errors', 0)
+        
+        return {
+            "cpu": {
+                "model": cpu_model,
+                "cores": cpu_cores
+            },
+            "memory": {
+                "total_kb": mem_total,
+                "available_kb": mem_available,
+                "usage_percent": round(mem_usage_percent, 1) if mem_total and mem_available else 0,
+                "errors_detected": memory_errors > 0
+            }
+        }
+    
+    def analyze_storage_filesystem(self) -> Dict[str, Any]:
+        """Analyze storage and filesystem data"""
+        
+        # EFI corruption (critical issue from original report) and storage errors
+        rule_values = self.apply_rules('storage_filesystem')
+        efi_issues = rule_values.get('efi-corruption', 0)
+        storage_errors = self.parsed('storage_errors', summarize_lines)['count']
+        
+        # Check disk usage
+        df_output = self.parsed('df_h', parse_df_usage)
+        high_usage_filesystems = []
+        filesystem_usage = {}
+        for filesystem, usage, line in df_output['filesystems']:
+            filesystem_usage[filesystem] = usage
+            if self.check_metric('filesystem_usage_percent', usage, instance=filesystem,
+                                 source_command=df_output['command'], evidence=[line]):
+                high_usage_filesystems.append((filesystem, usage))
+        
+        return {
+            "efi_corruption_detected": efi_issues > 0,
+            "storage_errors_count": storage_errors,
+            "high_usage_filesystems": high_usage_filesystems,
+            "filesystem_usage": filesystem_usage,
+            "zfs_available": 'zpool_status' in self.outputs,
+            "lvm_available": 'pvs' in self.outputs,
+            "zfs_pools": self.analyze_zfs_pools(),
+            "zfs_arc": self.analyze_zfs_arc(),
+            "thin_pools": self.analyze_thin_pools(),
+            "smart": self.analyze_smart()
+        }
+
+    def analyze_zfs_pools(self) -> List[Dict[str, Any]]:
+        """Check pool state, vdev error counters, data errors and capacity"""
+
+        status = self.parsed('zpool_status', parse_zpool_status)
+        capacity = {pool['name']: pool for pool in self.parsed('zpool_list', parse_zpool_list)['pools']}
+
+        pools = []
+        for pool in status['pools']:
+            name = pool['name']
+            vdevs = pool['vdevs']
+            if pool['state'] and pool['state'] != 'ONLINE':
+                unhealthy = [v['line'] for v in vdevs
+                             if v['leaf'] and v['state'] not in ('ONLINE', 'AVAIL', 'INUSE')]
+                self.add_issue("critical", "storage",
+                             f"ZFS pool {name} is {pool['state']}",
+                             f"Run 'zpool status -x {name}' and replace or reattach failed devices",
+                             source_command=status['command'],
+                             evidence=[f"state: {pool['state']}", *unhealthy][:5])
+
+            for vdev in vdevs:
+                if not vdev['leaf'] or not (vdev['read'] or vdev['write'] or vdev['cksum']):
+                    continue
+                self.add_issue("warning", "storage",
+                             f"ZFS device {vdev['name']} in pool {name} has {vdev['read']} read, "
+                             f"{vdev['write']} write and {vdev['cksum']} checksum errors",
+                             f"Check cabling and SMART data, then 'zpool clear {name}' and scrub",
+                             source_command=status['command'],
+                             evidence=[vdev['line']])
+
+            if pool['errors'] and not pool['errors'].startswith('No known data errors'):
+                self.add_issue("critical", "storage",
+                             f"ZFS pool {name} reports data errors",
+                             f"Run 'zpool status -v {name}' to list affected files and restore them from backup",
+                             source_command=status['command'],
+                             evidence=[f"errors: {pool['errors']}"])
+
+            usage = capacity.get(name, {})
+            cap = usage.get('capacity_percent')
+            self.check_metric('zfs_capacity_percent', cap, instance=name,
+                              source_command=self.output('zpool_list').command,
+                              evidence=[usage['line']] if usage else [])
+
+            pools.append({
+                "name": name,
+                "state": pool['state'],
+                "errors": pool['errors'],
+                "scan": pool['scan'],
+                "capacity_percent": cap,
+                "fragmentation_percent": usage.get('fragmentation_percent'),
+                "vdevs": [
+                    {key: vdev[key] for key in ('name', 'state', 'read', 'write', 'cksum', 'group', 'leaf')}
+                    for vdev in vdevs
+                ]
+            })
+
+        return pools
+
+    def analyze_zfs_arc(self) -> Dict[str, Any]:
+        """Report the ARC hit ratio"""
+
+        arc = self.parsed('zfs_arcstats', parse_arcstats)
+        ratio = arc['hit_ratio_percent']
+        self.check_metric('zfs_arc_hit_ratio_percent', ratio, source_command=arc['command'],
+                          evidence=[f"hits {arc['hits']}", f"misses {arc['misses']}"])
+
+        return {
+            "hit_ratio_percent": ratio,
+            "size_bytes": arc['size_bytes']
+        }
+
+    def analyze_thin_pools(self) -> List[Dict[str, Any]]:
+        """Check LVM thin pool data and metadata usage"""
+
+        lvs = self.parsed('lvs', parse_lvs)
+
+        thin_pools = []
+        for volume in lvs['volumes']:
+            if not volume['thin_pool']:
+                continue
+            name = f"{volume['vg']}/{volume['name']}"
+            for metric in ('thin_pool_data_percent', 'thin_pool_metadata_percent'):
+                self.check_metric(metric, volume[metric.replace('thin_pool_', '')], instance=name,
+                                  source_command=lvs['command'], evidence=[volume['line']])
+            thin_pools.append({
+                "name": name,
+                "size": volume['size'],
+                "data_percent": volume['data_percent'],
+                "metadata_percent": volume['metadata_percent']
+            })
+
+        return thin_pools
+
+    def analyze_smart(self) -> Dict[str, Dict[str, Any]]:
+        """Check SMART health, failing attributes and NVMe spare for every smart_* output
+
+        Sector counters, NVMe wear and media errors go through metric rules.
+        """
+
+        devices = {}
+        for key in sorted(k for k in self.outputs if k.startswith('smart_')):
+            smart = self.parsed(key, parse_smart)
+            device = smart['device']
+            evidence = smart['evidence']
+
+            def report(severity: str, message: str, recommendation: str, *fields: str):
+                self.add_issue(severity, "storage", message, recommendation,
+                               source_command=smart['command'],
+                               evidence=[evidence[f] for f in fields if f in evidence])
+
+            if smart['health'] and smart['health'] not in ('PASSED', 'OK'):
+                report("critical", f"SMART health check failed on {device}",
+                       f"Back up data and replace {device}", 'health')
+            if smart['failing_attributes']:
+                report("critical", f"SMART attributes failing on {device}: {', '.join(smart['failing_attributes'])}",
+                       f"Back up data and replace {device}", *smart['failing_attributes'])
+
+            for field, metric in (('reallocated_sectors', 'smart_reallocated_sectors'),
+                                  ('pending_sectors', 'smart_pending_sectors'),
+                                  ('offline_uncorrectable', 'smart_offline_uncorrectable'),
+                                  ('percentage_used', 'nvme_percentage_used'),
+                                  ('media_errors', 'nvme_media_errors')):
+                self.check_metric(metric, smart.get(field), instance=device, source_command=smart['command'],
+                                  evidence=[evidence[field]] if field in evidence else [])
+
+            if smart.get('critical_warning'):
+                report("critical", f"NVMe critical warning 0x{smart['critical_warning']:02x} on {device}",
+                       f"Check spare capacity, temperature and media state of {device}", 'critical_warning')
+            spare = smart.get('available_spare')
+            spare_threshold = smart.get('available_spare_threshold')
+            if spare is not None and spare_threshold is not None and spare <= spare_threshold:
+                report("critical", f"{device} available spare {spare}% at or below threshold {spare_threshold}%",
+                       f"Replace {device}", 'available_spare', 'available_spare_threshold')
+
+            devices[device] = {
+                field: smart.get(field)
+                for field in ('type', 'health', 'reallocated_sectors', 'pending_sectors',
+                              'offline_uncorrectable', 'percentage_used', 'available_spare',
+                              'media_errors', 'power_on_hours', 'temperature_c')
+            }
+
+        return devices
+    
+    def analyze_network_diagnostics(self) -> Dict[str, Any]:
+        """Analyze network diagnostics data"""
+        
+        # Connectivity and DNS
+        self.apply_rules('network_diagnostics')
+        ping_success = '0% packet loss' in self.output('ping_test')
+        dns_success = 'Address:' in self.output('dns_test')
+        
+        # Count network interfaces
+        ip_addr = self.output('ip_addr')
+        interface_count = len(re.findall(r'inet \d+\.\d+\.\d+\.\d+', ip_addr.text))
+        
+        return {
+            "ping_test_success": ping_success,
+            "dns_test_success": dns_success,
+            "interface_count": interface_count
+        }
+    
+    def analyze_proxmox_virtualization(self) -> Dict[str, Any]:
+        """Analyze Proxmox virtualization data"""
+        
+        # Count VMs and containers
+        vm_count = len(self.parsed('qm_list', parse_qm_list)['guests'])
+        container_count = len(self.parsed('pct_list', parse_pct_list)['guests'])
+        
+        # pvecm status is collected on standalone nodes too; it fails there
+        pvecm = self.parsed('pvecm_status', parse_pvecm_status)
+        result = {
+            "vm_count": vm_count,
+            "container_count": container_count,
+            "cluster_available": pvecm['clustered']
+        }
+        if pvecm['clustered']:
+            result["cluster_name"] = pvecm['name']
+            result["quorate"] = pvecm['quorate']
+            result["cluster_nodes"] = pvecm['nodes']
+        
+        # Which guest is eating the host
+        host = self.metadata.get('hostname', 'unknown')
+        usage = self.guest_usage()
+        cpus = self.extract_value_after_colon('lscpu', 'CPU(s)')
+        totals = usage.rollup({host: self.extract_meminfo_value('MemTotal')},
+                              {host: int(cpus)} if cpus.isdigit() else None)[host]
+        guests = usage.records()
+        running = [guest for guest in guests if guest['status'] == 'running']
+        self.check_metric('guest_memory_overcommit_ratio', totals['memory_overcommit_ratio'],
+                          source_command="qm list; pct list",
+                          evidence=[f"{guest['type']} {guest['vmid']} {guest['name']}: {guest['memory_mb']} MB"
+                                    for guest in sorted(running, key=lambda g: -(g['memory_mb'] or 0))[:5]])
+        self.check_metric('guest_cpu_overcommit_ratio', totals['cpu_overcommit_ratio'],
+                          source_command="ps; qm list",
+                          evidence=[f"{guest['type']} {guest['vmid']} {guest['name']}: {guest['vcpus']} vCPUs"
+                                    for guest in sorted(running, key=lambda g: -(g['vcpus'] or 0))[:5]])
+        result["guests"] = guests
+        result["guest_totals"] = totals
+        return result
+    
+    def guest_usage(self) -> GuestUsage:
+        """Account CPU, memory and vCPUs to each VM and container of this host
+
+        Guest processes come from guest_processes (every kvm and lxc
+        process) or, in older snapshots, from the top CPU/memory process
+        lists. Containers are measured by their cgroup counters.
+        """
+        keys = ['guest_processes'] if 'guest_processes' in self.outputs else ['top_cpu', 'top_mem']
+        processes: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        for key in keys:
+            for process in self.parsed(key, parse_ps)['processes']:
+                if 'vmid' in process:
+                    # top_cpu and top_mem often list the same process; lxc-start and
+                    # the monitor both map to the container, keep the longest running
+                    guest = (process['guest_type'], process['vmid'])
+                    current = processes.get(guest)
+                    if current is None or (process.get('elapsed_seconds') or 0) > (current.get('elapsed_seconds') or 0):
+                        processes[guest] = process
+        cgroups = self.parsed('lxc_cgroups', parse_lxc_cgroups)['containers']
+        
+        usage = GuestUsage()
+        usage.start_host(self.metadata.get('hostname', 'unknown'))
+        for guest in self.parsed('qm_list', parse_qm_list)['guests']:
+            running = guest['status'] == 'running'
+            kvm = processes.get(('vm', guest['vmid']))
+            idle = None if running else 0
+            usage.add(guest['vmid'], 'vm', guest['name'], running,
+                      cpu_percent=kvm['cpu_percent'] if kvm else idle,
+                      vcpus=kvm['vcpus'] if kvm else None,
+                      rss_kb=kvm['rss_kb'] if kvm else idle,
+                      memory_kb=guest['memory_mb'] * 1024 if guest['memory_mb'] is not None else None,
+                      disk_gb=guest['disk_gb'])
+        for guest in self.parsed('pct_list', parse_pct_list)['guests']:
+            running = guest['status'] == 'running'
+            cgroup = cgroups.get(str(guest['vmid']), {})
+            elapsed = (processes.get(('ct', guest['vmid'])) or {}).get('elapsed_seconds')
+            idle = None if running else 0
+            cpu_percent = idle
+            if running and elapsed and 'cpu_usage_usec' in cgroup:
+                # Average since start, the same measure ps gives for kvm processes
+                cpu_percent = cgroup['cpu_usage_usec'] / 10000 / elapsed
+            usage.add(guest['vmid'], 'ct', guest['name'], running,
+                      cpu_percent=cpu_percent,
+                      vcpus=cgroup.get('cpus'),
+                      rss_kb=cgroup['memory_bytes'] // 1024 if 'memory_bytes' in cgroup else idle,
+                      memory_kb=cgroup['memory_max_bytes'] // 1024 if 'memory_max_bytes' in cgroup else None)
+        return usage
+    
+    def cluster_node(self) -> Dict[str, Any]:
+        """Facts of this node that the cluster view joins with the other nodes'"""
+        
+        guests = ([dict(guest, type='vm') for guest in self.parsed('qm_list', parse_qm_list)['guests']] +
+                  [dict(guest, type='ct') for guest in self.parsed('pct_list', parse_pct_list)['guests']])
+        cpus = self.extract_value_after_colon('lscpu', 'CPU(s)')
+        loadavg = self.output('loadavg').content_lines
+        try:
+            load_1min = float(loadavg[0].split()[0])
+        except (ValueError, IndexError):
+            load_1min = None
+        
+        return {
+            "host": self.metadata.get('hostname', 'unknown'),
+            "timestamp": self.metadata.get('timestamp', 'unknown'),
+            "cluster": {key: value for key, value in self.parsed('pvecm_status', parse_pvecm_status).items()
+                        if key != 'command'},
+            "guests": guests,
+            "memory": {
+                "total_kb": self.extract_meminfo_value('MemTotal'),
+                "available_kb": self.extract_meminfo_value('MemAvailable')
+            },
+            "cpu": {
+                "cpus": int(cpus) if cpus.isdigit() else None,
+                "load_1min": load_1min
+            },
+            "storage": self.parsed('pvesm_status', parse_pvesm_status)['storages'],
+            "guest_usage": self.guest_usage().to_columns()
+        }
+    
+    def analyze_performance_monitoring(self) -> Dict[str, Any]:
+        """Analyze performance monitoring data"""
+        
+        # Load average analysis
+        loadavg = self.output('loadavg')
+        load_1min = 0.0
+        
+        if loadavg:
+            try:
+                load_1min = float(loadavg.text.split()[0])
+                self.check_metric('load_average_1min', load_1min, source_command=loadavg.command,
+                                  evidence=[loadavg.text.strip()])
+            except (ValueError, IndexError):
+                pass
+        
+        # Uptime analysis
+        uptime_output = self.output('uptime')
+        uptime_days = 0
+        if 'days' in uptime_output:
+            try:
+                uptime_days = int(re.search(r'(\d+) days', uptime_output.text).group(1))
+            except (AttributeError, ValueError):
+                pass
+        
+        result = {
+            "load_average_1min": load_1min,
+            "uptime_days": uptime_days,
+            "disk_io": self.analyze_disk_io()
+        }
+        if self.output('samples'):
+            result["sampled"] = self.analyze_samples()
+        return result
+    
+    def analyze_samples(self) -> Dict[str, Any]:
+        """Peaks of the sampler's downsampled series over the last day"""
+        
+        parsed = self.parsed('samples', parse_samples)
+        summary = parsed['summary']
+        if not summary or not summary.get('start'):
+            return {"samples": summary.get('samples', 0) if summary else 0}
+        
+        def iso(timestamp: float) -> str:
+            return datetime.fromtimestamp(timestamp, UTC).isoformat(timespec='seconds').replace('+00:00', 'Z')
+        
+        starts = summary['start']
+        peaks = {}
+        for field, stats in summary['series'].items():
+            averages = [(value, index) for index, value in enumerate(stats['avg']) if value is not None]
+            if not averages:
+                continue
+            value, index = max(averages)
+            peaks[field] = {
+                "peak_average": value,
+                "peak_at": iso(starts[index]),
+                "peak_bucket": [stats[name][index] for name in ('min', 'avg', 'max', 'p99')],
+                "max": max(value for value in stats['max'] if value is not None)
+            }
+        for metric, field in SAMPLED_PEAK_METRICS.items():
+            peak = peaks.get(field)
+            if peak is not None:
+                evidence = [f"{peak['peak_at']} {field} min/avg/max/p99 "
+                            f"{'/'.join(str(value) for value in peak['peak_bucket'])} "
+                            f"over {summary['bucket_seconds']} s"]
+                self.check_metric(metric, peak['peak_average'], instance=peak['peak_at'],
+                                  source_command=parsed['command'], evidence=evidence)
+        
+        return {
+            "samples": summary['samples'],
+            "interval_seconds": summary['interval_seconds'],
+            "bucket_seconds": summary['bucket_seconds'],
+            "first_sample": iso(summary['first']),
+            "last_sample": iso(summary['last']),
+            "peaks": peaks,
+            "sampler": summary.get('sampler', {})
+        }
+    
+    def analyze_disk_io(self) -> Dict[str, Any]:
+        """Per-device disk load from iostat, plus rates since the previous snapshot from /proc/diskstats"""
+        
+        iostat_key = 'iostat_perf' if 'iostat_perf' in self.outputs else 'iostat'
+        iostat = self.parsed(iostat_key, parse_iostat)
+        diskstats_key = 'diskstats_perf' if 'diskstats_perf' in self.outputs else 'diskstats'
+        counters = self.parsed(diskstats_key, parse_diskstats)['devices']
+        rates = self.diskstats_rates(counters) if self.history is not None and counters else None
+        
+        # Checks use the last iostat interval; without iostat (no sysstat), the rates since the last snapshot
+        if iostat['devices']:
+            self.check_disk_load(iostat['devices'], self.output(iostat_key).command)
+        elif rates is not None:
+            self.check_disk_load(rates['devices'], f"{self.output(diskstats_key).command} (since {rates['since']})")
+        
+        return {
+            "iostat_interval": iostat['interval'],
+            "iowait_percent": iostat['iowait_percent'],
+            "devices": iostat['devices'],
+            "rates": rates,
+            "diskstats": counters,
+            "zfs_pools": self.parsed('zpool_iostat', parse_zpool_iostat)['pools']
+        }
+    
+    def diskstats_rates(self, counters: Dict[str, Dict[str, int]]) -> Optional[Dict[str, Any]]:
+        """Rates from the counter deltas against the host's previous snapshot in the history store"""
+        host = self.metadata.get('hostname', 'unknown')
+        now = parse_timestamp(self.metadata.get('timestamp'))
+        if now is None:
+            return None
+        # The current counters are recorded with the metrics, by MetricStore.ingest_report
+        previous = self.history.disk_counters.previous(host, now)
+        if previous is None:
+            return None
+        
+        since, before = previous
+        return {
+            "since": datetime.fromtimestamp(since, UTC).isoformat().replace('+00:00', 'Z'),
+            "seconds": now - since,
+            "devices": diskstats_rates(before, counters, now - since)
+        }
+    
+    def check_disk_load(self, devices: Dict[str, Dict[str, Optional[float]]], source_command: str):
+        """Flag saturated and slow physical disks, and disks much slower than their peers"""
+        physical = {name: device for name, device in sorted(devices.items()) if DISK_PHYSICAL_RE.match(name)}
+        for name, device in physical.items():
+            evidence = [disk_io_line(name, device)]
+            self.check_metric('disk_util_percent', device['util_percent'], instance=name,
+                              source_command=source_command, evidence=evidence)
+            self.check_metric('disk_await_ms', device['await_ms'], instance=name,
+                              source_command=source_command, evidence=evidence)
+        
+        # Members of one vdev see the same load, so one slow disk stands out against the others of its kind
+        peers: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for name, device in physical.items():
+            if device['await_ms'] is not None and \
+                    (device['reads_per_s'] or 0) + (device['writes_per_s'] or 0) >= DISK_ACTIVE_IOPS:
+                kind = DISK_PHYSICAL_RE.match(name)
+                peers[kind.group(kind.lastgroup)][name] = device['await_ms']
+        for group in peers.values():
+            for name, await_ms in group.items():
+                others = sorted(value for other, value in group.items() if other != name)
+                baseline = percentile(others, 50) if others else 0
+                if await_ms < DISK_OUTLIER_MIN_AWAIT_MS or baseline <= 0:
+                    continue
+                physical[name]['await_outlier_ratio'] = round(await_ms / baseline, 1)
+                self.check_metric('disk_await_outlier_ratio', physical[name]['await_outlier_ratio'], instance=name,
+                                  source_command=source_command,
+                                  evidence=[disk_io_line(peer, physical[peer]) for peer in group])
+    
+    def analyze_log_analysis(self) -> Dict[str, Any]:
+        """Analyze log data"""
+        
+        self.apply_rules('log_analysis')
+        recent_errors = self.count_non_header_lines('recent_errors')
+        boot_issues = self.count_non_header_lines('boot_issues')
+        kernel_issues = self.count_non_header_lines('kernel_issues')
+        
+        # Deduplicate journal/dmesg lines into message templates
+        miner = self.log_templates(*LOG_TEMPLATE_OUTPUTS)
+        host = self.metadata.get('hostname', 'unknown')
+        new_templates = miner.new_templates()
+        templates = {
+            "lines": miner.lines,
+            "template_count": sum(1 for template in miner.templates if template.outputs),
+            "top": [template.to_dict() for template in miner.top()]
+        }
+        if self.templates is not None:
+            # New only relative to a host with recorded templates
+            if self.templates.load(host):
+                templates["new_templates"] = [template.template for template in new_templates]
+                self.check_metric('new_log_templates', len(new_templates),
+                                  source_command="log templates",
+                                  evidence=[template.to_dict()['example'] for template in new_templates[:5]])
+            self.templates.record(host, self.metadata.get('timestamp', 'unknown'), miner.templates)
+        
+        result = {
+            "recent_errors_count": recent_errors,
+            "boot_issues_count": boot_issues,
+            "kernel_issues_count": kernel_issues,
+            "log_templates": templates
+        }
+        if self.output(JOURNAL_OUTPUT):
+            result["journal"] = self.analyze_journal()
+        return result
+    
+    def analyze_journal(self) -> Dict[str, Any]:
+        """Count structured journal records by priority and unit"""
+        
+        parsed = self.parsed(JOURNAL_OUTPUT, parse_journal_entries)
+        entries = parsed['entries']
+        host = self.metadata.get('hostname', 'unknown')
+        by_priority = defaultdict(int)
+        units = defaultdict(lambda: {"errors": 0, "warnings": 0})
+        critical = []
+        for entry in entries:
+            _, priority, unit, identifier, _ = entry
+            by_priority[JOURNAL_PRIORITIES[priority] if 0 <= priority < len(JOURNAL_PRIORITIES) else str(priority)] += 1
+            if priority <= JOURNAL_ERROR_PRIORITY:
+                units[unit or identifier or 'unknown']["errors"] += 1
+            elif priority == JOURNAL_ERROR_PRIORITY + 1:
+                units[unit or identifier or 'unknown']["warnings"] += 1
+            if priority <= JOURNAL_CRITICAL_PRIORITY:
+                critical.append(entry)
+        errors = sum(unit["errors"] for unit in units.values())
+        
+        self.check_metric('journal_critical_entries', len(critical), source_command=parsed['command'],
+                          evidence=[journal_line(entry, host) for entry in critical[-5:]])
+        self.check_metric('journal_error_entries', errors, source_command=parsed['command'],
+                          evidence=self.template_evidence(JOURNAL_OUTPUT, 5))
+        
+        top_units = sorted(units.items(), key=lambda item: (-item[1]["errors"], -item[1]["warnings"], item[0]))
+        first = last = None
+        if entries:
+            first, last = (datetime.fromtimestamp(entry[0], UTC).isoformat().replace('+00:00', 'Z')
+                           for entry in (entries[0], entries[-1]))
+        return {
+            "entries": len(entries),
+            "incremental": parsed['incremental'],
+            "first_entry": first,
+            "last_entry": last,
+            "by_priority": dict(by_priority),
+            "critical_entries": len(critical),
+            "error_entries": errors,
+            "units": dict(top_units[:JOURNAL_UNIT_REPORT]),
+            "invalid_lines": parsed['invalid']
+        }
+    
+    def analyze_security_updates(self) -> Dict[str, Any]:
+        """Analyze security and updates data"""
+        
+        # Updates, certificate and failed login issues come from the rules
+        self.apply_rules('security_updates')
+        upgradable = self.count_non_header_lines('apt_upgradable')
+        security_updates = self.count_non_header_lines('security_updates')
+        cert_valid = 'Certificate will not expire' in self.output('cert_check')
+        failed_logins = self.count_non_header_lines('failed_logins')
+        
+        return {
+            "upgradable_packages": upgradable,
+            "security_updates": security_updates,
+            "certificate_valid": cert_valid,
+            "failed_logins_count": failed_logins
+        }
+    
+    def analyze_trends(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Project filesystem, pool and memory usage from the host's metric history"""
+        
+        host = self.metadata.get('hostname', 'unknown')
+        now = parse_timestamp(self.metadata.get('timestamp')) or int(datetime.now(UTC).timestamp())
+        current = extract_metrics(analysis)
+        since = now - TREND_WINDOW_DAYS * 86400
+        
+        projections = []
+        for metric, value in sorted(current.items()):
+            prefix, _, instance = metric.partition(':')
+            if prefix not in TREND_METRICS:
+                continue
+            points = [p for p in self.history.query(host, metric, since, now) if p[0] != now]
+            points.append((now, value))
+            if len(points) < TREND_MIN_SAMPLES:
+                continue
+            
+            slope = linear_trend(points)
+            if slope <= 0:
+                continue
+            days_to_full = (100.0 - value) / slope
+            evidence = [f"{datetime.fromtimestamp(ts, UTC).strftime('%Y-%m-%d %H:%M')} {v:.1f}%"
+                        for ts, v in points[-5:]]
+            level = self.check_metric('days_until_full', days_to_full, instance=TREND_METRICS[prefix].format(instance),
+                                      source_command="metric history", evidence=evidence)
+            projections.append({
+                "metric": metric,
+                "current_percent": value,
+                "growth_percent_per_day": round(slope, 2),
+                "days_until_full": round(days_to_full, 1),
+                "severity": level.severity if level else None,
+                "samples": len(points)
+            })
+        
+        return {
+            "window_days": TREND_WINDOW_DAYS,
+            "projections": projections
+        }
+    
+    # Utility methods
+    def extract_first_line(self, output_key: str) -> str:
+        """Extract first non-header line from output"""
+        content_lines = self.output(output_key).content_lines
+        return content_lines[0] if content_lines else "unknown"
+    
+    def extract_value_after_colon(self, output_key: str, search_term: str) -> str:
+        """Extract value after colon for a given search term"""
+        for line in self.output(output_key).lines:
+            if search_term in line and ':' in line:
+                return line.split(':', 1)[1].strip()
+        return "unknown"
+    
+    def extract_meminfo_value(self, key: str) -> int:
+        """Extract memory value from meminfo output"""
+        for line in self.output('meminfo').lines:
+            if line.startswith(key):
+                try:
+                    return int(line.split()[1])
+                except (IndexError, ValueError):
+                    pass
+        return 0
+    
+    def count_non_header_lines(self, output_key: str) -> int:
+        """Count non-header lines in output"""
+        return self.parsed(output_key, summarize_lines)['count']
+    
+    def extract_command(self, output_key: str) -> str:
+        """Extract the actual command from the output header"""
+        return self.output(output_key).command
+
+def extract_metrics(analysis: Dict[str, Any]) -> Dict[str, float]:
+    """Extract the numeric point-in-time metrics tracked in the history store"""
+    
+    performance = analysis.get('performance_monitoring', {})
+    memory = analysis.get('hardware_health', {}).get('memory', {})
+    storage = analysis.get('storage_filesystem', {})
+    security = analysis.get('security_updates', {})
+    templates = analysis.get('log_analysis', {}).get('log_templates', {})
+    journal = analysis.get('log_analysis', {}).get('journal', {})
+    virtualization = analysis.get('proxmox_virtualization', {})
+    
+    metrics = {
+        "load_average_1min": performance.get('load_average_1min'),
+        "uptime_days": performance.get('uptime_days'),
+        "memory_usage_percent": memory.get('usage_percent') if memory.get('total_kb') else None,
+        "upgradable_packages": security.get('upgradable_packages'),
+        "security_updates": security.get('security_updates'),
+        "failed_logins_count": security.get('failed_logins_count'),
+        "new_log_templates": len(templates['new_templates']) if 'new_templates' in templates else None,
+        "journal_error_entries": journal.get('error_entries'),
+        "guest_memory_overcommit_ratio": virtualization.get('guest_totals', {}).get('memory_overcommit_ratio'),
+        "guest_cpu_overcommit_ratio": virtualization.get('guest_totals', {}).get('cpu_overcommit_ratio'),
+    }
+    usage = storage.get('filesystem_usage') or dict(storage.get('high_usage_filesystems', []))
+    for filesystem, percent in usage.items():
+        metrics[f"filesystem_usage_percent:{filesystem}"] = percent
+    for pool in storage.get('zfs_pools', []):
+        metrics[f"zfs_capacity_percent:{pool['name']}"] = pool['capacity_percent']
+    metrics["zfs_arc_hit_ratio_percent"] = storage.get('zfs_arc', {}).get('hit_ratio_percent')
+    for pool in storage.get('thin_pools', []):
+        metrics[f"thin_pool_data_percent:{pool['name']}"] = pool['data_percent']
+        metrics[f"thin_pool_metadata_percent:{pool['name']}"] = pool['metadata_percent']
+    for device, smart in storage.get('smart', {}).items():
+        metrics[f"smart_reallocated_sectors:{device}"] = smart.get('reallocated_sectors')
+        metrics[f"smart_pending_sectors:{device}"] = smart.get('pending_sectors')
+        metrics[f"nvme_percentage_used:{device}"] = smart.get('percentage_used')
+    for guest in virtualization.get('guests', []):
+        if guest['status'] == 'running':
+            metrics[f"guest_cpu_percent:{guest['vmid']}"] = guest['cpu_percent']
+            metrics[f"guest_rss_mb:{guest['vmid']}"] = guest['rss_mb']
+    disk_io = performance.get('disk_io', {})
+    # The last iostat interval, or without iostat the rates since the previous snapshot
+    devices = disk_io.get('devices') or (disk_io.get('rates') or {}).get('devices', {})
+    for device, load in devices.items():
+        if DISK_PHYSICAL_RE.match(device):
+            metrics[f"disk_util_percent:{device}"] = load['util_percent']
+            metrics[f"disk_await_ms:{device}"] = load['await_ms']
+    
+    return {name: float(value) for name, value in metrics.items() if value is not None}
+
+def diskstats_rates(before: Dict[str, Dict[str, float]], after: Dict[str, Dict[str, float]],
+                    seconds: float) -> Dict[str, Dict[str, float]]:
+    """Per-device I/O rates from two /proc/diskstats samples taken ``seconds`` apart
+
+    Devices whose counters went backwards (a reboot in between) are left out.
+    """
+    rates = {}
+    if seconds <= 0:
+        return rates
+    for name, counters in sorted(after.items()):
+        if name not in before:
+            continue
+        delta = {field: counters[field] - before[name][field] for field in DISKSTATS_COUNTERS}
+        if min(delta.values()) < 0:
+            continue
+        ios = delta['reads'] + delta['writes']
+        rates[name] = {
+            "reads_per_s": round(delta['reads'] / seconds, 2),
+            "writes_per_s": round(delta['writes'] / seconds, 2),
+            "read_kb_per_s": round(delta['read_sectors'] / 2 / seconds, 2),
+            "write_kb_per_s": round(delta['write_sectors'] / 2 / seconds, 2),
+            "await_ms": round((delta['read_ms'] + delta['write_ms']) / ios, 2) if ios else 0.0,
+            "queue_depth": round(delta['weighted_io_ms'] / 1000 / seconds, 2),
+            "util_percent": round(min(100.0, delta['io_ms'] / 10 / seconds), 1)
+        }
+    return rates
+
+def disk_io_line(name: str, device: Dict[str, Optional[float]]) -> str:
+    """One device's load as an evidence line"""
+    def cell(value: Optional[float]) -> str:
+        return f"{value:g}" if value is not None else "n/a"
+    return (f"{name}: {cell(device['reads_per_s'])} r/s, {cell(device['writes_per_s'])} w/s, "
+            f"await {cell(device['await_ms'])} ms, queue {cell(device['queue_depth'])}, "
+            f"{cell(device['util_percent'])}% util")
+
+def disk_io_table(devices: Dict[str, Dict[str, Optional[float]]]) -> List[str]:
+    """Markdown table of physical disks and of other devices with I/O"""
+    def cell(value: Optional[float], unit: str = '') -> str:
+        return f"{value:g}{unit}" if value is not None else "n/a"
+    lines = ["| Device | r/s | w/s | Read kB/s | Write kB/s | Await | Queue | Util |",
+             "| ------ | --- | --- | --------- | ---------- | ----- | ----- | ---- |"]
+    for name, device in sorted(devices.items()):
+        if not DISK_PHYSICAL_RE.match(name) and not (device['reads_per_s'] or device['writes_per_s']):
+            continue
+        util = device['util_percent']
+        util_emoji = "🔴" if (util or 0) > 90 else "🟠" if (util or 0) > 60 else "🟢"
+        lines.append(f"| {name} | {cell(device['reads_per_s'])} | {cell(device['writes_per_s'])} | "
+                     f"{cell(device['read_kb_per_s'])} | {cell(device['write_kb_per_s'])} | "
+                     f"{cell(device['await_ms'], ' ms')} | {cell(device['queue_depth'])} | "
+                     f"{util_emoji} {cell(util, '%')} |")
+    return lines
+
+def linear_trend(points: List[Tuple[int, float]]) -> float:
+    """Least-squares slope of (epoch seconds, value) points, in units per day"""
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in points)
+    if var_t == 0:
+        return 0.0
+    cov = sum((t - mean_t) * (v - mean_v) for t, v in points)
+    return cov / var_t * 86400
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class MetricSeries:
+    """Columnar, time-sorted samples of one metric"""
+
+    def __init__(self):
+        self.timestamps = array('q')
+        self.values = array('d')
+
+    def add(self, timestamp: int, value: float):
+        if not self.timestamps or timestamp >= self.timestamps[-1]:
+            self.timestamps.append(timestamp)
+            self.values.append(value)
+        else:
+            # Late arrivals (e.g. back-filling an archive) are inserted in order
+            index = bisect.bisect_right(self.timestamps, timestamp)
+            self.timestamps.insert(index, timestamp)
+            self.values.insert(index, value)
+
+    def range(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[int, int]:
+        """Index bounds of samples with start <= timestamp <= end"""
+        lo = 0 if start is None else bisect.bisect_left(self.timestamps, start)
+        hi = len(self.timestamps) if end is None else bisect.bisect_right(self.timestamps, end)
+        return lo, hi
+
+class MetricStore:
+    """Append-only per-host history of analyzer metrics
+
+    Every host has one ``<host>.tsdb`` file of fixed-width records
+    (epoch seconds, value, metric name). Files are only ever appended to;
+    on first use they are loaded into one columnar MetricSeries per metric
+    so range queries are a pair of binary searches. Names longer than the
+    record's name field are stored as '@' and a hash of the name, listed
+    in ``<host>.names`` with the full name.
+    """
+
+    RECORD = struct.Struct('<qd64s')
+    NAME_SIZE = 64
+    LONG_NAME_PREFIX = '@'
+
+    def __init__(self, root: str):
+        self.root = root
+        self.templates = TemplateStore(root)
+        self.disk_counters = DiskCounterStore(root)
+        self._cache: Dict[str, Dict[str, MetricSeries]] = {}
+
+    def _path(self, host: str, suffix: str = '.tsdb') -> str:
+        return os.path.join(self.root, re.sub(r'[^A-Za-z0-9_.-]', '_', host) + suffix)
+
+    def stored_name(self, metric: str) -> str:
+        """The name as written to the record: the metric itself, or '@<hash>' if it does not fit"""
+        if len(metric.encode('utf-8')) <= self.NAME_SIZE and not metric.startswith(self.LONG_NAME_PREFIX):
+            return metric
+        return self.LONG_NAME_PREFIX + hashlib.blake2b(metric.encode('utf-8'), digest_size=16).hexdigest()
+
+    def long_names(self, host: str) -> Dict[str, str]:
+        """Stored name -> full name of a host's long metric names"""
+        names = {}
+        try:
+            with open(self._path(host, '.names'), 'r', encoding='utf-8') as f:
+                for line in f:
+                    stored, sep, metric = line.rstrip('\n').partition('\t')
+                    if sep and line.endswith('\n'):
+                        names[stored] = metric
+        except FileNotFoundError:
+            pass
+        return names
+
+    def hosts(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.root) if name.endswith('.tsdb'))
+
+    def load(self, host: str) -> Dict[str, MetricSeries]:
+        """Load (and cache) all series of a host"""
+        if host in self._cache:
+            return self._cache[host]
+        series: Dict[str, MetricSeries] = {}
+        try:
+            with open(self._path(host), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        # Ignore a torn trailing record from an interrupted append
+        data = data[:len(data) - len(data) % self.RECORD.size]
+        long_names = self.long_names(host) if data else {}
+        for timestamp, value, name in self.RECORD.iter_unpack(data):
+            metric = name.rstrip(b'\0').decode('utf-8', 'replace')
+            metric = long_names.get(metric, metric)
+            series.setdefault(metric, MetricSeries()).add(timestamp, value)
+        self._cache[host] = series
+        return series
+
+    def metrics(self, host: str) -> List[str]:
+        return sorted(self.load(host))
+
+    def append(self, host: str, timestamp: int, metrics: Dict[str, float]) -> int:
+        """Append one sample per metric, skipping metrics already recorded at this timestamp"""
+        series = self.load(host)
+        records = []
+        new_names = []
+        for metric, value in sorted(metrics.items()):
+            existing = series.get(metric)
+            if existing is not None:
+                lo, hi = existing.range(timestamp, timestamp)
+                if hi > lo:
+                    continue
+            stored = self.stored_name(metric)
+            if stored != metric and existing is None:
+                new_names.append(f"{stored}\t{metric}\n")
+            records.append(self.RECORD.pack(timestamp, value, stored.encode('utf-8')))
+            series.setdefault(metric, MetricSeries()).add(timestamp, value)
+        if new_names:
+            os.makedirs(self.root, exist_ok=True)
+            # Names go first, so every stored '@<hash>' record can be resolved
+            with open(self._path(host, '.names'), 'a', encoding='utf-8') as f:
+                f.write(''.join(new_names))
+        if records:
+            os.makedirs(self.root, exist_ok=True)
+            # A single O_APPEND write keeps concurrent writers from interleaving records
+            with open(self._path(host), 'ab') as f:
+                f.write(b''.join(records))
+        return len(records)
+
+    def ingest_report(self, report: Dict[str, Any]) -> int:
+        """Record the metrics of an analysis report under its source host and timestamp
+
+        The report's diskstats counters go to the host's DiskCounterStore,
+        so the next snapshot gets I/O rates however this one was analyzed.
+        """
+        host = report['metadata'].get('source_hostname', 'unknown')
+        timestamp = (parse_timestamp(report['metadata'].get('source_timestamp'))
+                     or parse_timestamp(report['metadata'].get('analysis_timestamp')))
+        if timestamp is None:
+            return 0
+        counters = report['analysis'].get('performance_monitoring', {}).get('disk_io', {}).get('diskstats')
+        if counters:
+            self.disk_counters.record(host, timestamp, counters)
+        return self.append(host, timestamp, extract_metrics(report['analysis']))
+
+    def query(self, host: str, metric: str, start: Optional[int] = None,
+              end: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Samples of a metric with start <= timestamp <= end"""
+        series = self.load(host).get(metric)
+        if series is None:
+            return []
+        lo, hi = series.range(start, end)
+        return list(zip(series.timestamps[lo:hi], series.values[lo:hi]))
+
+    def aggregate(self, host: str, metric: str, window: int, start: Optional[int] = None,
+                  end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Min/max/mean/p95 of a metric per fixed window of ``window`` seconds"""
+        buckets: Dict[int, List[float]] = {}
+        for timestamp, value in self.query(host, metric, start, end):
+            bucket_start = timestamp - (timestamp - AGGREGATE_ORIGIN) % window
+            buckets.setdefault(bucket_start, []).append(value)
+        results = []
+        for bucket_start in sorted(buckets):
+            values = sorted(buckets[bucket_start])
+            results.append({
+                "window_start": datetime.fromtimestamp(bucket_start, UTC).isoformat().replace('+00:00', 'Z'),
+                "count": len(values),
+                "min": values[0],
+                "max": values[-1],
+                "mean": round(sum(values) / len(values), 3),
+                "p95": percentile(values, 95)
+            })
+        return results
+
+def log_time_key(value: str) -> Tuple[int, Any]:
+    """Sort key for the line times of LogTemplate (journal short/ISO time or boot offset)"""
+    if value.startswith('boot+'):
+        return (0, float(value[5:-1]))
+    if value[:3] in LOG_MONTHS:
+        return (1, (LOG_MONTHS[value[:3]], value[4:]))
+    return (2, value)
+
+class LogTemplate:
+    """One cluster of log messages: its template and where it was seen"""
+
+    __slots__ = ('source', 'tokens', 'origin', 'outputs')
+
+    def __init__(self, source: str, tokens: List[str], origin: Optional[str] = None):
+        self.source = source
+        self.tokens = tokens
+        # Stored template this cluster was seeded from (None for new ones)
+        self.origin = origin
+        # output key -> [lines, first time, last time, first line]
+        self.outputs: Dict[str, List[Any]] = {}
+
+    @property
+    def template(self) -> str:
+        text = ' '.join(self.tokens)
+        return f"{self.source}: {text}" if self.source else text
+
+    @property
+    def count(self) -> int:
+        return sum(stats[0] for stats in self.outputs.values())
+
+    def seen(self) -> Tuple[str, str]:
+        """First and last line time across all outputs"""
+        times = [stats[1] for stats in self.outputs.values() if stats[1]]
+        last_times = [stats[2] for stats in self.outputs.values() if stats[2]]
+        return (min(times, key=log_time_key) if times else '',
+                max(last_times, key=log_time_key) if last_times else '')
+
+    def to_dict(self) -> Dict[str, Any]:
+        first, last = self.seen()
+        return {
+            "template": self.template,
+            "count": self.count,
+            "outputs": {key: stats[0] for key, stats in self.outputs.items()},
+            "first_seen": first,
+            "last_seen": last,
+            "example": next(iter(self.outputs.values()))[3],
+            "new": self.origin is None
+        }
+
+class LogTemplateMiner:
+    """Streaming Drain-style template miner for journal and dmesg lines
+
+    Each line is split into time, source (process name without PID) and
+    message. Messages are masked (UUIDs, MACs, IPs, hex values, device
+    names, numbers) and routed through a prefix tree keyed by source,
+    token count and the first LOG_TEMPLATE_DEPTH tokens. In the leaf the
+    most similar template absorbs the message if at least
+    LOG_TEMPLATE_SIMILARITY of its tokens match, turning differing tokens
+    into <*>; otherwise the message starts a new template. Messages seen
+    before verbatim are resolved from a dict without masking, which is
+    what keeps flapping logs (the same few messages over and over) fast.
+    A message that only differs in its digits from one seen before
+    ('nas0' and 'nas1', or two counter values) reuses that message's
+    template. Only the tokens that differ are masked, and the template
+    turns those into <*> unless the masks map them to the same token.
+    """
+
+    def __init__(self, similarity: float = LOG_TEMPLATE_SIMILARITY, depth: int = LOG_TEMPLATE_DEPTH,
+                 max_children: int = LOG_TEMPLATE_MAX_CHILDREN):
+        self.similarity = similarity
+        self.depth = depth
+        self.max_children = max_children
+        self.templates: List[LogTemplate] = []
+        self.lines = 0
+        self._tree: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._message_cache: Dict[Tuple[str, str], LogTemplate] = {}
+        # digits-as-0 message -> (template, tokens of the first message seen)
+        self._digit_cache: Dict[Tuple[str, str], Tuple[LogTemplate, List[str]]] = {}
+        self._masked_cache: Dict[Tuple[str, str], LogTemplate] = {}
+        self._token_cache: Dict[str, str] = {}
+
+    def seed(self, stored: Dict[str, Dict[str, Any]]):
+        """Add templates seen in earlier snapshots, so matching lines are not new"""
+        for template, entry in stored.items():
+            source = entry.get('source', '')
+            text = template[len(source) + 2:] if source else template
+            cluster = LogTemplate(source, text.split(), origin=template)
+            self._leaf(source, cluster.tokens).append(cluster)
+            self.templates.append(cluster)
+
+    def _leaf(self, source: str, tokens: List[str]) -> List[LogTemplate]:
+        node = self._tree.setdefault((source, len(tokens)), {})
+        for token in tokens[:self.depth]:
+            if any(char.isdigit() for char in token):
+                token = '<*>'
+            child = node.get(token)
+            if child is None:
+                if len(node) >= self.max_children:
+                    token = '<*>'
+                child = node.setdefault(token, {})
+            node = child
+        return node.setdefault('', [])
+
+    @staticmethod
+    def _mask(text: str) -> str:
+        for regex, placeholder in LOG_MASKS:
+            text = regex.sub(placeholder, text)
+        return text
+
+    def _generalize(self, cluster: LogTemplate, seen: List[str], tokens: List[str]) -> bool:
+        """Widen a template for a message that differs from an earlier one only in digits
+
+        Returns False if the tokens do not line up with the template.
+        """
+        if len(tokens) != len(cluster.tokens) or len(tokens) != len(seen):
+            return False
+        template = cluster.tokens
+        token_cache = self._token_cache
+        for index, (before, token) in enumerate(zip(seen, tokens)):
+            if before != token and template[index] != '<*>':
+                if token.isdigit() and template[index] == '<num>':
+                    continue
+                masked = token_cache.get(token)
+                if masked is None:
+                    masked = token_cache[token] = self._mask(token)
+                if masked != template[index]:
+                    template[index] = '<*>'
+        return True
+
+    def _match(self, source: str, message: str) -> LogTemplate:
+        """Template for one message, creating or generalizing one if needed"""
+        masked = self._mask(message)
+        cluster = self._masked_cache.get((source, masked))
+        if cluster is not None:
+            return cluster
+        
+        tokens = masked.split()
+        leaf = self._leaf(source, tokens)
+        best, best_score = None, (-1.0, -1)
+        for candidate in leaf:
+            same = params = 0
+            for template_token, token in zip(candidate.tokens, tokens):
+                if template_token == '<*>':
+                    params += 1
+                elif template_token == token:
+                    same += 1
+            score = (same / len(tokens) if tokens else 1.0, params)
+            if score > best_score:
+                best, best_score = candidate, score
+        if best is not None and best_score[0] >= self.similarity:
+            best.tokens = [t if t == token else '<*>' for t, token in zip(best.tokens, tokens)]
+            cluster = best
+        else:
+            cluster = LogTemplate(source, tokens)
+            leaf.append(cluster)
+            self.templates.append(cluster)
+        self._masked_cache[(source, masked)] = cluster
+        return cluster
+
+    def add_output(self, key: str, text: str):
+        """Cluster every log line of one output in a single pass"""
+        message_cache = self._message_cache
+        digit_cache = self._digit_cache
+        lines = 0
+        for match in LOG_LINE_RE.finditer(text):
+            time_text, source, uptime, message = match.groups()
+            if not message or message.startswith(('===', '-- ')):
+                continue
+            if time_text is None:
+                source = 'kernel' if uptime is not None else ''
+                time_text = f"boot+{uptime}s" if uptime is not None else ''
+            cluster = message_cache.get((source, message))
+            if cluster is None:
+                if len(message_cache) >= LOG_TEMPLATE_CACHE_SIZE:
+                    message_cache.clear()
+                    digit_cache.clear()
+                    self._token_cache.clear()
+                digit_key = (source, message.translate(LOG_DIGITS))
+                cached = digit_cache.get(digit_key)
+                tokens = message.split()
+                if cached is None or not self._generalize(cached[0], cached[1], tokens):
+                    cluster = self._match(source, message)
+                    digit_cache[digit_key] = (cluster, tokens)
+                else:
+                    cluster = cached[0]
+                message_cache[(source, message)] = cluster
+            stats = cluster.outputs.get(key)
+            if stats is None:
+                cluster.outputs[key] = [1, time_text, time_text, match.group().strip()]
+            else:
+                stats[0] += 1
+                stats[2] = time_text
+            lines += 1
+        self.lines += lines
+
+    def top(self, key: Optional[str] = None, limit: int = LOG_TEMPLATE_REPORT) -> List[LogTemplate]:
+        """Most frequent templates (of one output, or overall)"""
+        if key is None:
+            seen = [t for t in self.templates if t.outputs]
+            return sorted(seen, key=lambda t: -t.count)[:limit]
+        seen = [t for t in self.templates if key in t.outputs]
+        return sorted(seen, key=lambda t: -t.outputs[key][0])[:limit]
+
+    def new_templates(self) -> List[LogTemplate]:
+        return [t for t in self.templates if t.outputs and t.origin is None]
+
+class TemplateStore:
+    """Log templates seen per host, kept next to the metric history
+
+    Every host has a ``<host>.templates.json`` mapping each template to the
+    first and last snapshot it appeared in, the number of snapshots and of
+    lines. Updates re-read the file under an exclusive lock and replace it,
+    so concurrent writers (watch workers) merge instead of overwriting.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, host: str) -> str:
+        return os.path.join(self.root, re.sub(r'[^A-Za-z0-9_.-]', '_', host) + '.templates.json')
+
+    def load(self, host: str) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self._path(host), 'r') as f:
+                return json.load(f).get('templates', {})
+        except FileNotFoundError:
+            return {}
+
+    def record(self, host: str, timestamp: str, templates: List[LogTemplate]):
+        """Merge the templates of one snapshot into the host's file"""
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(host)
+        with open(path[:-len('.json')] + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stored = self.load(host)
+            for cluster in templates:
+                if not cluster.outputs:
+                    continue
+                entry = stored.get(cluster.template)
+                if cluster.origin is not None and cluster.origin != cluster.template:
+                    # The template was generalized; carry its history over
+                    entry = stored.pop(cluster.origin, entry)
+                if entry is None:
+                    entry = {"source": cluster.source, "first_seen": timestamp, "last_seen": timestamp,
+                             "snapshots": 0, "lines": 0}
+                elif entry['last_seen'] == timestamp:
+                    # Re-analysis of a snapshot already recorded
+                    stored[cluster.template] = entry
+                    continue
+                entry['first_seen'] = min(entry['first_seen'], timestamp)
+                entry['last_seen'] = max(entry['last_seen'], timestamp)
+                entry['snapshots'] += 1
+                entry['lines'] += cluster.count
+                stored[cluster.template] = entry
+            if len(stored) > LOG_TEMPLATE_LIMIT:
+                recent = sorted(stored.items(), key=lambda item: item[1]['last_seen'], reverse=True)
+                stored = dict(recent[:LOG_TEMPLATE_LIMIT])
+            with open(path + '.partial', 'w') as f:
+                json.dump({"templates": stored}, f, indent=1)
+            os.replace(path + '.partial', path)
+
+class DiskCounterStore:
+    """Raw /proc/diskstats counters of a host's recent snapshots, kept next to the metric history
+
+    They are only needed for the I/O rates since the previous snapshot,
+    so they stay out of the metric history: ``<host>.diskstats.json``
+    holds the counters of the last DISKSTATS_STATE_SAMPLES snapshots by
+    collection time. Updates lock and replace the file like TemplateStore.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, host: str) -> str:
+        return os.path.join(self.root, re.sub(r'[^A-Za-z0-9_.-]', '_', host) + '.diskstats.json')
+
+    def load(self, host: str) -> Dict[int, Dict[str, Dict[str, int]]]:
+        try:
+            with open(self._path(host), 'r') as f:
+                return {int(timestamp): counters for timestamp, counters in json.load(f).get('samples', {}).items()}
+        except FileNotFoundError:
+            return {}
+
+    def previous(self, host: str, timestamp: int) -> Optional[Tuple[int, Dict[str, Dict[str, int]]]]:
+        """The newest counters collected before timestamp, with their collection time"""
+        samples = self.load(host)
+        earlier = [sample_time for sample_time in samples if sample_time < timestamp]
+        if not earlier:
+            return None
+        return max(earlier), samples[max(earlier)]
+
+    def record(self, host: str, timestamp: int, counters: Dict[str, Dict[str, int]]):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(host)
+        with open(path[:-len('.json')] + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            samples = self.load(host)
+            samples[timestamp] = counters
+            kept = sorted(samples)[-DISKSTATS_STATE_SAMPLES:]
+            with open(path + '.partial', 'w') as f:
+                json.dump({"samples": {str(sample_time): samples[sample_time] for sample_time in kept}}, f)
+            os.replace(path + '.partial', path)
+
+def select_modules(only: Optional[List[str]] = None, skip: Optional[List[str]] = None) -> List[str]:
+    """Analysis modules to run, in report order"""
+    return [module for module in ANALYSIS_MODULES
+            if (only is None or module in only) and module not in (skip or [])]
+
+def module_outputs(modules: List[str], rules: RuleSet) -> Optional[Callable[[str], bool]]:
+    """Predicate accepting the raw outputs the modules read, or None when all modules run"""
+    if len(modules) == len(ANALYSIS_MODULES):
+        return None
+    keys = set()
+    prefixes = []
+    for module in modules:
+        for pattern in ANALYSIS_MODULES[module] + tuple(key for rule in rules.sections.get(module, [])
+                                                        for key in rule.outputs):
+            if pattern.endswith('*'):
+                prefixes.append(pattern[:-1])
+            else:
+                keys.add(pattern)
+    prefixes = tuple(prefixes)
+    return lambda key: key in keys or key.startswith(prefixes)
+
+def issue_fingerprint(issue: Dict[str, Any]) -> str:
+    """Identity of an issue across snapshots: category plus message with numbers masked"""
+    message = NUMBER_RE.sub('#', issue['message'])
+    return f"{issue['category']}:{message}"
+
+def diff_issues(before: List[Dict[str, Any]], after: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Split issues into new, resolved, changed and unchanged by fingerprint"""
+    pending = defaultdict(list)
+    for issue in before:
+        pending[issue_fingerprint(issue)].append(issue)
+    
+    delta: Dict[str, List[Dict[str, Any]]] = {"new": [], "resolved": [], "changed": [], "unchanged": []}
+    for issue in after:
+        candidates = pending.get(issue_fingerprint(issue))
+        if not candidates:
+            delta["new"].append(issue)
+            continue
+        previous = candidates.pop(0)
+        if previous['message'] == issue['message'] and previous['severity'] == issue['severity']:
+            delta["unchanged"].append(issue)
+        else:
+            delta["changed"].append(dict(issue, previous_message=previous['message'],
+                                         previous_severity=previous['severity']))
+    for remaining in pending.values():
+        delta["resolved"].extend(remaining)
+    return delta
+
+def diff_metrics(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Dict[str, Optional[float]]]:
+    """Before/after values of every metric that differs between two analyses"""
+    before_metrics = extract_metrics(before)
+    after_metrics = extract_metrics(after)
+    delta = {}
+    for metric in sorted(set(before_metrics) | set(after_metrics)):
+        old = before_metrics.get(metric)
+        new = after_metrics.get(metric)
+        if old == new:
+            continue
+        delta[metric] = {
+            "before": old,
+            "after": new,
+            "delta": round(new - old, 3) if old is not None and new is not None else None
+        }
+    return delta
+
+def diff_lines(before: List[str], after: List[str], context: int = 3) -> List[str]:
+    """Unified diff of two line lists
+
+    Lines are interned to integer ids first so matching compares ints, and
+    the common prefix/suffix is trimmed before SequenceMatcher sees the
+    remaining, usually small, changed region.
+    """
+    ids: Dict[str, int] = {}
+    a = [ids.setdefault(line, len(ids)) for line in before]
+    b = [ids.setdefault(line, len(ids)) for line in after]
+    
+    prefix = 0
+    limit = min(len(a), len(b))
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+    if prefix == len(a) == len(b):
+        return []
+    
+    start = max(0, prefix - context)
+    a_mid = a[start:len(a) - max(0, suffix - context)]
+    b_mid = b[start:len(b) - max(0, suffix - context)]
+    matcher = difflib.SequenceMatcher(None, a_mid, b_mid, autojunk=False)
+    
+    hunks = []
+    for group in matcher.get_grouped_opcodes(context):
+        a1, a2 = group[0][1] + start, group[-1][2] + start
+        b1, b2 = group[0][3] + start, group[-1][4] + start
+        hunks.append(f"@@ -{a1 + 1},{a2 - a1} +{b1 + 1},{b2 - b1} @@")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                hunks.extend(' ' + line for line in before[start + i1:start + i2])
+                continue
+            hunks.extend('-' + line for line in before[start + i1:start + i2])
+            hunks.extend('+' + line for line in after[start + j1:start + j2])
+    return hunks
+
+def diff_raw_outputs(before: Dict[str, Any], after: Dict[str, Any], context: int = 3) -> Dict[str, Any]:
+    """Added, removed and line-diffed changed raw outputs"""
+    changed = {}
+    for key in sorted(set(before) & set(after)):
+        old = CommandOutput(key, before[key])
+        new = CommandOutput(key, after[key])
+        if old.text != new.text:
+            hunks = diff_lines(old.lines, new.lines, context)
+            if hunks:
+                changed[key] = hunks
+    return {
+        "added": sorted(set(after) - set(before)),
+        "removed": sorted(set(before) - set(after)),
+        "changed": changed
+    }
+
+def diff_snapshots(before_data: Dict[str, Any], after_data: Dict[str, Any], context: int = 3,
+                   include_raw: bool = True, parse_cache: Optional[ParseCache] = None,
+                   rules: Optional[RuleSet] = None) -> Dict[str, Any]:
+    """Compare two collector snapshots at the issue, metric and raw output level"""
+    before = ProxmoxAnalyzer(before_data, parse_cache=parse_cache, rules=rules).analyze_all()
+    after = ProxmoxAnalyzer(after_data, parse_cache=parse_cache, rules=rules).analyze_all()
+    
+    issues = diff_issues(before['issues'], after['issues'])
+    result = {
+        "metadata": {
+            "before_hostname": before['metadata']['source_hostname'],
+            "before_timestamp": before['metadata']['source_timestamp'],
+            "after_hostname": after['metadata']['source_hostname'],
+            "after_timestamp": after['metadata']['source_timestamp'],
+            "before_health": before['summary']['overall_health'],
+            "after_health": after['summary']['overall_health']
+        },
+        "summary": {name: len(entries) for name, entries in issues.items()},
+        "issues": issues,
+        "metrics": diff_metrics(before['analysis'], after['analysis'])
+    }
+    before_time = parse_timestamp(before['metadata']['source_timestamp'])
+    after_time = parse_timestamp(after['metadata']['source_timestamp'])
+    if before_time is not None and after_time is not None and after_time > before_time:
+        counters = [report['analysis']['performance_monitoring']['disk_io']['diskstats'] for report in (before, after)]
+        rates = diskstats_rates(counters[0], counters[1], after_time - before_time)
+        if rates:
+            result["disk_io"] = {"seconds": after_time - before_time, "devices": rates}
+    if include_raw:
+        result["raw_outputs"] = diff_raw_outputs(before_data.get('raw_outputs', {}),
+                                                 after_data.get('raw_outputs', {}), context)
+    return result
+
+class ClusterAnalyzer(IssueReporter):
+    """Joined view over the latest snapshot of every node
+
+    Works on the compact facts ProxmoxAnalyzer.cluster_node() extracts, so
+    the join is linear in nodes and guests; the per-node analyses before
+    it run in parallel.
+    """
+
+    def __init__(self, nodes: List[Dict[str, Any]], rules: Optional[RuleSet] = None):
+        self.nodes = sorted(nodes, key=lambda node: node['host'])
+        self.rules = rules or load_rules()
+        self.issues: List[HealthIssue] = []
+
+    def analyze(self) -> Dict[str, Any]:
+        """Run the cross-node checks and return the cluster report"""
+        quorum = self.analyze_quorum()
+        nodes = self.analyze_nodes()
+        guests = self.analyze_guests()
+        storage = self.analyze_storage()
+
+        timestamps = [parse_timestamp(node['timestamp']) for node in self.nodes]
+        timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+        if len(timestamps) > 1:
+            self.check_metric('cluster_snapshot_spread_hours', (max(timestamps) - min(timestamps)) / 3600,
+                              source_command="snapshot metadata",
+                              evidence=[f"{node['host']}: {node['timestamp']}" for node in self.nodes])
+
+        return {
+            "metadata": {
+                "analyzer_version": "1.0.0",
+                "analysis_timestamp": datetime.now(UTC).isoformat().replace('+00:00', 'Z'),
+                "cluster_names": quorum['cluster_names'],
+                "node_count": len(self.nodes),
+                "snapshots": [{"host": node['host'], "file": node.get('file'), "timestamp": node['timestamp']}
+                              for node in self.nodes]
+            },
+            "cluster": {
+                "quorum": quorum,
+                "nodes": nodes,
+                "guests": guests,
+                "storage": storage
+            },
+            "summary": self.summarize(self.generate_recommendations()),
+            "issues": self.issue_records()
+        }
+
+    def analyze_quorum(self) -> Dict[str, Any]:
+        """Compare corosync membership and quorum as each node sees it"""
+        views: Dict[Tuple[Optional[str], Optional[int], Tuple[str, ...]], List[str]] = defaultdict(list)
+        standalone = []
+        not_quorate = []
+        local_addresses = set()
+        member_addresses = set()
+        missing_votes = 0
+        for node in self.nodes:
+            cluster = node['cluster']
+            if not cluster['clustered']:
+                standalone.append(node['host'])
+                continue
+            members = tuple(sorted(member['address'] for member in cluster['members']))
+            views[(cluster['name'], cluster['config_version'], members)].append(node['host'])
+            member_addresses.update(members)
+            local_addresses.update(member['address'] for member in cluster['members'] if member['local'])
+            if cluster['quorate'] is False:
+                not_quorate.append(node['host'])
+            if cluster['expected_votes'] is not None and cluster['total_votes'] is not None:
+                missing_votes = max(missing_votes, cluster['expected_votes'] - cluster['total_votes'])
+
+        # Members are listed by address; a node's own entry is marked (local)
+        without_snapshot = sorted(member_addresses - local_addresses)
+        if views:
+            view_evidence = [f"{', '.join(hosts)}: {name} config version {version}, members {' '.join(members)}"
+                             for (name, version, members), hosts in views.items()]
+            if standalone:
+                view_evidence.append(f"{', '.join(standalone)}: not in a cluster")
+            self.check_metric('cluster_membership_views', len(views) + bool(standalone),
+                              source_command="pvecm status", evidence=view_evidence)
+            self.check_metric('cluster_not_quorate_nodes', len(not_quorate), source_command="pvecm status",
+                              evidence=[f"{host}: Quorate: No" for host in not_quorate])
+            self.check_metric('cluster_missing_votes', missing_votes, source_command="pvecm status",
+                              evidence=[f"{node['host']}: {node['cluster']['total_votes']} of "
+                                        f"{node['cluster']['expected_votes']} expected votes"
+                                        for node in self.nodes if node['cluster']['clustered']])
+            self.check_metric('cluster_nodes_without_snapshot', len(without_snapshot),
+                              source_command="pvecm status", evidence=without_snapshot)
+
+        return {
+            "cluster_names": sorted({name for name, _, _ in views if name}),
+            "views": [{"name": name, "config_version": version, "members": list(members), "nodes": hosts}
+                      for (name, version, members), hosts in views.items()],
+            "standalone_nodes": standalone,
+            "not_quorate_nodes": not_quorate,
+            "missing_votes": missing_votes,
+            "members_without_snapshot": without_snapshot
+        }
+
+    def analyze_nodes(self) -> Dict[str, Dict[str, Any]]:
+        """Per-node guest placement and memory/CPU headroom, plus an N-1 failover check"""
+        usage = GuestUsage()
+        for node in self.nodes:
+            usage.extend(GuestUsage.from_columns(node['guest_usage']))
+        guest_totals = usage.rollup({node['host']: node['memory']['total_kb'] for node in self.nodes},
+                                    {node['host']: node['cpu']['cpus'] for node in self.nodes})
+        nodes = {}
+        for node in self.nodes:
+            memory = node['memory']
+            cpu = node['cpu']
+            guests = node['guests']
+            sized = bool(memory['total_kb'] and memory['available_kb'])
+            nodes[node['host']] = {
+                "snapshot_timestamp": node['timestamp'],
+                "health": node['health']['overall_health'],
+                "critical_issues": node['health']['critical_issues'],
+                "warning_issues": node['health']['warning_issues'],
+                "vms": sum(1 for guest in guests if guest['type'] == 'vm'),
+                "containers": sum(1 for guest in guests if guest['type'] == 'ct'),
+                "running_guests": sum(1 for guest in guests if guest['status'] == 'running'),
+                "memory_total_kb": memory['total_kb'],
+                "memory_available_kb": memory['available_kb'],
+                "memory_usage_percent": round((memory['total_kb'] - memory['available_kb']) /
+                                              memory['total_kb'] * 100, 1) if sized else None,
+                # Configured memory of running VMs; pct list does not show container memory
+                "running_vm_memory_mb": sum(guest['memory_mb'] or 0 for guest in guests
+                                            if guest['type'] == 'vm' and guest['status'] == 'running'),
+                "cpus": cpu['cpus'],
+                "load_1min": cpu['load_1min'],
+                "cpu_headroom": round(cpu['cpus'] - cpu['load_1min'], 2)
+                                if cpu['cpus'] is not None and cpu['load_1min'] is not None else None,
+                "guest_cpu_percent": guest_totals[node['host']]['cpu_percent'],
+                "guest_rss_kb": guest_totals[node['host']]['rss_kb'],
+                "memory_overcommit_ratio": guest_totals[node['host']]['memory_overcommit_ratio'],
+                "cpu_overcommit_ratio": guest_totals[node['host']]['cpu_overcommit_ratio'],
+                "failover_memory_percent": None
+            }
+
+        # Could the other nodes take over the running VMs of any single node?
+        sized = {host: entry for host, entry in nodes.items() if entry['memory_usage_percent'] is not None}
+        if len(sized) > 1:
+            total_kb = sum(entry['memory_total_kb'] for entry in sized.values())
+            used_kb = sum(entry['memory_total_kb'] - entry['memory_available_kb'] for entry in sized.values())
+            worst = None
+            for host, entry in sized.items():
+                others_total = total_kb - entry['memory_total_kb']
+                others_used = used_kb - (entry['memory_total_kb'] - entry['memory_available_kb'])
+                percent = (others_used + entry['running_vm_memory_mb'] * 1024) / others_total * 100
+                entry['failover_memory_percent'] = round(percent, 1)
+                if worst is None or percent > worst[1]:
+                    worst = (host, percent)
+            self.check_metric('cluster_failover_memory_percent', worst[1], instance=worst[0],
+                              source_command="cat /proc/meminfo; qm list",
+                              evidence=[f"{host}: {entry['memory_usage_percent']}% memory used, "
+                                        f"{entry['running_vm_memory_mb']} MB in running VMs"
+                                        for host, entry in sized.items()])
+        return nodes
+
+    def analyze_guests(self) -> Dict[str, Any]:
+        """Guest placement across nodes and VMIDs in use on more than one node"""
+        by_vmid: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for node in self.nodes:
+            for guest in node['guests']:
+                by_vmid[guest['vmid']].append({"host": node['host'], "type": guest['type'],
+                                               "name": guest['name'], "status": guest['status']})
+        duplicates = {str(vmid): entries for vmid, entries in sorted(by_vmid.items()) if len(entries) > 1}
+        self.check_metric('cluster_duplicate_vmids', len(duplicates), source_command="qm list; pct list",
+                          evidence=[f"VMID {vmid}: " + ', '.join(f"{entry['type']} {entry['name']} on {entry['host']}"
+                                                                for entry in entries)
+                                    for vmid, entries in list(duplicates.items())[:5]])
+        guests = [dict(vmid=vmid, **entry) for vmid, entries in sorted(by_vmid.items()) for entry in entries]
+        return {
+            "total": len(guests),
+            "running": sum(1 for guest in guests if guest['status'] == 'running'),
+            "duplicate_vmids": duplicates,
+            "placement": guests
+        }
+
+    def analyze_storage(self) -> Dict[str, Dict[str, Any]]:
+        """Storage status and usage per pvesm storage across the nodes that list it"""
+        storages: Dict[str, Dict[str, Any]] = {}
+        for node in self.nodes:
+            for storage in node['storage']:
+                entry = storages.setdefault(storage['name'], {
+                    "type": storage['type'],
+                    "shared": storage['type'] in SHARED_STORAGE_TYPES,
+                    "usage_percent": None,
+                    "nodes": {}
+                })
+                entry['nodes'][node['host']] = {key: storage[key] for key in
+                                                ('status', 'total_kb', 'used_kb', 'available_kb', 'usage_percent')}
+
+        for name, entry in sorted(storages.items()):
+            unavailable = [host for host, usage in entry['nodes'].items()
+                           if usage['status'] not in ('active', 'disabled')]
+            self.check_metric('cluster_storage_unavailable', len(unavailable), instance=name,
+                              source_command="pvesm status",
+                              evidence=[f"{host}: {entry['nodes'][host]['status']}" for host in unavailable])
+            active = {host: usage for host, usage in entry['nodes'].items()
+                      if usage['status'] == 'active' and usage['usage_percent'] is not None}
+            if not active:
+                continue
+            if entry['shared']:
+                # Every node reports the same store; trust the fullest report
+                host, usage = max(active.items(), key=lambda item: item[1]['usage_percent'])
+                entry['usage_percent'] = usage['usage_percent']
+                self.check_metric('cluster_storage_usage_percent', usage['usage_percent'], instance=name,
+                                  source_command="pvesm status",
+                                  evidence=[f"{host}: {usage['used_kb']} of {usage['total_kb']} KiB used"])
+            else:
+                for host, usage in active.items():
+                    self.check_metric('cluster_storage_usage_percent', usage['usage_percent'],
+                                      instance=f"{name} on {host}", source_command="pvesm status",
+                                      evidence=[f"{host}: {usage['used_kb']} of {usage['total_kb']} KiB used"])
+                total_kb = sum(usage['total_kb'] for usage in active.values())
+                used_kb = sum(usage['used_kb'] for usage in active.values())
+                entry['usage_percent'] = round(used_kb / total_kb * 100, 2)
+        return dict(sorted(storages.items()))
+
+def generate_markdown_report(report: Dict[str, Any]) -> str:
+    """Generate a comprehensive markdown report from the analysis results"""
+    
+    # Extract metadata
+    hostname = report['metadata']['source_hostname']
+    timestamp = report['metadata']['analysis_timestamp']
+    analyzer_version = report['metadata']['analyzer_version']
+    
+    # Extract summary data
+    overall_health = report['summary']['overall_health'].upper()
+    critical_issues = report['summary']['critical_issues']
+    warning_issues = report['summary']['warning_issues']
+    info_issues = report['summary']['info_issues']
+    total_issues = critical_issues + warning_issues + info_issues
+    
+    # Health status emoji
+    health_emoji = "🔴" if overall_health == "CRITICAL" else "🟠" if overall_health == "WARNING" else "🟢"
+    
+    # Start building markdown
+    md = []
+    
+    # Title and metadata
+    md.append(f"# Proxmox Health Check Report: {hostname} {health_emoji}")
+    md.append(f"")
+    md.append(f"**Generated:** {timestamp}")
+    md.append(f"**Analyzer Version:** {analyzer_version}")
+    md.append(f"**Overall Health:** {overall_health}")
+    if 'modules' in report['metadata']:
+        md.append(f"**Modules:** {', '.join(report['metadata']['modules'])}")
+    md.append(f"")
+    
+    # Executive summary
+    md.append(f"## Executive Summary")
+    md.append(f"")
+    md.append(f"| Category | Count |")
+    md.append(f"| -------- | ----- |")
+    md.append(f"| 🔴 Critical Issues | {critical_issues} |")
+    md.append(f"| 🟠 Warning Issues | {warning_issues} |")
+    md.append(f"| 🔵 Info Items | {info_issues} |")
+    md.append(f"| **Total** | **{total_issues}** |")
+    md.append(f"")
+    
+    # Recommendations
+    if report['summary']['recommendations']:
+        md.append(f"### Recommendations")
+        md.append(f"")
+        for i, rec in enumerate(report['summary']['recommendations'], 1):
+            md.append(f"{i}. {rec}")
+        md.append(f"")
+    
+    # Issues list
+    if report['issues']:
+        md.append(f"## Detected Issues")
+        md.append(f"")
+        
+        # Group issues by severity
+        critical = [i for i in report['issues'] if i['severity'] == 'critical']
+        warning = [i for i in report['issues'] if i['severity'] == 'warning']
+        info = [i for i in report['issues'] if i['severity'] == 'info']
+        
+        # Critical issues
+        if critical:
+            md.append(f"### 🔴 Critical Issues")
+            md.append(f"")
+            for i, issue in enumerate(critical, 1):
+                md.append(f"**{i}. {issue['message']}**")
+                md.append(f"   - **Category:** {issue['category']}")
+                md.append(f"   - **Recommendation:** {issue['recommendation']}")
+                md.append(f"   - **Source Command:** `{issue['source_command']}`")
+                if issue.get('evidence'):
+                    md.append(f"   - **Evidence:**")
+                    for evidence_line in issue['evidence']:
+                        md.append(f"     ```")
+                        md.append(f"     {evidence_line}")
+                        md.append(f"     ```")
+                md.append(f"")
+        
+        # Warning issues
+        if warning:
+            md.append(f"### 🟠 Warning Issues")
+            md.append(f"")
+            for i, issue in enumerate(warning, 1):
+                md.append(f"**{i}. {issue['message']}**")
+                md.append(f"   - **Category:** {issue['category']}")
+                md.append(f"   - **Recommendation:** {issue['recommendation']}")
+                md.append(f"   - **Source Command:** `{issue['source_command']}`")
+                if issue.get('evidence'):
+                    md.append(f"   - **Evidence:**")
+                    for evidence_line in issue['evidence']:
+                        md.append(f"     ```")
+                        md.append(f"     {evidence_line}")
+                        md.append(f"     ```")
+                md.append(f"")
+        
+        # Info issues
+        if info:
+            md.append(f"### 🔵 Information")
+            md.append(f"")
+            for i, issue in enumerate(info, 1):
+                md.append(f"**{i}. {issue['message']}**")
+                md.append(f"   - **Category:** {issue['category']}")
+                md.append(f"   - **Recommendation:** {issue['recommendation']}")
+                md.append(f"   - **Source Command:** `{issue['source_command']}`")
+                if issue.get('evidence'):
+                    md.append(f"   - **Evidence:**")
+                    for evidence_line in issue['evidence']:
+                        md.append(f"     ```")
+                        md.append(f"     {evidence_line}")
+                        md.append(f"     ```")
+                md.append(f"")
+    
+    # Detailed Analysis Sections
+    md.append(f"## Detailed Analysis")
+    md.append(f"")
+    
+    # System Overview
+    if 'system_overview' in report['analysis']:
+        md.append(f"### System Overview")
+        md.append(f"")
+        sys_data = report['analysis']['system_overview']
+        md.append(f"- **Proxmox Version:** {sys_data.get('pve_version', 'Unknown')}")
+        md.append(f"- **Kernel:** {sys_data.get('kernel_info', 'Unknown')}")
+        
+        # Services status
+        if 'services' in sys_data:
+            md.append(f"")
+            md.append(f"#### Services Status")
+            md.append(f"")
+            md.append(f"| Service | Status |")
+            md.append(f"| ------- | ------ |")
+            for service, status in sys_data['services'].items():
+                status_emoji = "✅" if status == "running" else "❌"
+                md.append(f"| {service} | {status_emoji} {status} |")
+        md.append(f"")
+    
+    # Hardware Health
+    if 'hardware_health' in report['analysis']:
+        md.append(f"### Hardware Health")
+        md.append(f"")
+        hw_data = report['analysis']['hardware_health']
+        
+        if 'cpu' in hw_data:
+            md.append(f"**CPU:** {hw_data['cpu'].get('model', 'Unknown')} ({hw_data['cpu'].get('cores', 'Unknown')} cores)")
+        
+        if 'memory' in hw_data:
+            mem = hw_data['memory']
+            total_gb = round(mem.get('total_kb', 0) / 1024 / 1024, 2)
+            avail_gb = round(mem.get('available_kb', 0) / 1024 / 1024, 2)
+            usage_pct = mem.get('usage_percent', 0)
+            md.append(f"**Memory:** {avail_gb}GB available of {total_gb}GB total ({usage_pct}% used)")
+            
+            if mem.get('errors_detected', False):
+                md.append(f"⚠️ **Memory errors detected**")
+        md.append(f"")
+    
+    # Storage and Filesystem
+    if 'storage_filesystem' in report['analysis']:
+        md.append(f"### Storage and Filesystem")
+        md.append(f"")
+        storage_data = report['analysis']['storage_filesystem']
+        
+        if storage_data.get('efi_corruption_detected', False):
+            md.append(f"⚠️ **EFI corruption detected**")
+        
+        if storage_data.get('high_usage_filesystems'):
+            md.append(f"")
+            md.append(f"#### High Usage Filesystems")
+            md.append(f"")
+            md.append(f"| Filesystem | Usage |")
+            md.append(f"| ---------- | ----- |")
+            for fs, usage in storage_data['high_usage_filesystems']:
+                usage_emoji = "🔴" if usage > 95 else "🟠"
+                md.append(f"| {fs} | {usage_emoji} {usage}% |")
+        
+        md.append(f"")
+        md.append(f"**Storage Technologies:**")
+        md.append(f"- ZFS: {'Available' if storage_data.get('zfs_available', False) else 'Not available'}")
+        md.append(f"- LVM: {'Available' if storage_data.get('lvm_available', False) else 'Not available'}")
+        md.append(f"")
+
+        if storage_data.get('zfs_pools'):
+            md.append(f"#### ZFS Pools")
+            md.append(f"")
+            md.append(f"| Pool | State | Capacity | Fragmentation | Read/Write/Cksum Errors |")
+            md.append(f"| ---- | ----- | -------- | ------------- | ----------------------- |")
+            for pool in storage_data['zfs_pools']:
+                state_emoji = "✅" if pool['state'] == 'ONLINE' else "🔴"
+                leaves = [v for v in pool['vdevs'] if v['leaf']]
+                counters = "/".join(str(sum(v[c] or 0 for v in leaves)) for c in ('read', 'write', 'cksum'))
+                cap = f"{pool['capacity_percent']:.0f}%" if pool['capacity_percent'] is not None else "-"
+                frag = f"{pool['fragmentation_percent']:.0f}%" if pool['fragmentation_percent'] is not None else "-"
+                md.append(f"| {pool['name']} | {state_emoji} {pool['state']} | {cap} | {frag} | {counters} |")
+            arc_ratio = storage_data.get('zfs_arc', {}).get('hit_ratio_percent')
+            if arc_ratio is not None:
+                md.append(f"")
+                md.append(f"ARC hit ratio: {arc_ratio:.1f}%")
+            md.append(f"")
+
+        if storage_data.get('thin_pools'):
+            md.append(f"#### LVM Thin Pools")
+            md.append(f"")
+            md.append(f"| Thin Pool | Size | Data | Metadata |")
+            md.append(f"| --------- | ---- | ---- | -------- |")
+            for pool in storage_data['thin_pools']:
+                data = f"{pool['data_percent']:.1f}%" if pool['data_percent'] is not None else "-"
+                meta = f"{pool['metadata_percent']:.1f}%" if pool['metadata_percent'] is not None else "-"
+                md.append(f"| {pool['name']} | {pool['size']} | {data} | {meta} |")
+            md.append(f"")
+
+        if storage_data.get('smart'):
+            md.append(f"#### SMART")
+            md.append(f"")
+            md.append(f"| Device | Health | Reallocated | Pending | Wear | Power On Hours |")
+            md.append(f"| ------ | ------ | ----------- | ------- | ---- | -------------- |")
+            def cell(value):
+                return "-" if value is None else value
+            for device, smart in storage_data['smart'].items():
+                health_emoji = "✅" if smart['health'] in ('PASSED', 'OK') else "🔴"
+                wear = f"{smart['percentage_used']}%" if smart['percentage_used'] is not None else "-"
+                md.append(f"| {device} | {health_emoji} {cell(smart['health'])} | {cell(smart['reallocated_sectors'])} "
+                          f"| {cell(smart['pending_sectors'])} | {wear} | {cell(smart['power_on_hours'])} |")
+            md.append(f"")
+    
+    # Network Diagnostics
+    if 'network_diagnostics' in report['analysis']:
+        md.append(f"### Network Diagnostics")
+        md.append(f"")
+        net_data = report['analysis']['network_diagnostics']
+        
+        md.append(f"| Test | Status |")
+        md.append(f"| ---- | ------ |")
+        ping_status = "✅ Success" if net_data.get('ping_test_success', False) else "❌ Failed"
+        dns_status = "✅ Success" if net_data.get('dns_test_success', False) else "❌ Failed"
+        md.append(f"| Internet Connectivity | {ping_status} |")
+        md.append(f"| DNS Resolution | {dns_status} |")
+        md.append(f"")
+        md.append(f"**Network Interfaces:** {net_data.get('interface_count', 0)}")
+        md.append(f"")
+    
+    # Virtualization
+    if 'proxmox_virtualization' in report['analysis']:
+        md.append(f"### Virtualization")
+        md.append(f"")
+        virt_data = report['analysis']['proxmox_virtualization']
+        
+        md.append(f"**Virtual Machines:** {virt_data.get('vm_count', 0)}")
+        md.append(f"**Containers:** {virt_data.get('container_count', 0)}")
+        md.append(f"**Cluster:** {'Available' if virt_data.get('cluster_available', False) else 'Not available'}")
+        md.append(f"")
+        
+        totals = virt_data.get('guest_totals')
+        if virt_data.get('guests'):
+            def ratio(value):
+                return "n/a" if value is None else f"{value:.2f}x"
+            md.append(f"**Overcommit:** memory {ratio(totals['memory_overcommit_ratio'])}, "
+                      f"vCPUs {ratio(totals['cpu_overcommit_ratio'])} (running guests)")
+            md.append(f"")
+            md.append(f"| VMID | Type | Name | Status | CPU % | vCPUs | RSS | Memory | Used |")
+            md.append(f"| ---- | ---- | ---- | ------ | ----- | ----- | --- | ------ | ---- |")
+            def cell(value, unit=""):
+                return "-" if value is None else f"{value:g}{unit}"
+            for guest in sorted(virt_data['guests'], key=lambda g: -(g['cpu_percent'] or 0)):
+                md.append(f"| {guest['vmid']} | {guest['type']} | {guest['name']} | {guest['status']} "
+                          f"| {cell(guest['cpu_percent'])} | {cell(guest['vcpus'])} | {cell(guest['rss_mb'], ' MB')} "
+                          f"| {cell(guest['memory_mb'], ' MB')} | {cell(guest['memory_used_percent'], '%')} |")
+            md.append(f"")
+    
+    # Performance
+    if 'performance_monitoring' in report['analysis']:
+        md.append(f"### Performance")
+        md.append(f"")
+        perf_data = report['analysis']['performance_monitoring']
+        
+        load = perf_data.get('load_average_1min', 0)
+        load_emoji = "🔴" if load > 8.0 else "🟠" if load > 4.0 else "🟢"
+        md.append(f"**Load Average:** {load_emoji} {load}")
+        md.append(f"**Uptime:** {perf_data.get('uptime_days', 0)} days")
+        disk_io = perf_data.get('disk_io', {})
+        if disk_io.get('iowait_percent') is not None:
+            md.append(f"**I/O Wait:** {disk_io['iowait_percent']}%")
+        md.append(f"")
+        
+        if disk_io.get('devices'):
+            md.append(f"#### Disk I/O ({'last iostat interval' if disk_io['iostat_interval'] else 'since boot'})")
+            md.append(f"")
+            md.extend(disk_io_table(disk_io['devices']))
+            md.append(f"")
+        if disk_io.get('rates') and disk_io['rates']['devices']:
+            rates = disk_io['rates']
+            md.append(f"#### Disk I/O Since {rates['since']} ({rates['seconds'] / 3600:.1f} h)")
+            md.append(f"")
+            md.extend(disk_io_table(rates['devices']))
+            md.append(f"")
+        if disk_io.get('zfs_pools'):
+            md.append(f"#### ZFS Pool I/O (since import)")
+            md.append(f"")
+            md.append(f"| Pool / Vdev | Read ops/s | Write ops/s | Read kB/s | Write kB/s |")
+            md.append(f"| ----------- | ---------- | ----------- | --------- | ---------- |")
+            for pool in disk_io['zfs_pools']:
+                for entry in [pool] + pool['vdevs']:
+                    name = entry['name'] if entry is pool else f"{'· ' * entry['depth']}{entry['name']}"
+                    md.append(f"| {name} | {entry['read_ops']} | {entry['write_ops']} | "
+                              f"{entry['read_bytes'] / 1024:.0f} | {entry['write_bytes'] / 1024:.0f} |")
+            md.append(f"")
+    
+    # Log templates
+    if report['analysis'].get('log_analysis', {}).get('log_templates', {}).get('top'):
+        templates = report['analysis']['log_analysis']['log_templates']
+        md.append(f"### Log Messages")
+        md.append(f"")
+        md.append(f"{templates['lines']} journal/dmesg lines in {templates['template_count']} message templates"
+                  + (f", {len(templates['new_templates'])} new" if 'new_templates' in templates else "") + ".")
+        md.append(f"")
+        md.append(f"| Count | Template | First Seen | Last Seen |")
+        md.append(f"| ----- | -------- | ---------- | --------- |")
+        for template in templates['top'][:10]:
+            new_marker = "🆕 " if template['new'] and 'new_templates' in templates else ""
+            text = template['template'].replace('|', '\\|')
+            md.append(f"| {template['count']} | {new_marker}`{text}` | {template['first_seen']} | {template['last_seen']} |")
+        md.append(f"")
+    
+    # Usage trends
+    if report['analysis'].get('trends', {}).get('projections'):
+        md.append(f"### Usage Trends")
+        md.append(f"")
+        md.append(f"| Metric | Current | Growth | Full In |")
+        md.append(f"| ------ | ------- | ------ | ------- |")
+        for projection in report['analysis']['trends']['projections']:
+            days = projection['days_until_full']
+            # Marked by the usage-trend rule level the analyzer applied
+            trend_emoji = {"critical": "🔴", "warning": "🟠"}.get(projection.get('severity'), "🟢")
+            md.append(f"| {projection['metric']} | {projection['current_percent']}% | "
+                      f"{projection['growth_percent_per_day']}%/day | {trend_emoji} {days} days |")
+        md.append(f"")
+    
+    # Security and Updates
+    if 'security_updates' in report['analysis']:
+        md.append(f"### Security and Updates")
+        md.append(f"")
+        sec_data = report['analysis']['security_updates']
+        
+        updates = sec_data.get('upgradable_packages', 0)
+        security = sec_data.get('security_updates', 0)
+        
+        updates_emoji = "🔴" if security > 0 else "🟠" if updates > 20 else "🟢"
+        md.append(f"**Available Updates:** {updates_emoji} {updates} packages ({security} security updates)")
+        
+        cert_status = "✅ Valid" if sec_data.get('certificate_valid', True) else "❌ Expiring or invalid"
+        md.append(f"**SSL Certificate:** {cert_status}")
+        
+        logins = sec_data.get('failed_logins_count', 0)
+        login_emoji = "🟠" if logins > 10 else "🟢"
+        md.append(f"**Failed Logins:** {login_emoji} {logins}")
+        md.append(f"")
+    
+    # Footer
+    md.append(f"---")
+    md.append(f"*Report generated by Proxmox Health Check Analyzer v{analyzer_version}*")
+    
+    return "\n".join(md)
+
+def generate_markdown_diff(diff: Dict[str, Any]) -> str:
+    """Generate a markdown comparison report from a snapshot diff"""
+    
+    meta = diff['metadata']
+    summary = diff['summary']
+    md = []
+    
+    md.append(f"# Proxmox Snapshot Comparison: {meta['after_hostname']}")
+    md.append(f"")
+    md.append(f"**Before:** {meta['before_timestamp']} ({meta['before_health'].upper()})")
+    md.append(f"**After:** {meta['after_timestamp']} ({meta['after_health'].upper()})")
+    md.append(f"")
+    md.append(f"| Change | Count |")
+    md.append(f"| ------ | ----- |")
+    md.append(f"| 🆕 New Issues | {summary['new']} |")
+    md.append(f"| ✅ Resolved Issues | {summary['resolved']} |")
+    md.append(f"| 🔄 Changed Issues | {summary['changed']} |")
+    md.append(f"| ➖ Unchanged Issues | {summary['unchanged']} |")
+    md.append(f"")
+    
+    sections = [
+        ("new", "🆕 New Issues"),
+        ("resolved", "✅ Resolved Issues"),
+        ("changed", "🔄 Changed Issues"),
+    ]
+    for key, title in sections:
+        if not diff['issues'][key]:
+            continue
+        md.append(f"## {title}")
+        md.append(f"")
+        for issue in diff['issues'][key]:
+            if key == 'changed':
+                md.append(f"- **[{issue['severity']}] {issue['message']}** (was: {issue['previous_message']})")
+            else:
+                md.append(f"- **[{issue['severity']}] {issue['message']}** ({issue['category']})")
+        md.append(f"")
+    
+    if diff.get('disk_io'):
+        md.append(f"## Disk I/O Between Snapshots ({diff['disk_io']['seconds'] / 3600:.1f} h)")
+        md.append(f"")
+        md.extend(disk_io_table(diff['disk_io']['devices']))
+        md.append(f"")
+    
+    if diff['metrics']:
+        md.append(f"## Metric Changes")
+        md.append(f"")
+        md.append(f"| Metric | Before | After | Delta |")
+        md.append(f"| ------ | ------ | ----- | ----- |")
+        for metric, values in diff['metrics'].items():
+            delta = values['delta']
+            delta_str = f"{delta:+g}" if delta is not None else "n/a"
+            md.append(f"| {metric} | {values['before']} | {values['after']} | {delta_str} |")
+        md.append(f"")
+    
+    raw = diff.get('raw_outputs')
+    if raw and (raw['changed'] or raw['added'] or raw['removed']):
+        md.append(f"## Raw Output Changes")
+        md.append(f"")
+        if raw['added']:
+            md.append(f"**Added outputs:** {', '.join(raw['added'])}")
+        if raw['removed']:
+            md.append(f"**Removed outputs:** {', '.join(raw['removed'])}")
+        md.append(f"")
+        for key, hunks in raw['changed'].items():
+            md.append(f"### {key}")
+            md.append(f"")
+            md.append(f"```diff")
+            md.extend(hunks)
+            md.append(f"```")
+            md.append(f"")
+    
+    return "\n".join(md)
+
+def generate_markdown_cluster(report: Dict[str, Any]) -> str:
+    """Generate a markdown cluster report from the joined node view"""
+    
+    meta = report['metadata']
+    summary = report['summary']
+    cluster = report['cluster']
+    overall_health = summary['overall_health'].upper()
+    health_emoji = "🔴" if overall_health == "CRITICAL" else "🟠" if overall_health == "WARNING" else "🟢"
+    md = []
+    
+    md.append(f"# Proxmox Cluster Report: {', '.join(meta['cluster_names']) or 'standalone nodes'} {health_emoji}")
+    md.append(f"")
+    md.append(f"**Generated:** {meta['analysis_timestamp']}")
+    md.append(f"**Nodes:** {meta['node_count']}")
+    md.append(f"**Overall Health:** {overall_health}")
+    md.append(f"")
+    
+    if report['issues']:
+        md.append(f"## Detected Issues")
+        md.append(f"")
+        for issue in report['issues']:
+            md.append(f"- **[{issue['severity']}] {issue['message']}** ({issue['category']})")
+            md.append(f"  - {issue['recommendation']}")
+            for evidence_line in issue['evidence']:
+                md.append(f"  - `{evidence_line}`")
+        md.append(f"")
+    
+    md.append(f"## Nodes")
+    md.append(f"")
+    md.append(f"| Node | Health | Snapshot | VMs | CTs | Running | Memory Used | Running VM Memory | CPUs | Load | "
+              f"Guest CPU | Overcommit (mem/CPU) | Failover Memory |")
+    md.append(f"| ---- | ------ | -------- | --- | --- | ------- | ----------- | ----------------- | ---- | ---- | "
+              f"--------- | -------------------- | --------------- |")
+    for host, node in cluster['nodes'].items():
+        memory = f"{node['memory_usage_percent']}%" if node['memory_usage_percent'] is not None else "n/a"
+        failover = f"{node['failover_memory_percent']}%" if node['failover_memory_percent'] is not None else "n/a"
+        overcommit = '/'.join(f"{ratio}x" if ratio is not None else "n/a"
+                              for ratio in (node['memory_overcommit_ratio'], node['cpu_overcommit_ratio']))
+        md.append(f"| {host} | {node['health']} | {node['snapshot_timestamp']} | {node['vms']} | "
+                  f"{node['containers']} | {node['running_guests']} | {memory} | "
+                  f"{node['running_vm_memory_mb']} MB | {node['cpus'] or 'n/a'} | "
+                  f"{node['load_1min'] if node['load_1min'] is not None else 'n/a'} | "
+                  f"{node['guest_cpu_percent']}% | {overcommit} | {failover} |")
+    md.append(f"")
+    md.append(f"Failover memory: memory use of the other nodes if this node's running VMs moved to them.")
+    md.append(f"")
+    
+    quorum = cluster['quorum']
+    if quorum['views']:
+        md.append(f"## Quorum")
+        md.append(f"")
+        for view in quorum['views']:
+            md.append(f"- **{view['name']}** (config version {view['config_version']}): seen by "
+                      f"{', '.join(view['nodes'])}; members {', '.join(view['members'])}")
+        if quorum['standalone_nodes']:
+            md.append(f"- Not in a cluster: {', '.join(quorum['standalone_nodes'])}")
+        if quorum['not_quorate_nodes']:
+            md.append(f"- Not quorate: {', '.join(quorum['not_quorate_nodes'])}")
+        if quorum['members_without_snapshot']:
+            md.append(f"- Members without a snapshot: {', '.join(quorum['members_without_snapshot'])}")
+        md.append(f"")
+    
+    guests = cluster['guests']
+    md.append(f"## Guests")
+    md.append(f"")
+    md.append(f"**Total:** {guests['total']} ({guests['running']} running)")
+    md.append(f"")
+    if guests['duplicate_vmids']:
+        md.append(f"| VMID | Guests |")
+        md.append(f"| ---- | ------ |")
+        for vmid, entries in guests['duplicate_vmids'].items():
+            md.append(f"| {vmid} | " + ', '.join(f"{entry['type']} {entry['name']} on {entry['host']}"
+                                              for entry in entries) + " |")
+        md.append(f"")
+    
+    if cluster['storage']:
+        md.append(f"## Storage")
+        md.append(f"")
+        md.append(f"| Storage | Type | Shared | Usage | Nodes |")
+        md.append(f"| ------- | ---- | ------ | ----- | ----- |")
+        for name, storage in cluster['storage'].items():
+            usage = f"{storage['usage_percent']}%" if storage['usage_percent'] is not None else "n/a"
+            states = ', '.join(f"{host} ({state['status']})" for host, state in storage['nodes'].items())
+            md.append(f"| {name} | {storage['type']} | {'yes' if storage['shared'] else 'no'} | {usage} | {states} |")
+        md.append(f"")
+    
+    return "\n".join(md)
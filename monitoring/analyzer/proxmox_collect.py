@@ -0,0 +1,172 @@
+"""
+Proxmox health check collection over SSH
+Runs the data collector on many nodes at once and analyzes each snapshot as
+it lands (collect)
+"""
+
+import os
+import sys
+import asyncio
+import re
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, UTC
+from typing import Any, Dict, List, Optional, Union
+
+from proxmox_snapshot import CONTAINER_MAGIC, CONTAINER_SUFFIX
+from proxmox_index import IssueIndex
+from proxmox_workers import analyze_inbox_file
+
+# Collection orchestrator: the collector is pushed to every node on each run
+DEFAULT_COLLECTOR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                      'server', 'proxmox-data-collector.sh')
+# Stores the pushed collector in a temp file (it refuses to run from stdin) and streams the snapshot to stdout
+COLLECT_REMOTE_COMMAND = 'f=$(mktemp) && cat > "$f" && bash "$f" {args}; rc=$?; rm -f "$f"; exit $rc'
+COLLECT_CONCURRENCY = 16
+COLLECT_TIMEOUT_SECONDS = 600
+SSH_CONTROL_PERSIST = '10m'
+
+class LocalTransport:
+    """Stand-in for SSH that runs the node command on this machine (tests, single-node setups)"""
+
+    async def start(self, node: str, command: str) -> asyncio.subprocess.Process:
+        # A session of its own, so an aborted collection takes the collector's children with it
+        return await asyncio.create_subprocess_exec(
+            'sh', '-c', command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE, start_new_session=True)
+
+    def kill(self, process: asyncio.subprocess.Process):
+        os.killpg(process.pid, signal.SIGKILL)
+
+class SSHTransport:
+    """OpenSSH with multiplexed connections
+
+    The first command to a node opens a master connection (ControlMaster)
+    that later commands to the node share without a new handshake. The
+    master stays up for ``persist`` after its last use, so collections
+    repeated within that time skip connection setup entirely.
+    """
+
+    def __init__(self, control_dir: str, options: Optional[List[str]] = None,
+                 persist: str = SSH_CONTROL_PERSIST):
+        self.control_dir = control_dir
+        self.options = options or []
+        self.persist = persist
+        os.makedirs(control_dir, mode=0o700, exist_ok=True)
+
+    def argv(self, node: str) -> List[str]:
+        argv = ['ssh', '-o', 'BatchMode=yes', '-o', 'ControlMaster=auto',
+                '-o', f'ControlPath={os.path.join(self.control_dir, "%C")}', '-o', f'ControlPersist={self.persist}']
+        for option in self.options:
+            argv += ['-o', option]
+        return argv + [node]
+
+    async def start(self, node: str, command: str) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(
+            *self.argv(node), command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+
+    def kill(self, process: asyncio.subprocess.Process):
+        # The node's sshd hangs up the collector when the session's client goes away
+        process.kill()
+
+class CollectionOrchestrator:
+    """Collect snapshots from many nodes at once and analyze each as it lands
+
+    Every node gets the collector pushed over stdin and runs it with
+    container output, so the snapshot streams back already compressed (per
+    output) and is written to disk as it arrives. At most ``concurrency``
+    nodes collect at a time; analysis runs in the worker pool while the
+    next nodes are still collecting.
+    """
+
+    def __init__(self, transport: Union[SSHTransport, LocalTransport], collector: bytes, output_dir: str,
+                 executor: ProcessPoolExecutor, formats: List[str], rules_path: str,
+                 collector_args: Optional[List[str]] = None, history_dir: Optional[str] = None,
+                 index: Optional[IssueIndex] = None, concurrency: int = COLLECT_CONCURRENCY,
+                 timeout: float = COLLECT_TIMEOUT_SECONDS):
+        self.transport = transport
+        self.collector = collector
+        self.output_dir = output_dir
+        self.executor = executor
+        self.formats = formats
+        self.rules_path = rules_path
+        self.command = COLLECT_REMOTE_COMMAND.format(
+            args=' '.join(['--format', 'container'] + (collector_args or [])))
+        self.history_dir = history_dir
+        self.index = index
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+
+    def log(self, message: str):
+        print(message, file=sys.stderr, flush=True)
+
+    async def fetch(self, node: str) -> str:
+        """Run the collector on a node and stream its snapshot into the output directory"""
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', node.rpartition('@')[2])
+        target = os.path.join(self.output_dir, f"{name}-{datetime.now(UTC).strftime('%Y%m%d-%H%M%S')}"
+                                               f"{CONTAINER_SUFFIX}")
+        process = await self.transport.start(node, self.command)
+        stderr = asyncio.ensure_future(process.stderr.read())
+        try:
+            # The node buffers the whole collector before running it, so this cannot block on its output
+            process.stdin.write(self.collector)
+            await process.stdin.drain()
+            process.stdin.close()
+            with open(target + '.partial', 'wb') as f:
+                while chunk := await process.stdout.read(1 << 16):
+                    f.write(chunk)
+            returncode = await process.wait()
+            errors = (await stderr).decode('utf-8', 'replace').strip().splitlines()
+        except BaseException:
+            # Timeouts and cancellation: leave neither a process nor a partial snapshot behind
+            if process.returncode is None:
+                self.transport.kill(process)
+                await process.wait()
+            stderr.cancel()
+            try:
+                os.remove(target + '.partial')
+            except FileNotFoundError:
+                pass
+            raise
+        with open(target + '.partial', 'rb') as f:
+            magic = f.read(len(CONTAINER_MAGIC))
+        if returncode != 0 or magic != CONTAINER_MAGIC:
+            os.remove(target + '.partial')
+            reason = errors[-1] if errors else 'no snapshot received'
+            raise OSError(f"collector exited with status {returncode}: {reason}" if returncode else reason)
+        os.replace(target + '.partial', target)
+        return target
+
+    async def collect(self, node: str) -> Dict[str, Any]:
+        async with self.semaphore:
+            started = time.perf_counter()
+            try:
+                path = await asyncio.wait_for(self.fetch(node), self.timeout)
+            except asyncio.TimeoutError:
+                self.log(f"{node}: collection timed out after {self.timeout:.0f} s")
+                return {"node": node, "status": "error", "error": f"timed out after {self.timeout:.0f} s"}
+            except OSError as e:
+                self.log(f"{node}: {e}")
+                return {"node": node, "status": "error", "error": str(e)}
+        collect_seconds = time.perf_counter() - started
+        result = await asyncio.get_running_loop().run_in_executor(
+            self.executor, analyze_inbox_file, path, self.formats, self.history_dir, self.rules_path, 0)
+        record = {"node": node, "file": path, "status": result['status'],
+                  "collect_seconds": round(collect_seconds, 3)}
+        if result['status'] != 'ok':
+            self.log(f"{node}: collected {path}, analysis failed: {result['error']}")
+            record["error"] = result['error']
+            return record
+        summary = result['summary']
+        if self.index is not None:
+            self.index.add_report(result['issues'], path)
+        self.log(f"{node}: {summary['overall_health']} ({summary['critical_issues']} critical, "
+                 f"{summary['warning_issues']} warning, {summary['info_issues']} info), "
+                 f"{os.path.getsize(path) // 1024} KB collected in {collect_seconds:.1f} s")
+        record.update(summary=summary, reports=result['reports'])
+        return record
+
+    async def run(self, nodes: List[str]) -> List[Dict[str, Any]]:
+        return await asyncio.gather(*(self.collect(node) for node in nodes))
@@ -0,0 +1,152 @@
+"""
+Proxmox health check Prometheus exporter
+Serves the latest analysis results per host in the Prometheus text format
+"""
+
+import json
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from proxmox_snapshot import parse_timestamp
+from proxmox_analyzer import HEALTH_STATUSES, extract_metrics
+
+# Prometheus exporter: history metric prefix -> (metric name, help, label of the instance part)
+PROMETHEUS_PREFIX = 'proxmox_health_'
+PROMETHEUS_METRICS = {
+    'new_log_templates': ('new_log_templates', 'Log message types not seen in earlier snapshots of the host', None),
+    'memory_usage_percent': ('memory_usage_percent', 'Memory in use', None),
+    'load_average_1min': ('load_average_1m', '1 minute load average', None),
+    'uptime_days': ('uptime_days', 'Uptime in days', None),
+    'filesystem_usage_percent': ('filesystem_usage_percent', 'Filesystem usage from df', 'mountpoint'),
+    'zfs_capacity_percent': ('zfs_capacity_percent', 'ZFS pool capacity used', 'pool'),
+    'zfs_arc_hit_ratio_percent': ('zfs_arc_hit_ratio_percent', 'ZFS ARC hit ratio', None),
+    'thin_pool_data_percent': ('thin_pool_data_percent', 'LVM thin pool data usage', 'pool'),
+    'thin_pool_metadata_percent': ('thin_pool_metadata_percent', 'LVM thin pool metadata usage', 'pool'),
+    'smart_reallocated_sectors': ('smart_reallocated_sectors', 'SMART reallocated sector count', 'device'),
+    'smart_pending_sectors': ('smart_pending_sectors', 'SMART pending sector count', 'device'),
+    'nvme_percentage_used': ('nvme_percentage_used', 'NVMe percentage of rated endurance used', 'device'),
+    'upgradable_packages': ('upgradable_packages', 'Packages with available upgrades', None),
+    'security_updates': ('security_updates', 'Available security updates', None),
+    'failed_logins_count': ('failed_logins', 'Failed login attempts in the collected logs', None),
+    'guest_memory_overcommit_ratio': ('guest_memory_overcommit_ratio',
+                                      'Configured memory of running guests per byte of host memory', None),
+    'guest_cpu_overcommit_ratio': ('guest_cpu_overcommit_ratio', 'vCPUs of running guests per host CPU', None),
+    'guest_cpu_percent': ('guest_cpu_percent', 'Guest CPU usage averaged since start (percent of one CPU)', 'vmid'),
+    'guest_rss_mb': ('guest_rss_mb', 'Guest resident memory in MB', 'vmid'),
+    'disk_util_percent': ('disk_util_percent', 'Disk utilization in the last iostat interval', 'device'),
+    'disk_await_ms': ('disk_await_ms', 'Average disk I/O latency in the last iostat interval', 'device'),
+}
+
+def exporter_sample(report: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of a report the Prometheus exporter serves"""
+    issues = defaultdict(int)
+    for issue in report['issues']:
+        issues[(issue['severity'], issue['category'])] += 1
+    return {
+        "host": report['metadata'].get('source_hostname', 'unknown'),
+        "timestamp": parse_timestamp(report['metadata'].get('source_timestamp')),
+        "health": report['summary']['overall_health'],
+        "metrics": extract_metrics(report['analysis']),
+        "issues": [[severity, category, count] for (severity, category), count in sorted(issues.items())]
+    }
+
+def prometheus_labels(**labels: str) -> str:
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+class MetricsExporter:
+    """Latest analysis results per host, pre-rendered in Prometheus text format
+
+    Each host's sample lines are rendered once when its results change and
+    the exposition text is reassembled from those fragments, never on a
+    scrape, so serving /metrics is a copy of a cached byte string no matter
+    how many hosts are tracked.
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    HELP = {
+        'snapshot_timestamp_seconds': 'Collection time of the analyzed snapshot',
+        'status': 'Overall health of the latest snapshot (1 for the current status)',
+        'issues': 'Issues in the latest snapshot by severity and category',
+        **{name: help_text for name, help_text, _ in PROMETHEUS_METRICS.values()}
+    }
+
+    def __init__(self):
+        self.hosts: Dict[str, Dict[str, Any]] = {}
+        self._fragments: Dict[str, Dict[str, str]] = {}
+        self.body = b''
+
+    def update(self, sample: Dict[str, Any]) -> bool:
+        """Keep the sample if it is the host's newest; returns whether it was kept"""
+        host = sample['host']
+        current = self.hosts.get(host)
+        if current is not None and (sample['timestamp'] or 0) < (current['timestamp'] or 0):
+            return False
+        self.hosts[host] = sample
+        self._fragments[host] = self.render_host(host, sample)
+        self.body = self.render()
+        return True
+
+    def render_host(self, host: str, sample: Dict[str, Any]) -> Dict[str, str]:
+        """Sample lines of one host, grouped by metric family"""
+        families: Dict[str, List[str]] = defaultdict(list)
+        if sample['timestamp'] is not None:
+            families['snapshot_timestamp_seconds'].append(
+                f"{PROMETHEUS_PREFIX}snapshot_timestamp_seconds{prometheus_labels(host=host)} {sample['timestamp']}")
+        for status in HEALTH_STATUSES:
+            families['status'].append(
+                f"{PROMETHEUS_PREFIX}status{prometheus_labels(host=host, status=status)} "
+                f"{int(sample['health'] == status)}")
+        for severity, category, count in sample['issues']:
+            families['issues'].append(
+                f"{PROMETHEUS_PREFIX}issues"
+                f"{prometheus_labels(host=host, severity=severity, category=category)} {count}")
+        for metric, value in sorted(sample['metrics'].items()):
+            prefix, _, instance = metric.partition(':')
+            if prefix not in PROMETHEUS_METRICS:
+                continue
+            name, _, label = PROMETHEUS_METRICS[prefix]
+            labels = prometheus_labels(host=host, **{label: instance}) if label else prometheus_labels(host=host)
+            value = int(value) if value.is_integer() else value
+            families[name].append(f"{PROMETHEUS_PREFIX}{name}{labels} {value}")
+        return {name: ''.join(line + '\n' for line in lines) for name, lines in families.items()}
+
+    def render(self) -> bytes:
+        hosts = sorted(self._fragments)
+        parts = []
+        for name, help_text in self.HELP.items():
+            samples = ''.join(self._fragments[host].get(name, '') for host in hosts)
+            if samples:
+                parts.append(f"# HELP {PROMETHEUS_PREFIX}{name} {help_text}\n"
+                             f"# TYPE {PROMETHEUS_PREFIX}{name} gauge\n")
+                parts.append(samples)
+        return ''.join(parts).encode('utf-8')
+
+    def load_reports(self, paths: List[str]):
+        """Seed the exporter from reports written before the daemon started"""
+        for path in paths:
+            try:
+                with open(path, 'r') as f:
+                    self.update(exporter_sample(json.load(f)))
+            except (OSError, ValueError, KeyError):
+                continue
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Minimal HTTP/1.0 handler: GET /metrics, everything else 404"""
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=10)
+            method, target = (request.split(b' ', 2) + [b'', b''])[:2]
+            if method in (b'GET', b'HEAD') and target.split(b'?')[0] == b'/metrics':
+                body = self.body
+                head = (f"HTTP/1.0 200 OK\r\nContent-Type: {self.CONTENT_TYPE}\r\n"
+                        f"Content-Length: {len(body)}\r\n\r\n").encode('ascii')
+                writer.write(head if method == b'HEAD' else head + body)
+            else:
+                writer.write(b"HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,244 @@
+"""
+Proxmox health check issue index
+SQLite full-text index of the issues of analyzed snapshots (--index-db, search)
+"""
+
+import json
+import os
+import glob
+import re
+import sqlite3
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from itertools import chain
+
+from proxmox_snapshot import REPORT_INFIX, parse_timestamp
+
+# Issue search index: results per query unless --limit is given
+SEARCH_LIMIT = 50
+
+class IssueIndex:
+    """Full-text index of the issues of every analyzed snapshot
+
+    A SQLite file with one row per snapshot (host, collection time, overall
+    health) and per issue, plus an FTS5 index over issue messages,
+    recommendations, source commands and evidence. A snapshot indexed
+    again replaces its previous issues, so re-analyses and report files
+    of already indexed snapshots never duplicate results. Report files are
+    only re-read when their size or modification time changed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('PRAGMA foreign_keys=ON')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY,
+                host TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                health TEXT,
+                source TEXT,
+                UNIQUE (host, timestamp));
+            CREATE INDEX IF NOT EXISTS snapshots_timestamp ON snapshots (timestamp);
+            CREATE TABLE IF NOT EXISTS issues (
+                id INTEGER PRIMARY KEY,
+                snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+                severity TEXT NOT NULL,
+                category TEXT NOT NULL,
+                message TEXT NOT NULL,
+                recommendation TEXT,
+                source_command TEXT,
+                evidence TEXT);
+            CREATE INDEX IF NOT EXISTS issues_snapshot ON issues (snapshot_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS issues_fts USING fts5 (
+                message, recommendation, source_command, evidence, content='issues', content_rowid='id');
+            CREATE TRIGGER IF NOT EXISTS issues_fts_insert AFTER INSERT ON issues BEGIN
+                INSERT INTO issues_fts (rowid, message, recommendation, source_command, evidence)
+                VALUES (new.id, new.message, new.recommendation, new.source_command, new.evidence);
+            END;
+            CREATE TRIGGER IF NOT EXISTS issues_fts_delete AFTER DELETE ON issues BEGIN
+                INSERT INTO issues_fts (issues_fts, rowid, message, recommendation, source_command, evidence)
+                VALUES ('delete', old.id, old.message, old.recommendation, old.source_command, old.evidence);
+            END;
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL);
+        ''')
+
+    def _add(self, report: Dict[str, Any], source: str) -> bool:
+        metadata = report.get('metadata', {})
+        timestamp = (parse_timestamp(metadata.get('source_timestamp'))
+                     or parse_timestamp(metadata.get('analysis_timestamp')))
+        if timestamp is None or 'issues' not in report:
+            return False
+        host = metadata.get('source_hostname', 'unknown')
+        self.db.execute('DELETE FROM snapshots WHERE host=? AND timestamp=?', (host, timestamp))
+        snapshot_id = self.db.execute(
+            'INSERT INTO snapshots (host, timestamp, health, source) VALUES (?, ?, ?, ?)',
+            (host, timestamp, report.get('summary', {}).get('overall_health'), source)).lastrowid
+        self.db.executemany(
+            'INSERT INTO issues (snapshot_id, severity, category, message, recommendation, source_command, evidence) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(snapshot_id, issue['severity'], issue['category'], issue['message'], issue.get('recommendation'),
+              issue.get('source_command'), '\n'.join(issue.get('evidence') or []))
+             for issue in report['issues']])
+        return True
+
+    def add_report(self, report: Dict[str, Any], source: str) -> bool:
+        """Index (or re-index) the issues of one analysis report; False if it has no collection time"""
+        with self.db:
+            return self._add(report, source)
+
+    def add_file(self, path: str) -> Optional[int]:
+        """Index the reports in a report file; None if it is unchanged since it was last indexed"""
+        st = os.stat(path)
+        row = self.db.execute('SELECT mtime, size FROM files WHERE path=?', (path,)).fetchone()
+        if row is not None and row[0] == st.st_mtime and row[1] == st.st_size:
+            return None
+        indexed = 0
+        with self.db:
+            for source, report in iter_report_file(path):
+                indexed += self._add(report, source)
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (path, st.st_mtime, st.st_size))
+        return indexed
+
+    def search(self, query: Optional[str] = None, hosts: Optional[List[str]] = None,
+               severities: Optional[List[str]] = None, categories: Optional[List[str]] = None,
+               since: Optional[int] = None, until: Optional[int] = None,
+               limit: int = SEARCH_LIMIT, oldest_first: bool = False) -> List[Dict[str, Any]]:
+        """Matching issues, newest snapshots first; ``query`` uses FTS5 syntax"""
+        conditions, params = self._filters(query, hosts, severities, categories, since, until)
+        snippet = ("snippet(issues_fts, 3, char(2), char(3), '...', 12)" if query else "''")
+        rows = self.db.execute(
+            f"SELECT s.host, s.timestamp, s.health, s.source, i.severity, i.category, i.message, "
+            f"i.recommendation, i.source_command, i.evidence, {snippet} "
+            f"FROM {self._tables(query)} WHERE {' AND '.join(conditions)} "
+            f"ORDER BY s.timestamp {'ASC' if oldest_first else 'DESC'}, i.id LIMIT ?",
+            params + [limit])
+        results = []
+        for host, timestamp, health, source, severity, category, message, recommendation, command, evidence, \
+                match in rows:
+            result = {
+                "host": host,
+                "timestamp": datetime.fromtimestamp(timestamp, UTC).isoformat().replace('+00:00', 'Z'),
+                "health": health,
+                "source": source,
+                "severity": severity,
+                "category": category,
+                "message": message,
+                "recommendation": recommendation,
+                "source_command": command,
+                "evidence": evidence.split('\n') if evidence else []
+            }
+            if '\x02' in match:
+                # Highlighted evidence excerpt; only when the query matched the evidence
+                result["evidence_match"] = match.replace('\x02', '**').replace('\x03', '**')
+            results.append(result)
+        return results
+
+    def search_hosts(self, query: Optional[str] = None, hosts: Optional[List[str]] = None,
+                     severities: Optional[List[str]] = None, categories: Optional[List[str]] = None,
+                     since: Optional[int] = None, until: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Per host: first and last snapshot with a matching issue, and how many snapshots had one"""
+        conditions, params = self._filters(query, hosts, severities, categories, since, until)
+        rows = self.db.execute(
+            f"SELECT s.host, MIN(s.timestamp), MAX(s.timestamp), COUNT(DISTINCT s.id), COUNT(*) "
+            f"FROM {self._tables(query)} WHERE {' AND '.join(conditions)} "
+            f"GROUP BY s.host ORDER BY MIN(s.timestamp)", params)
+        return [{"host": host,
+                 "first_seen": datetime.fromtimestamp(first, UTC).isoformat().replace('+00:00', 'Z'),
+                 "last_seen": datetime.fromtimestamp(last, UTC).isoformat().replace('+00:00', 'Z'),
+                 "snapshots": snapshots, "issues": issues}
+                for host, first, last, snapshots, issues in rows]
+
+    @staticmethod
+    def _tables(query: Optional[str]) -> str:
+        tables = 'issues i JOIN snapshots s ON s.id = i.snapshot_id'
+        return f'issues_fts JOIN {tables} AND i.id = issues_fts.rowid' if query else tables
+
+    @staticmethod
+    def _filters(query, hosts, severities, categories, since, until) -> Tuple[List[str], List[Any]]:
+        conditions, params = ['1'], []
+        if query:
+            conditions.append('issues_fts MATCH ?')
+            params.append(query)
+        for column, values in (('s.host', hosts), ('i.severity', severities), ('i.category', categories)):
+            if values:
+                conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        if since is not None:
+            conditions.append('s.timestamp >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('s.timestamp <= ?')
+            params.append(until)
+        return conditions, params
+
+    def stats(self) -> Dict[str, int]:
+        snapshots, hosts = self.db.execute('SELECT COUNT(*), COUNT(DISTINCT host) FROM snapshots').fetchone()
+        issues, = self.db.execute('SELECT COUNT(*) FROM issues').fetchone()
+        return {"hosts": hosts, "snapshots": snapshots, "issues": issues}
+
+    def close(self):
+        self.db.close()
+
+def iter_report_file(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """(source, report) pairs of an analysis report (JSON) or batch output (NDJSON) file
+
+    Batch records carry the snapshot path as source; failed records are
+    skipped.
+    """
+    with open(path, 'r') as f:
+        first = f.readline()
+        try:
+            record = json.loads(first)
+        except json.JSONDecodeError:
+            # An indented report spans many lines
+            record = None
+        if not (isinstance(record, dict) and 'status' in record):
+            f.seek(0)
+            yield path, json.load(f)
+            return
+        for line in chain([first], f):
+            if line.strip():
+                record = json.loads(line)
+                if record.get('status') == 'ok':
+                    yield record['file'], record['report']
+
+def search_query(text: str) -> str:
+    """FTS5 query from plain search words: words are quoted, a trailing * keeps prefix search
+
+    Words and phrases are ANDed as in FTS5; OR, NOT and parentheses are
+    passed through, so 'EXT4-fs error' or 'pvestatd OR pveproxy' need no
+    FTS5 quoting.
+    """
+    terms = []
+    for match in re.finditer(r'"[^"]*"|[()]|[^\s()]+', text):
+        term = match.group()
+        if term in ('OR', 'AND', 'NOT', '(', ')') or term.startswith('"'):
+            terms.append(term)
+        elif term.endswith('*'):
+            terms.append('"' + term.rstrip('*').replace('"', '""') + '"*')
+        else:
+            terms.append('"' + term.replace('"', '""') + '"')
+    return ' '.join(terms)
+
+def expand_report_paths(patterns: List[str]) -> List[str]:
+    """Report files from files, globs and directories (searched for *.report.json and *.ndjson)"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [m for suffix in (f'{REPORT_INFIX}.json', '.ndjson')
+                       for m in glob.glob(os.path.join(pattern, '**', '*' + suffix), recursive=True)]
+        elif glob.has_magic(pattern):
+            matches = glob.glob(pattern, recursive=True)
+        else:
+            matches = [pattern]
+        paths.update(os.path.normpath(m) for m in matches if not os.path.isdir(m))
+    return sorted(paths)
@@ -0,0 +1,562 @@
+"""
+Proxmox health check snapshots on disk
+Reads collector snapshots (JSON, compressed JSON and .pxs containers),
+resolves delta snapshots against their base and writes containers
+"""
+
+import json
+import mmap
+import os
+import glob
+import gzip
+import hashlib
+import re
+import struct
+import zlib
+from datetime import datetime, UTC
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Snapshots larger than this are read through SnapshotStream instead of json.load
+STREAMING_LOAD_THRESHOLD = 16 * 1024 * 1024
+# Raw outputs larger than this stay in the memory map until an analyzer reads them
+LAZY_OUTPUT_THRESHOLD = 256 * 1024
+# Collector output, plain or compressed with --compress gzip|zstd, or a snapshot container
+SNAPSHOT_SUFFIXES = ('.json', '.json.gz', '.json.zst', '.pxs')
+# Delta snapshots (collector --delta-dir) longer than this chain are assumed to loop
+DELTA_MAX_DEPTH = 1000
+
+# Snapshot container: magic and header length, JSON header with the output index, output blobs
+CONTAINER_SUFFIX = '.pxs'
+CONTAINER_MAGIC = b'PXSNAP01'
+CONTAINER_PREAMBLE = struct.Struct('<8sI')
+CONTAINER_FORMAT_VERSION = 1
+CONTAINER_CODECS = ('none', 'gzip', 'zlib', 'zstd')
+# Reports are written next to their snapshot: host-20260101.json -> host-20260101.report.json
+REPORT_INFIX = '.report'
+
+class LazyOutput:
+    """A JSON string value left in a memory-mapped snapshot until first read"""
+
+    def __init__(self, buffer: mmap.mmap, start: int, end: int):
+        self.buffer = buffer
+        self.start = start  # offset of the opening quote
+        self.end = end  # offset just past the closing quote
+
+    def __len__(self) -> int:
+        return self.end - self.start - 2
+
+    def read(self) -> str:
+        """Decode the string value from the mapped file"""
+        return json.loads(self.buffer[self.start:self.end])
+
+    def encoded(self) -> bytes:
+        """The value as stored in the file, tagged with its encoding"""
+        return b'json:' + self.buffer[self.start:self.end]
+
+    def __str__(self) -> str:
+        return self.read()
+
+class PackedOutput(LazyOutput):
+    """An independently compressed output in a memory-mapped snapshot container"""
+
+    def __init__(self, buffer: mmap.mmap, start: int, end: int, codec: str, raw_size: int):
+        super().__init__(buffer, start, end)
+        self.codec = codec
+        self.raw_size = raw_size
+
+    def __len__(self) -> int:
+        return self.raw_size
+
+    def read(self) -> str:
+        """Decompress and decode the output from the mapped file"""
+        return decompress_output(self.codec, self.buffer[self.start:self.end]).decode('utf-8', 'replace')
+
+    def encoded(self) -> bytes:
+        return self.codec.encode('ascii') + b':' + self.buffer[self.start:self.end]
+
+class SnapshotStream:
+    """Incremental reader over a memory-mapped collector snapshot
+
+    Walks the top-level JSON object without decoding it as a whole. Entries
+    of ``raw_outputs`` are yielded one at a time; values above
+    ``lazy_threshold`` bytes are returned as LazyOutput spans into the map,
+    so peak memory is bounded by the largest output actually read.
+    """
+
+    _WHITESPACE = b' \t\r\n'
+    _STRUCTURE_RE = re.compile(rb'["{}\[\]]')
+    _SCALAR_RE = re.compile(rb'-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null')
+
+    def __init__(self, path: str, lazy_threshold: int = LAZY_OUTPUT_THRESHOLD):
+        self.path = path
+        self.lazy_threshold = lazy_threshold
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise json.JSONDecodeError("Expecting value", "", 0)
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _error(self, message: str, pos: int):
+        raise json.JSONDecodeError(f"{message} in {self.path}", "", pos)
+
+    def _skip_ws(self, pos: int) -> int:
+        buf = self.buffer
+        while pos < len(buf) and buf[pos] in self._WHITESPACE:
+            pos += 1
+        return pos
+
+    def _expect(self, pos: int, char: bytes) -> int:
+        pos = self._skip_ws(pos)
+        if self.buffer[pos:pos + 1] != char:
+            self._error(f"Expecting {char.decode()!r}", pos)
+        return pos + 1
+
+    def _string_end(self, pos: int) -> int:
+        """Return the offset just past the string starting at pos
+
+        Scans growing windows: escaped backslashes and then escaped quotes
+        are blanked out with bytes.replace, so the first quote left in the
+        window closes the string. Windows never end on a backslash, so no
+        escape sequence is split between two of them.
+        """
+        buf = self.buffer
+        start = pos + 1
+        window_size = 4096
+        while start < len(buf):
+            end = min(start + window_size, len(buf))
+            while end < len(buf) and buf[end - 1] == 0x5C:  # backslash
+                end += 1
+            window = buf[start:end]
+            if b'\\\\' in window:
+                window = window.replace(b'\\\\', b'__')
+            if b'\\"' in window:
+                window = window.replace(b'\\"', b'__')
+            offset = window.find(b'"')
+            if offset >= 0:
+                return start + offset + 1
+            # Scanned pages are not needed until the value is read
+            self._release(start, end)
+            start = end
+            window_size = min(window_size * 4, 8 * 1024 * 1024)
+        self._error("Unterminated string", pos)
+
+    def _value_end(self, pos: int) -> int:
+        """Return the offset just past the JSON value starting at pos"""
+        first = self.buffer[pos:pos + 1]
+        if first == b'"':
+            return self._string_end(pos)
+        if first in (b'{', b'['):
+            depth = 0
+            i = pos
+            while True:
+                match = self._STRUCTURE_RE.search(self.buffer, i)
+                if not match:
+                    self._error("Unterminated container", pos)
+                token = match.group()
+                if token == b'"':
+                    i = self._string_end(match.start())
+                    continue
+                depth += 1 if token in (b'{', b'[') else -1
+                i = match.end()
+                if depth == 0:
+                    return i
+        match = self._SCALAR_RE.match(self.buffer, pos)
+        if not match:
+            self._error("Expecting value", pos)
+        return match.end()
+
+    def _members(self, pos: int) -> Iterator[Tuple[str, int, int]]:
+        """Yield (key, value_start, value_end) for the object starting at pos"""
+        pos = self._expect(pos, b'{')
+        pos = self._skip_ws(pos)
+        if self.buffer[pos:pos + 1] == b'}':
+            return
+        while True:
+            pos = self._skip_ws(pos)
+            if self.buffer[pos:pos + 1] != b'"':
+                self._error("Expecting property name enclosed in double quotes", pos)
+            key_end = self._string_end(pos)
+            key = json.loads(self.buffer[pos:key_end])
+            pos = self._skip_ws(self._expect(key_end, b':'))
+            value_end = self._value_end(pos)
+            yield key, pos, value_end
+            pos = self._skip_ws(value_end)
+            separator = self.buffer[pos:pos + 1]
+            if separator == b'}':
+                return
+            if separator != b',':
+                self._error("Expecting ',' delimiter", pos)
+            pos += 1
+
+    def _decode(self, start: int, end: int) -> Any:
+        return json.loads(self.buffer[start:end])
+
+    def _output_value(self, start: int, end: int) -> Union[str, LazyOutput]:
+        if self.buffer[start:start + 1] != b'"':
+            self._error("Expecting string value in raw_outputs", start)
+        if end - start > self.lazy_threshold:
+            return LazyOutput(self.buffer, start, end)
+        return self._decode(start, end)
+
+    def _release(self, start: int, end: int):
+        """Drop already scanned pages of the map from resident memory"""
+        if not hasattr(self.buffer, 'madvise'):
+            return
+        aligned_start = start - start % mmap.PAGESIZE
+        self.buffer.madvise(mmap.MADV_DONTNEED, aligned_start, end - aligned_start)
+
+    def metadata(self) -> Dict[str, Any]:
+        """Decode only the metadata object; the collector writes it before the outputs"""
+        for section, start, end in self._members(0):
+            if section == 'metadata':
+                return self._decode(start, end)
+        return {}
+
+    def iter_raw_outputs(self) -> Iterator[Tuple[str, Union[str, LazyOutput]]]:
+        """Yield (key, value) pairs from the snapshot's raw_outputs object"""
+        for section, start, end in self._members(0):
+            if section == 'raw_outputs':
+                for key, value_start, value_end in self._members(start):
+                    yield key, self._output_value(value_start, value_end)
+
+    def load(self, wanted: Optional[Callable[[str], bool]] = None) -> Dict[str, Any]:
+        """Build a snapshot dict with large raw outputs left lazy
+
+        Outputs rejected by ``wanted`` are skipped over without decoding.
+        """
+        snapshot: Dict[str, Any] = {}
+        for section, start, end in self._members(0):
+            if section == 'raw_outputs':
+                snapshot[section] = {
+                    key: self._output_value(value_start, value_end)
+                    for key, value_start, value_end in self._members(start)
+                    if wanted is None or wanted(key)
+                }
+            else:
+                snapshot[section] = self._decode(start, end)
+        return snapshot
+
+def compress_output(codec: str, data: bytes, level: Optional[int] = None) -> bytes:
+    """Compress one output for a snapshot container"""
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+    if codec == 'zlib':
+        return zlib.compress(data, -1 if level is None else level)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise OSError("zstd compression requires the zstandard package (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    return data
+
+def decompress_output(codec: str, data: bytes) -> bytes:
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'zstd':
+        # The collector streams through zstd, so frames carry no content size
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+class SnapshotContainer:
+    """Memory-mapped snapshot container
+
+    Layout: CONTAINER_MAGIC and the header length (little-endian uint32),
+    a JSON header holding the collector metadata and an index of every
+    output (offset from the end of the header, compressed size,
+    uncompressed size, codec), then the compressed outputs back to back.
+    Outputs are compressed independently and only decompressed when a
+    check reads them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < CONTAINER_PREAMBLE.size:
+                raise ValueError(f"{path} is not a snapshot container")
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = CONTAINER_PREAMBLE.unpack_from(self.buffer)
+        if magic != CONTAINER_MAGIC:
+            raise ValueError(f"{path} is not a snapshot container")
+        self.data_start = CONTAINER_PREAMBLE.size + header_size
+        if self.data_start > len(self.buffer):
+            raise ValueError(f"{path} is truncated (header extends past the end of the file)")
+        self.header = json.loads(self.buffer[CONTAINER_PREAMBLE.size:self.data_start])
+        if self.header.get('format_version') != CONTAINER_FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported container version {self.header.get('format_version')}")
+
+    def outputs(self, wanted: Optional[Callable[[str], bool]] = None) -> Dict[str, PackedOutput]:
+        """Index entries as lazy outputs; nothing is decompressed yet"""
+        outputs = {}
+        for key, entry in self.header.get('outputs', {}).items():
+            if wanted is not None and not wanted(key):
+                continue
+            codec = entry.get('codec')
+            if codec not in CONTAINER_CODECS:
+                raise ValueError(f"{self.path}: unknown codec {codec!r} for output {key}")
+            if codec == 'zstd' and zstandard is None:
+                raise OSError(f"Reading {self.path} requires the zstandard package (pip install zstandard)")
+            start = self.data_start + entry['offset']
+            end = start + entry['size']
+            if end > len(self.buffer):
+                raise ValueError(f"{self.path} is truncated (output {key} extends past the end of the file)")
+            outputs[key] = PackedOutput(self.buffer, start, end, codec, entry['raw_size'])
+        return outputs
+
+    def load(self, wanted: Optional[Callable[[str], bool]] = None) -> Dict[str, Any]:
+        return {"metadata": self.header.get('metadata', {}), "raw_outputs": self.outputs(wanted)}
+
+def write_snapshot_container(path: str, snapshot: Dict[str, Any], codec: str = 'zlib',
+                             level: Optional[int] = None):
+    """Write a snapshot as a container, renamed into place once complete
+
+    Outputs that do not get smaller (tiny or empty ones) are stored as-is.
+    """
+    index = {}
+    blobs = []
+    offset = 0
+    for key, value in snapshot.get('raw_outputs', {}).items():
+        raw = str(value).encode('utf-8', 'surrogatepass')
+        blob = compress_output(codec, raw, level)
+        entry_codec = codec
+        if len(blob) >= len(raw):
+            blob, entry_codec = raw, 'none'
+        index[key] = {"offset": offset, "size": len(blob), "raw_size": len(raw), "codec": entry_codec}
+        blobs.append(blob)
+        offset += len(blob)
+    header = json.dumps({"format_version": CONTAINER_FORMAT_VERSION,
+                         "metadata": snapshot.get('metadata', {}),
+                         "outputs": index}, separators=(',', ':')).encode('utf-8')
+    with open(path + '.partial', 'wb') as f:
+        f.write(CONTAINER_PREAMBLE.pack(CONTAINER_MAGIC, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(path + '.partial', path)
+
+def parse_timestamp(value: Optional[str]) -> Optional[int]:
+    """Convert a collector ISO-8601 timestamp to epoch seconds"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=UTC)
+    return int(parsed.timestamp())
+
+def iter_raw_outputs(path: str, lazy_threshold: int = LAZY_OUTPUT_THRESHOLD) -> Iterator[Tuple[str, Union[str, LazyOutput]]]:
+    """Incrementally yield (key, value) pairs from a snapshot's raw_outputs"""
+    return SnapshotStream(path, lazy_threshold).iter_raw_outputs()
+
+def load_snapshot(path: str, wanted: Optional[Callable[[str], bool]] = None) -> Dict[str, Any]:
+    """Load a collector JSON snapshot from disk
+
+    Large files are memory-mapped and scanned incrementally so that big
+    journal/dmesg outputs are only decoded if an analyzer reads them.
+    Compressed snapshots (.gz, .zst) are decompressed while parsing.
+    Containers (.pxs) are memory-mapped and each output is decompressed
+    on first read. Delta snapshots get their unchanged outputs from the
+    snapshots they were based on (see apply_delta).
+
+    With ``wanted`` (see module_outputs), only the raw outputs it accepts
+    are loaded; the others are skipped over in JSON files and never read
+    from containers.
+    """
+    return apply_delta(path, read_snapshot_file(path, wanted), wanted)
+
+def read_snapshot_file(path: str, wanted: Optional[Callable[[str], bool]] = None) -> Dict[str, Any]:
+    """The snapshot as stored in the file, without resolving deltas"""
+    if path.endswith(CONTAINER_SUFFIX):
+        return SnapshotContainer(path).load(wanted)
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            return select_outputs(json.load(f), wanted)
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise OSError(f"Reading {path} requires the zstandard package (pip install zstandard)")
+        with open(path, 'rb') as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            return select_outputs(json.load(reader), wanted)
+    if wanted is not None or os.path.getsize(path) > STREAMING_LOAD_THRESHOLD:
+        return SnapshotStream(path).load(wanted)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def apply_delta(path: str, snapshot: Dict[str, Any], wanted: Optional[Callable[[str], bool]] = None,
+                depth: int = 0) -> Dict[str, Any]:
+    """Restore the outputs a delta snapshot only references or patches
+
+    Delta snapshots list the hash of every output in
+    ``metadata.output_hashes`` but carry only the outputs that changed
+    since ``metadata.delta.base``, the collection time of the host's
+    previous snapshot; outputs in ``metadata.delta.patched`` are line
+    diffs against their previous version. Unchanged outputs and the
+    versions to patch are read from that snapshot (resolving its own delta
+    in turn) in the same directory, and must have the expected hash there;
+    the restored text is checked against the collector's hash as well.
+    The resolved snapshot no longer carries ``metadata.delta``, so it can
+    be written out as a full snapshot.
+    """
+    metadata = snapshot.get('metadata', {})
+    if not metadata.get('delta'):
+        return snapshot
+    hashes = metadata.get('output_hashes', {})
+    outputs = snapshot.setdefault('raw_outputs', {})
+    # Outputs rejected by wanted were not loaded, so their patches are skipped too
+    patched = {key: digest for key, digest in metadata['delta'].get('patched', {}).items() if key in outputs}
+    missing = {key: digest for key, digest in hashes.items()
+               if key not in outputs and (wanted is None or wanted(key))}
+    missing.update(patched)
+    delta = metadata.pop('delta')
+    if not missing:
+        return snapshot
+    if depth >= DELTA_MAX_DEPTH:
+        raise ValueError(f"Delta chain of {path} is longer than {DELTA_MAX_DEPTH} snapshots")
+    base_path = find_delta_base(path, metadata.get('hostname', 'unknown'), delta['base'])
+    base = apply_delta(base_path, read_snapshot_file(base_path, missing.__contains__), missing.__contains__,
+                       depth + 1)
+    base_hashes = base['metadata'].get('output_hashes', {})
+    for key, digest in missing.items():
+        if key not in base['raw_outputs'] or base_hashes.get(key) != digest:
+            raise ValueError(f"Delta snapshot {path}: output '{key}' differs in its base snapshot {base_path}")
+        if key in patched:
+            outputs[key] = apply_line_patch(str(base['raw_outputs'][key]), str(outputs[key]))
+        else:
+            outputs[key] = base['raw_outputs'][key]
+        text = str(outputs[key])
+        # Invalid UTF-8 was replaced when the snapshot was assembled, so such text cannot match
+        if '\ufffd' not in text and hashlib.sha256(text.encode('utf-8')).hexdigest()[:16] != hashes.get(key):
+            raise ValueError(f"Delta snapshot {path}: output '{key}' does not match its hash "
+                             f"after restoring it from {base_path}")
+    # Same output order as a full snapshot
+    snapshot['raw_outputs'] = {key: outputs[key] for key in sorted(outputs)}
+    return snapshot
+
+def apply_line_patch(text: str, patch: str) -> str:
+    """Apply a ``diff -n`` (RCS format) patch
+
+    ``dL N`` deletes N lines from line L, ``aL N`` adds the following N
+    patch lines after line L; line numbers refer to the original text.
+    """
+    # diff counts lines by \n only; splitlines() would also split on \r, \f and others
+    lines = re.findall(r'[^\n]*\n|[^\n]+', text)
+    patch_lines = re.findall(r'[^\n]*\n|[^\n]+', patch)
+    result = []
+    position = i = 0
+    while i < len(patch_lines):
+        match = re.fullmatch(r'([ad])(\d+) (\d+)\n?', patch_lines[i])
+        if not match:
+            raise ValueError(f"Invalid line patch command: {patch_lines[i][:80]!r}")
+        start, count = int(match.group(2)), int(match.group(3))
+        i += 1
+        if match.group(1) == 'd':
+            result.extend(lines[position:start - 1])
+            position = start - 1 + count
+        else:
+            result.extend(lines[position:start])
+            position = start
+            result.extend(patch_lines[i:i + count])
+            i += count
+    result.extend(lines[position:])
+    return ''.join(result)
+
+_snapshot_identities: Dict[Tuple[str, float, int], Tuple[str, str]] = {}
+
+def find_delta_base(path: str, host: str, timestamp: str) -> str:
+    """The snapshot of ``host`` collected at ``timestamp`` next to ``path``
+
+    Newest files are checked first, as the base is usually the previous
+    snapshot. Identities are cached per process, so resolving the deltas
+    of a whole directory reads each file's metadata once.
+    """
+    directory = os.path.dirname(path) or '.'
+    candidates = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and is_inbox_snapshot(entry.name) and entry.path != path:
+            st = entry.stat()
+            candidates.append((st.st_mtime, entry.path, st.st_size))
+    for mtime, candidate, size in sorted(candidates, reverse=True):
+        identity = _snapshot_identities.get((candidate, mtime, size))
+        if identity is None:
+            try:
+                metadata = load_snapshot_metadata(candidate)
+            except (OSError, ValueError):
+                continue
+            identity = (metadata.get('hostname', 'unknown'), metadata.get('timestamp'))
+            _snapshot_identities[(candidate, mtime, size)] = identity
+        if identity == (host, timestamp):
+            return candidate
+    raise ValueError(f"Delta snapshot {path}: base snapshot of {host} collected at {timestamp} "
+                     f"not found in {directory}")
+
+def select_outputs(snapshot: Dict[str, Any], wanted: Optional[Callable[[str], bool]]) -> Dict[str, Any]:
+    if wanted is not None:
+        snapshot['raw_outputs'] = {key: value for key, value in snapshot.get('raw_outputs', {}).items()
+                                   if wanted(key)}
+    return snapshot
+
+def load_snapshot_metadata(path: str) -> Dict[str, Any]:
+    """Collector metadata of a snapshot, without reading its outputs where the format allows"""
+    if path.endswith(CONTAINER_SUFFIX):
+        return SnapshotContainer(path).header.get('metadata', {})
+    if path.endswith(('.gz', '.zst')):
+        return read_snapshot_file(path).get('metadata', {})
+    return SnapshotStream(path).metadata()
+
+def expand_snapshot_paths(patterns: List[str]) -> List[str]:
+    """Expand files, directories and glob patterns into a sorted list of snapshot files"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [m for suffix in SNAPSHOT_SUFFIXES
+                       for m in glob.glob(os.path.join(pattern, '**', '*' + suffix), recursive=True)]
+        elif glob.has_magic(pattern):
+            matches = glob.glob(pattern, recursive=True)
+        else:
+            # Plain paths are kept even if missing so they show up in the error report
+            matches = [pattern]
+        paths.update(os.path.normpath(m) for m in matches if not os.path.isdir(m))
+    return sorted(paths)
+
+def snapshot_base_path(path: str) -> str:
+    """Snapshot path without its format suffix: host-20260101.json.gz -> host-20260101"""
+    for suffix in SNAPSHOT_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+def convert_snapshot_file(path: str, target: str, to: str, codec: str,
+                          level: Optional[int]) -> Tuple[str, Optional[str], int, int]:
+    """Convert one snapshot and return (path, error, old size, new size)
+
+    The converted file keeps the original's modification time, so
+    age-based retention treats it like the snapshot it replaces.
+    """
+    try:
+        snapshot = load_snapshot(path)
+        if to == 'container':
+            write_snapshot_container(target, snapshot, codec, level)
+        else:
+            snapshot['raw_outputs'] = {key: str(value) for key, value in snapshot.get('raw_outputs', {}).items()}
+            with open(target + '.partial', 'w') as f:
+                json.dump(snapshot, f, indent=2)
+            os.replace(target + '.partial', target)
+        stat = os.stat(path)
+        os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        return path, None, stat.st_size, os.path.getsize(target)
+    except Exception as e:
+        return path, f"{type(e).__name__}: {e}", 0, 0
+
+def is_inbox_snapshot(name: str) -> bool:
+    """Snapshot files in the inbox, excluding hidden temp files and our own reports"""
+    return (name.endswith(SNAPSHOT_SUFFIXES) and not name.startswith('.')
+            and f"{REPORT_INFIX}." not in name)
+
+def snapshot_report_path(path: str, fmt: str) -> str:
+    """Report path next to a snapshot: host-20260101.json -> host-20260101.report.md"""
+    return f"{snapshot_base_path(path)}{REPORT_INFIX}.{'md' if fmt == 'markdown' else 'json'}"
@@ -0,0 +1,282 @@
+"""
+Proxmox health check inbox daemon
+Analyzes snapshots as they arrive in an inbox directory (watch)
+"""
+
+import os
+import sys
+import asyncio
+import ctypes
+import signal
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from proxmox_snapshot import is_inbox_snapshot, snapshot_report_path
+from proxmox_analyzer import RuleSet
+from proxmox_index import IssueIndex
+from proxmox_exporter import MetricsExporter
+from proxmox_workers import analyze_inbox_file
+
+# Watch daemon: wait this long after the last write event before analyzing
+WATCH_DEBOUNCE_SECONDS = 0.2
+WATCH_POLL_INTERVAL = 2.0
+
+class Inotify:
+    """Minimal ctypes binding of Linux inotify for directory watches"""
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, str] = {}
+
+    def add_watch(self, directory: str, mask: int):
+        wd = self._add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.watches[wd] = directory
+
+    def read_events(self) -> List[Tuple[str, str, int]]:
+        """Pending events as (directory, name, mask)"""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if wd in self.watches and name:
+                events.append((self.watches[wd], os.fsdecode(name), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+def open_inotify() -> Optional[Inotify]:
+    """Inotify instance, or None where it is unavailable (non-Linux, no libc symbol)"""
+    try:
+        return Inotify()
+    except (OSError, AttributeError):
+        return None
+
+class InboxWatcher:
+    """Analyze snapshots as they arrive in an inbox directory
+
+    File events come from inotify, or from polling where inotify is not
+    available. A snapshot renamed into the inbox (the collector's
+    .partial -> final rename, rsync) is complete and analyzed at once;
+    files written in place (scp) are analyzed once no write event arrived
+    for the debounce interval. Analysis runs in a process pool whose
+    workers stay alive, so each file only pays for parsing and checks.
+    """
+
+    def __init__(self, inbox: str, executor: ProcessPoolExecutor, formats: List[str],
+                 rules_path: str, history_dir: Optional[str] = None,
+                 debounce: float = WATCH_DEBOUNCE_SECONDS, poll_interval: float = WATCH_POLL_INTERVAL,
+                 use_inotify: bool = True, metrics_listen: Optional[Tuple[str, int]] = None,
+                 index_db: Optional[str] = None):
+        self.inbox = os.path.abspath(inbox)
+        self.executor = executor
+        self.formats = formats
+        self.rules_path = rules_path
+        self.history_dir = history_dir
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.metrics_listen = metrics_listen
+        self.exporter = MetricsExporter() if metrics_listen else None
+        self.index = IssueIndex(index_db) if index_db else None
+        self.rules_generation = 0
+        self.stats = {"analyzed": 0, "failed": 0, "hits": 0, "misses": 0}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._rerun = set()
+
+    def log(self, message: str):
+        print(message, file=sys.stderr, flush=True)
+
+    def watched_files(self) -> Iterator[str]:
+        """Inbox snapshots and the rule file"""
+        for entry in os.scandir(self.inbox):
+            if entry.is_file() and is_inbox_snapshot(entry.name):
+                yield entry.path
+        if os.path.exists(self.rules_path):
+            yield self.rules_path
+
+    def on_event(self, path: str, complete: bool):
+        if path == self.rules_path:
+            callback = self.reload_rules
+        elif os.path.dirname(path) == self.inbox and is_inbox_snapshot(os.path.basename(path)):
+            callback = self.submit
+        else:
+            return
+        timer = self._timers.pop(path, None)
+        if timer is not None:
+            timer.cancel()
+        if complete and callback is self.submit:
+            callback(path)
+        else:
+            self._timers[path] = self.loop.call_later(self.debounce, self._fire, path, callback)
+
+    def _fire(self, path: str, callback: Callable[[str], None]):
+        del self._timers[path]
+        callback(path)
+
+    def submit(self, path: str):
+        if not os.path.exists(path):
+            return
+        if path in self._running:
+            # Rewritten while being analyzed: analyze again afterwards
+            self._rerun.add(path)
+            return
+        self._running[path] = self.loop.create_task(self.analyze(path))
+
+    async def analyze(self, path: str):
+        started = time.perf_counter()
+        try:
+            result = await self.loop.run_in_executor(
+                self.executor, analyze_inbox_file, path, self.formats,
+                self.history_dir, self.rules_path, self.rules_generation)
+        finally:
+            del self._running[path]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        name = os.path.relpath(path, self.inbox)
+        if result['status'] == 'ok':
+            summary = result['summary']
+            self.stats["analyzed"] += 1
+            self.stats["hits"] += result['cache_stats']["hits"]
+            self.stats["misses"] += result['cache_stats']["misses"]
+            self.log(f"{name}: {summary['overall_health']} ({summary['critical_issues']} critical, "
+                     f"{summary['warning_issues']} warning, {summary['info_issues']} info) "
+                     f"in {elapsed_ms:.0f} ms")
+            if self.exporter is not None:
+                self.exporter.update(result['exporter_sample'])
+            if self.index is not None:
+                # Indexed by the daemon so the index has a single writer
+                self.index.add_report(result['issues'], path)
+        else:
+            self.stats["failed"] += 1
+            self.log(f"{name}: {result['error']}")
+        if path in self._rerun:
+            self._rerun.discard(path)
+            self.submit(path)
+
+    def reload_rules(self, path: str):
+        """Validate a changed rule file; workers switch to it on their next file"""
+        try:
+            rules = RuleSet.from_file(path)
+        except (OSError, ValueError) as e:
+            self.log(f"Keeping previous rules: {e}")
+            return
+        self.rules_generation += 1
+        self.log(f"Reloaded {len(rules.rules)} rules from {path}")
+
+    def submit_backlog(self):
+        """Analyze snapshots that arrived while the daemon was not running"""
+        for path in sorted(self.watched_files()):
+            if path == self.rules_path:
+                continue
+            mtime = os.stat(path).st_mtime
+            reports = [snapshot_report_path(path, fmt) for fmt in self.formats]
+            if not all(os.path.exists(r) and os.stat(r).st_mtime >= mtime for r in reports):
+                self.submit(path)
+
+    def on_inotify(self, inotify: Inotify):
+        for directory, name, mask in inotify.read_events():
+            self.on_event(os.path.join(directory, name), bool(mask & Inotify.IN_MOVED_TO))
+
+    async def poll(self):
+        """Fallback watcher: report files whose size and mtime held for one interval"""
+        def signatures():
+            result = {}
+            for path in self.watched_files():
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                result[path] = (st.st_mtime_ns, st.st_size)
+            return result
+
+        reported = signatures()
+        previous = reported
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = signatures()
+            for path, signature in current.items():
+                if previous.get(path) == signature and reported.get(path) != signature:
+                    reported[path] = signature
+                    self.on_event(path, complete=True)
+            previous = current
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, stop.set)
+
+        inotify = open_inotify() if self.use_inotify else None
+        poller = None
+        if inotify is not None:
+            mask = Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO | Inotify.IN_MODIFY
+            try:
+                inotify.add_watch(self.inbox, mask)
+                inotify.add_watch(os.path.dirname(self.rules_path), mask)
+            except OSError as e:
+                self.log(f"Cannot watch with inotify ({e}), polling instead")
+                inotify.close()
+                inotify = None
+        if inotify is not None:
+            self.loop.add_reader(inotify.fd, self.on_inotify, inotify)
+        else:
+            poller = self.loop.create_task(self.poll())
+        self.log(f"Watching {self.inbox} ({'inotify' if inotify else 'polling'}, "
+                 f"rules: {self.rules_path})")
+
+        server = None
+        if self.exporter is not None:
+            if 'json' in self.formats:
+                self.exporter.load_reports([snapshot_report_path(path, 'json')
+                                            for path in self.watched_files() if path != self.rules_path])
+            host, port = self.metrics_listen
+            server = await asyncio.start_server(self.exporter.handle, host, port)
+            self.log(f"Serving metrics of {len(self.exporter.hosts)} hosts on http://{host}:{port}/metrics")
+        if self.index is not None and 'json' in self.formats:
+            # Reports written while the daemon was not indexing; unchanged files are skipped
+            for path in self.watched_files():
+                report = snapshot_report_path(path, 'json')
+                if path != self.rules_path and os.path.exists(report):
+                    try:
+                        self.index.add_file(report)
+                    except (OSError, ValueError, KeyError) as e:
+                        self.log(f"Cannot index {report}: {e}")
+
+        self.submit_backlog()
+        await stop.wait()
+
+        self.log("Stopping, waiting for running analyses")
+        if inotify is not None:
+            self.loop.remove_reader(inotify.fd)
+            inotify.close()
+        if poller is not None:
+            poller.cancel()
+        for timer in self._timers.values():
+            timer.cancel()
+        self._rerun.clear()
+        while self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        if server is not None:
+            server.close()
+            await server.wait_closed()
@@ -0,0 +1,176 @@
+"""
+Proxmox health check worker processes
+Per-process state and entry points of the batch, cluster, watch and collect
+worker pools
+"""
+
+import json
+import os
+import cProfile
+import signal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from proxmox_snapshot import load_snapshot, load_snapshot_metadata, parse_timestamp, snapshot_report_path
+from proxmox_analyzer import (
+    AnalysisProfiler, MetricStore, ParseCache, ProxmoxAnalyzer, RuleSet, TemplateStore,
+    generate_markdown_report, load_rules, module_outputs
+)
+from proxmox_exporter import exporter_sample
+
+_worker_parse_cache: Optional[ParseCache] = None
+_worker_rules: Optional[RuleSet] = None
+_worker_profile: Optional[str] = None
+_worker_cprofile: Optional[cProfile.Profile] = None
+_worker_cprofile_path: Optional[str] = None
+_worker_templates: Optional[TemplateStore] = None
+_worker_modules: Optional[List[str]] = None
+_worker_outputs: Optional[Callable[[str], bool]] = None
+
+def init_batch_worker(parse_cache_path: Optional[str], parse_cache_size: int,
+                      rules_path: Optional[str] = None, profile: Optional[str] = None,
+                      profile_output: Optional[str] = None, history_dir: Optional[str] = None,
+                      modules: Optional[List[str]] = None):
+    """Open per-process resources for batch workers"""
+    global _worker_parse_cache, _worker_rules, _worker_profile, _worker_cprofile, _worker_cprofile_path
+    global _worker_templates, _worker_modules, _worker_outputs
+    if parse_cache_path:
+        _worker_parse_cache = ParseCache(parse_cache_path, parse_cache_size)
+    if history_dir:
+        # Metrics are ingested by the parent; log templates are recorded by the workers
+        _worker_templates = TemplateStore(history_dir)
+    _worker_rules = load_rules(rules_path)
+    _worker_modules = modules
+    _worker_outputs = module_outputs(modules, _worker_rules) if modules is not None else None
+    _worker_profile = profile
+    if profile == 'cprofile':
+        # One stats file per worker, merged by the parent when the batch ends
+        _worker_cprofile = cProfile.Profile()
+        _worker_cprofile_path = f"{profile_output}.{os.getpid()}"
+
+def close_worker_parse_cache() -> bool:
+    """Close the parse cache of batch work run in this process; False if none was opened"""
+    if _worker_parse_cache is None:
+        return False
+    _worker_parse_cache.close()
+    return True
+
+def analyze_snapshot_file(path: str) -> Tuple[str, bool, str, Dict[str, int]]:
+    """Analyze one snapshot file and return (path, ok, ndjson_line, cache_stats)
+
+    Runs inside batch worker processes. Errors are captured per file and
+    returned as records so a single bad snapshot never aborts the batch.
+    The line is serialized in the worker to keep the parent process cheap.
+    """
+    analyzer = None
+    profiler = None
+    if _worker_profile:
+        profiler = AnalysisProfiler(count_regex=_worker_profile == 'basic',
+                                    trace_memory=_worker_profile == 'basic')
+        profiler.start()
+    if _worker_cprofile is not None:
+        _worker_cprofile.enable()
+    try:
+        raw_data = (profiler.run('load_snapshot', load_snapshot, path, _worker_outputs) if profiler
+                    else load_snapshot(path, _worker_outputs))
+        analyzer = ProxmoxAnalyzer(raw_data, parse_cache=_worker_parse_cache, rules=_worker_rules,
+                                   profiler=profiler, templates=_worker_templates, modules=_worker_modules)
+        report = analyzer.analyze_all()
+        record = {"file": path, "status": "ok", "report": report}
+        ok = True
+    except Exception as e:
+        record = {"file": path, "status": "error", "error": f"{type(e).__name__}: {e}"}
+        ok = False
+    finally:
+        if _worker_cprofile is not None:
+            _worker_cprofile.disable()
+            _worker_cprofile.dump_stats(_worker_cprofile_path)
+        if profiler is not None:
+            profiler.stop()
+        if _worker_parse_cache is not None:
+            _worker_parse_cache.flush()
+    cache_stats = analyzer.cache_stats if analyzer else {"hits": 0, "misses": 0}
+    return path, ok, json.dumps(record, separators=(',', ':')), cache_stats
+
+def read_snapshot_identity(path: str) -> Tuple[str, Optional[str], Optional[int], Optional[str]]:
+    """(path, hostname, collection time, error) of a snapshot, from its metadata only"""
+    try:
+        metadata = load_snapshot_metadata(path)
+        timestamp = parse_timestamp(metadata.get('timestamp'))
+        if timestamp is None:
+            timestamp = int(os.path.getmtime(path))
+    except (OSError, ValueError) as e:
+        return path, None, None, f"{type(e).__name__}: {e}"
+    return path, metadata.get('hostname', 'unknown'), timestamp, None
+
+def analyze_cluster_node(path: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """Analyze one node's snapshot and return (path, cluster facts, error)
+
+    Runs inside cluster workers; only the compact facts travel back to the
+    parent, never the snapshot or the full report.
+    """
+    try:
+        analyzer = ProxmoxAnalyzer(load_snapshot(path), parse_cache=_worker_parse_cache, rules=_worker_rules)
+        summary = analyzer.analyze_all()['summary']
+        node = analyzer.cluster_node()
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+    finally:
+        if _worker_parse_cache is not None:
+            _worker_parse_cache.flush()
+    node["file"] = path
+    node["health"] = {key: summary[key] for key in ('overall_health', 'critical_issues', 'warning_issues')}
+    return path, node, None
+
+def write_snapshot_reports(path: str, report: Dict[str, Any], formats: List[str]) -> List[str]:
+    """Write the report in each format next to the snapshot, renamed into place"""
+    written = []
+    for fmt in formats:
+        target = snapshot_report_path(path, fmt)
+        content = generate_markdown_report(report) if fmt == 'markdown' else json.dumps(report, indent=2)
+        with open(target + '.partial', 'w') as f:
+            f.write(content)
+        os.replace(target + '.partial', target)
+        written.append(target)
+    return written
+
+_worker_rules_generation = 0
+
+def init_watch_worker(parse_cache_path: Optional[str], parse_cache_size: int, rules_path: str):
+    """Batch worker setup; shutdown signals are left to the daemon so in-flight files finish"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    init_batch_worker(parse_cache_path, parse_cache_size, rules_path)
+
+def analyze_inbox_file(path: str, formats: List[str], history_dir: Optional[str],
+                       rules_path: str, rules_generation: int) -> Dict[str, Any]:
+    """Analyze one inbox snapshot and write its reports next to it
+
+    Runs inside watch workers. The rule file is re-read when the daemon
+    has accepted a new version of it (a new generation); if that fails the
+    worker keeps its previous rules.
+    """
+    global _worker_rules, _worker_rules_generation
+    if rules_generation != _worker_rules_generation:
+        try:
+            _worker_rules = RuleSet.from_file(rules_path)
+        except (OSError, ValueError):
+            pass
+        _worker_rules_generation = rules_generation
+
+    try:
+        # A fresh store per file sees what other workers appended meanwhile
+        history = MetricStore(history_dir) if history_dir else None
+        analyzer = ProxmoxAnalyzer(load_snapshot(path), history=history,
+                                   parse_cache=_worker_parse_cache, rules=_worker_rules)
+        report = analyzer.analyze_all()
+        if history is not None:
+            history.ingest_report(report)
+        reports = write_snapshot_reports(path, report, formats)
+    except Exception as e:
+        return {"file": path, "status": "error", "error": f"{type(e).__name__}: {e}"}
+    finally:
+        if _worker_parse_cache is not None:
+            _worker_parse_cache.flush()
+    return {"file": path, "status": "ok", "summary": report['summary'], "reports": reports,
+            "cache_stats": analyzer.cache_stats, "exporter_sample": exporter_sample(report),
+            "issues": {key: report[key] for key in ('metadata', 'summary', 'issues')}}
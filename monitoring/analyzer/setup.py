@@ -5,7 +5,8 @@ setup(
     version="1.0.0",
     description="Proxmox Health Check Analyzer",
     author="Proxmox Health Check Team",
-    py_modules=["proxmox_analyzer"],
+    py_modules=["proxmox_analyzer", "proxmox_snapshot", "proxmox_workers", "proxmox_watch",
+                "proxmox_collect", "proxmox_exporter", "proxmox_index"],
     install_requires=[
         "dataclasses>=0.8; python_version < '3.7'",
         "typing-extensions>=4.0.0",
@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ANALYZER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANALYZER_SCRIPT = os.path.join(ANALYZER_DIR, 'proxmox-analyzer.py')
+DATA_DIR = os.path.join(os.path.dirname(ANALYZER_DIR), 'data')
+
+def run_analyzer(*args: str, timeout: float = 120) -> subprocess.CompletedProcess:
+    """Run proxmox-analyzer.py with the given arguments, capturing its output"""
+    return subprocess.run([sys.executable, ANALYZER_SCRIPT, *args], capture_output=True, text=True,
+                          timeout=timeout)
+
+@pytest.fixture
+def sample_snapshot() -> str:
+    return os.path.join(DATA_DIR, 'jan-1-example.json')
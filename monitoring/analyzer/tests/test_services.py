@@ -0,0 +1,101 @@
+"""Smoke tests for the collection, inbox and Prometheus services"""
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from conftest import ANALYZER_SCRIPT, run_analyzer
+from proxmox_analyzer import ProxmoxAnalyzer
+from proxmox_exporter import PROMETHEUS_PREFIX, MetricsExporter, exporter_sample
+from proxmox_snapshot import SnapshotContainer, load_snapshot, write_snapshot_container
+
+def wait_for(condition, timeout: float = 60) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def test_collect_local_transport(tmp_path, sample_snapshot):
+    # A stand-in collector that streams a prebuilt container instead of running the checks
+    container = tmp_path / 'sample.pxs'
+    write_snapshot_container(str(container), load_snapshot(sample_snapshot))
+    collector = tmp_path / 'collector.sh'
+    collector.write_text(f"#!/bin/bash\ncat '{container}'\n")
+    output_dir = tmp_path / 'out'
+
+    result = run_analyzer('collect', 'node1', 'node2', '--transport', 'local', '--collector', str(collector),
+                          '--output-dir', str(output_dir), '--workers', '1')
+    assert result.returncode == 0, result.stderr
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    assert sorted(record['node'] for record in records) == ['node1', 'node2']
+    for record in records:
+        assert record['status'] == 'ok'
+        assert SnapshotContainer(record['file']).load()['metadata']['hostname'] == 'pve'
+        base = record['file'][:-len('.pxs')]
+        assert sorted(record['reports']) == [f"{base}.report.json", f"{base}.report.md"]
+        with open(f"{base}.report.json") as f:
+            assert json.load(f)['summary'] == record['summary']
+
+def test_collect_failing_collector(tmp_path):
+    collector = tmp_path / 'collector.sh'
+    collector.write_text("#!/bin/bash\necho 'no pvesh here' >&2\nexit 3\n")
+
+    result = run_analyzer('collect', 'node1', '--transport', 'local', '--collector', str(collector),
+                          '--output-dir', str(tmp_path / 'out'), '--workers', '1')
+    assert result.returncode == 1
+    record = json.loads(result.stdout)
+    assert record['node'] == 'node1' and record['status'] != 'ok'
+
+def test_watch_poll_serves_metrics(tmp_path, sample_snapshot):
+    inbox = tmp_path / 'inbox'
+    inbox.mkdir()
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, ANALYZER_SCRIPT, 'watch', str(inbox), '--poll', '--poll-interval', '0.1',
+         '--debounce', '0.1', '--workers', '1', '--metrics-listen', f'127.0.0.1:{port}'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        # Collectors copy to a hidden name and rename into place
+        shutil.copy(sample_snapshot, inbox / '.pve-20260101.json')
+        os.rename(inbox / '.pve-20260101.json', inbox / 'pve-20260101.json')
+        report = inbox / 'pve-20260101.report.json'
+        assert wait_for(report.exists), 'watch did not write the report'
+        assert (inbox / 'pve-20260101.report.md').exists()
+
+        def scrape() -> str:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as response:
+                return response.read().decode()
+        assert wait_for(lambda: 'host="pve"' in scrape())
+        health = json.loads(report.read_text())['summary']['overall_health']
+        assert f'{PROMETHEUS_PREFIX}status{{host="pve",status="{health}"}} 1' in scrape().splitlines()
+    finally:
+        process.send_signal(signal.SIGINT)
+        _, stderr = process.communicate(timeout=60)
+    assert process.returncode == 0, stderr
+    assert 'Analyzed 1 snapshots (0 failed)' in stderr
+
+def test_metrics_exporter_keeps_newest_sample(sample_snapshot):
+    report = ProxmoxAnalyzer(load_snapshot(sample_snapshot)).analyze_all()
+    sample = exporter_sample(report)
+    exporter = MetricsExporter()
+    assert exporter.update(sample)
+    body = exporter.body.decode()
+    assert f'# TYPE {PROMETHEUS_PREFIX}status gauge' in body
+    assert f'{PROMETHEUS_PREFIX}snapshot_timestamp_seconds{{host="pve"}} {sample["timestamp"]}' in body
+    assert body.endswith('\n')
+
+    older = dict(sample, timestamp=sample['timestamp'] - 60, health='critical')
+    assert not exporter.update(older)
+    assert exporter.body.decode() == body
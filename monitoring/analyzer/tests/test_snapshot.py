@@ -0,0 +1,123 @@
+"""Snapshot containers and conversion between the snapshot formats"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import ANALYZER_DIR, run_analyzer
+from proxmox_snapshot import SnapshotContainer, load_snapshot, write_snapshot_container, zstandard
+
+COLLECTOR_SCRIPT = os.path.join(os.path.dirname(ANALYZER_DIR), 'server', 'proxmox-data-collector.sh')
+
+OUTPUTS = {
+    "uptime": " 22:25:56 up 3 days,  4:01,  1 user,  load average: 0.12, 0.08, 0.03\n",
+    "pveversion": "pve-manager/8.1.3/b46aac3b42da5d15 (running kernel: 6.5.11-7-pve)\n" * 40,
+    "zfs_status": "",
+    "journal_errors": "Jan 01 22:00:01 pve kernel: ata1.00: exception Emask 0x0 – failed command\n"
+}
+METADATA = {"hostname": "pve", "timestamp": "2026-01-01T22:25:56Z", "collection_type": "raw_data"}
+
+ZSTD = pytest.param('zstd', marks=pytest.mark.skipif(zstandard is None, reason='zstandard not installed'))
+CODECS = ['none', 'gzip', 'zlib', ZSTD]
+# The collector compresses with the gzip and zstd command line tools
+COLLECTOR_CODECS = ['none', 'gzip', ZSTD]
+
+def output_texts(snapshot):
+    return {key: str(value) for key, value in snapshot['raw_outputs'].items()}
+
+def output_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def collector_container(tmp_path, outputs, compress: str) -> str:
+    """Let the collector's assemble_container pack the outputs, as it does on a node"""
+    if shutil.which('bash') is None or shutil.which('jq') is None:
+        pytest.skip('the collector needs bash and jq')
+    if compress != 'none' and shutil.which(compress) is None:
+        pytest.skip(f'{compress} not installed')
+    out_dir = tmp_path / 'outputs'
+    out_dir.mkdir()
+    for key, text in outputs.items():
+        (out_dir / f'{key}.out').write_bytes(text.encode('utf-8'))
+    path = tmp_path / 'collector.pxs'
+    with open(path, 'wb') as f:
+        subprocess.run(['bash', '-c', 'collector="$1" outputs="$2" codec="$3" metadata="$4"; set --; '
+                        'source "$collector"; TEMP_DIR="$outputs"; COMPRESS="$codec"; assemble_container "$metadata"',
+                        'bash', COLLECTOR_SCRIPT, str(out_dir), compress, json.dumps(METADATA)],
+                       stdout=f, check=True, timeout=60)
+    return str(path)
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_container_round_trip(tmp_path, codec):
+    path = str(tmp_path / 'pve.pxs')
+    write_snapshot_container(path, {"metadata": METADATA, "raw_outputs": OUTPUTS}, codec=codec)
+    snapshot = load_snapshot(path)
+    assert snapshot['metadata'] == METADATA
+    assert output_texts(snapshot) == OUTPUTS
+
+@pytest.mark.parametrize('codec', COLLECTOR_CODECS)
+def test_container_written_by_collector(tmp_path, codec):
+    path = collector_container(tmp_path, OUTPUTS, codec)
+    assert SnapshotContainer(path).load()['metadata'] == METADATA
+    assert output_texts(load_snapshot(path)) == OUTPUTS
+
+def test_container_without_outputs(tmp_path):
+    path = str(tmp_path / 'pve.pxs')
+    write_snapshot_container(path, {"metadata": METADATA, "raw_outputs": {}})
+    assert load_snapshot(path) == {"metadata": METADATA, "raw_outputs": {}}
+
+    collected = collector_container(tmp_path, {}, 'gzip')
+    assert SnapshotContainer(collected).load() == {"metadata": METADATA, "raw_outputs": {}}
+
+def test_convert_json_container_json(tmp_path, sample_snapshot):
+    result = run_analyzer('convert', sample_snapshot, '--output-dir', str(tmp_path / 'pxs'), '--workers', '1')
+    assert result.returncode == 0, result.stderr
+    container = tmp_path / 'pxs' / 'jan-1-example.pxs'
+    result = run_analyzer('convert', str(container), '--to', 'json', '--output-dir', str(tmp_path / 'json'),
+                          '--workers', '1')
+    assert result.returncode == 0, result.stderr
+
+    with open(sample_snapshot) as f:
+        original = json.load(f)
+    assert output_texts(load_snapshot(str(container))) == original['raw_outputs']
+    with open(tmp_path / 'json' / 'jan-1-example.json') as f:
+        assert json.load(f) == original
+    assert os.path.getmtime(container) == os.path.getmtime(sample_snapshot)
+
+@pytest.mark.parametrize('delta_format, to', [('json', 'container'), ('container', 'json')])
+def test_convert_resolves_delta(tmp_path, delta_format, to):
+    base = {"a": "line1\nline2\nline3\n", "b": "same\n", "c": "old\n"}
+    new = {"a": "line1\nline2 changed\nline3\n", "b": "same\n", "c": "new\n"}
+    # The collector sends changed outputs as diff -n patches and leaves unchanged ones out
+    (tmp_path / 'old.out').write_text(base['a'])
+    (tmp_path / 'new.out').write_text(new['a'])
+    patch = subprocess.run(['diff', '-n', str(tmp_path / 'old.out'), str(tmp_path / 'new.out')],
+                           capture_output=True, text=True).stdout
+    snapshots = tmp_path / 'snapshots'
+    snapshots.mkdir()
+    with open(snapshots / 'pve-1.json', 'w') as f:
+        json.dump({"metadata": {"hostname": "pve", "timestamp": "2026-01-01T00:00:00Z",
+                                "output_hashes": {key: output_hash(text) for key, text in base.items()}},
+                   "raw_outputs": base}, f)
+    delta = {"metadata": {"hostname": "pve", "timestamp": "2026-01-01T01:00:00Z",
+                          "output_hashes": {key: output_hash(text) for key, text in new.items()},
+                          "delta": {"base": "2026-01-01T00:00:00Z", "chain": 1,
+                                    "patched": {"a": output_hash(base['a'])}}},
+             "raw_outputs": {"a": patch, "c": new['c']}}
+    if delta_format == 'container':
+        delta_path = snapshots / 'pve-2.pxs'
+        write_snapshot_container(str(delta_path), delta)
+    else:
+        delta_path = snapshots / 'pve-2.json'
+        with open(delta_path, 'w') as f:
+            json.dump(delta, f)
+
+    result = run_analyzer('convert', str(delta_path), '--to', to, '--output-dir', str(tmp_path / 'converted'),
+                          '--workers', '1')
+    assert result.returncode == 0, result.stderr
+    # The converted snapshot stands on its own, without the snapshot it was based on
+    snapshot = load_snapshot(str(tmp_path / 'converted' / f"pve-2.{'pxs' if to == 'container' else 'json'}"))
+    assert 'delta' not in snapshot['metadata']
+    assert output_texts(snapshot) == new
@@ -0,0 +1,116 @@
+#!/bin/bash
+
+# JSON Assembly Benchmark
+# Compares the old per-file jq rewrite loop with the single-pass assembly in
+# proxmox-data-collector.sh, using the raw outputs of a sample snapshot
+
+set -euo pipefail
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+SAMPLE_FILE="$SCRIPT_DIR/../data/jan-1-example.json"
+SCALE=1
+
+# Parse arguments
+while [[ $# -gt 0 ]]; do
+    case $1 in
+        --sample) SAMPLE_FILE="$2"; shift 2 ;;
+        --scale) SCALE="$2"; shift 2 ;;
+        --help|-h) echo "Usage: $0 [--sample snapshot.json] [--scale N]"; exit 0 ;;
+        *) echo "Unknown option: $1"; exit 1 ;;
+    esac
+done
+
+if ! [[ "$SCALE" =~ ^[1-9][0-9]*$ ]]; then
+    echo "Invalid --scale value: $SCALE"; exit 1
+fi
+
+# Load the collector functions (TEMP_DIR, generate_raw_data_json, ...)
+set --
+source "$SCRIPT_DIR/proxmox-data-collector.sh"
+COLLECTION_SECONDS=0
+
+# Recreate the collector's .out files; --scale N repeats every output N times
+explode_sample() {
+    local key copy
+    jq -r '.raw_outputs | keys[]' "$SAMPLE_FILE" | while read -r key; do
+        jq -j --arg key "$key" '.raw_outputs[$key]' "$SAMPLE_FILE" > "$TEMP_DIR/$key.out"
+        for ((copy = 2; copy <= SCALE; copy++)); do
+            cp "$TEMP_DIR/$key.out" "$TEMP_DIR/${key}_$copy.out"
+        done
+    done
+}
+
+# The assembly loop used before the single-pass rewrite, kept as the baseline
+legacy_generate_raw_data_json() {
+    local final_json="$1"
+    echo '{"metadata": {}, "raw_outputs": {}}' > "$final_json"
+    for file in "$TEMP_DIR"/*.out; do
+        [[ -f "$file" ]] || continue
+        local basename=$(basename "$file" .out)
+        local content=$(cat "$file" | jq -Rs . 2>/dev/null || echo '""')
+        jq --arg key "$basename" --argjson content "$content" '.raw_outputs[$key] = $content' "$final_json" > "$TEMP_DIR/temp.json"
+        mv "$TEMP_DIR/temp.json" "$final_json"
+    done
+}
+
+RESULTS_DIR=$(mktemp -d)
+trap 'rm -rf "$TEMP_DIR" "$RESULTS_DIR"' EXIT
+
+report() {
+    local label="$1" start_us="$2" file="$3" end_us
+    now_us end_us
+    local elapsed=$((end_us - start_us))
+    printf '%-24s %4d.%03d s %12d bytes\n' "$label" $((elapsed / 1000000)) $((elapsed % 1000000 / 1000)) "$(stat -c %s "$file")"
+}
+
+same_outputs() {
+    cmp -s <(jq -S .raw_outputs "$RESULTS_DIR/legacy.json") <(jq -S .raw_outputs "$1")
+}
+
+explode_sample
+outputs=("$TEMP_DIR"/*.out)
+echo "Sample: $SAMPLE_FILE (x$SCALE)"
+echo "Outputs: ${#outputs[@]} files, $(cat "${outputs[@]}" | wc -c) bytes"
+echo
+
+now_us start
+legacy_generate_raw_data_json "$RESULTS_DIR/legacy.json"
+report "per-file jq loop" "$start" "$RESULTS_DIR/legacy.json"
+
+for COMPRESS in none gzip zstd; do
+    command_exists "$COMPRESS" || [[ "$COMPRESS" == "none" ]] || continue
+    OUTPUT_FILE="$RESULTS_DIR/single-pass.$COMPRESS"
+    now_us start
+    generate_raw_data_json 2>/dev/null
+    report "single pass ($COMPRESS)" "$start" "$OUTPUT_FILE"
+    case "$COMPRESS" in
+        gzip) gzip -dc "$OUTPUT_FILE" > "$OUTPUT_FILE.json" ;;
+        zstd) zstd -q -dc "$OUTPUT_FILE" > "$OUTPUT_FILE.json" ;;
+        *) cp "$OUTPUT_FILE" "$OUTPUT_FILE.json" ;;
+    esac
+    if ! same_outputs "$OUTPUT_FILE.json"; then
+        log_error "single pass ($COMPRESS) output differs from the per-file loop"
+        exit 1
+    fi
+done
+
+# Snapshot containers (per-output compression), checked through the analyzer's converter
+ANALYZER="$SCRIPT_DIR/../analyzer/proxmox-analyzer.py"
+FORMAT=container
+for COMPRESS in none gzip zstd; do
+    command_exists "$COMPRESS" || [[ "$COMPRESS" == "none" ]] || continue
+    OUTPUT_FILE="$RESULTS_DIR/container-$COMPRESS.pxs"
+    now_us start
+    generate_raw_data_json 2>/dev/null
+    report "container ($COMPRESS)" "$start" "$OUTPUT_FILE"
+    command_exists python3 || continue
+    [[ "$COMPRESS" != "zstd" ]] || python3 -c 'import zstandard' 2>/dev/null || continue
+    if ! python3 "$ANALYZER" convert --to json "$OUTPUT_FILE" 2>/dev/null ||
+            ! same_outputs "${OUTPUT_FILE%.pxs}.json"; then
+        log_error "container ($COMPRESS) outputs differ from the per-file loop"
+        exit 1
+    fi
+done
+
+echo
+echo "All methods produced identical raw_outputs"
@@ -7,6 +7,7 @@ set -euo pipefail
 
 INSTALL_DIR="/opt/proxmox-datacollector"
 SCRIPT_NAME="proxmox-data-collector.sh"
+SAMPLER_NAME="proxmox-sampler.py"
 REPORTS_DIR="/var/log/proxmox-datacollector"
 SERVICE_NAME="proxmox-datacollector"
 
@@ -63,6 +64,15 @@ else
     exit 1
 fi
 
+# The /proc sampler is optional; the collector skips its samples when it is missing
+if [[ -f "$SAMPLER_NAME" ]]; then
+    log_info "Installing sampler..."
+    cp "$SAMPLER_NAME" "$INSTALL_DIR/"
+    chmod +x "$INSTALL_DIR/$SAMPLER_NAME"
+else
+    log_warn "Sampler '$SAMPLER_NAME' not found in current directory, skipping"
+fi
+
 # Create systemd service file
 log_info "Creating systemd service..."
 cat > "/etc/systemd/system/${SERVICE_NAME}.service" << EOF
@@ -72,7 +82,8 @@ After=multi-user.target
 
 [Service]
 Type=oneshot
-ExecStart=$INSTALL_DIR/$SCRIPT_NAME --output-file $REPORTS_DIR/proxmox-data-\$(date +\%Y\%m\%d-\%H\%M\%S).json
+ExecStart=$INSTALL_DIR/$SCRIPT_NAME --output-file $REPORTS_DIR/proxmox-data-\$(date +\%Y\%m\%d-\%H\%M\%S).json --journal-cursor /var/lib/${SERVICE_NAME}/journal.cursor --samples /var/lib/${SERVICE_NAME}/samples.ring
+StateDirectory=${SERVICE_NAME}
 User=root
 StandardOutput=journal
 StandardError=journal
@@ -81,6 +92,23 @@ StandardError=journal
 WantedBy=multi-user.target
 EOF
 
+# Create systemd service for the /proc sampler (samples every 5 s, summarized into each snapshot)
+cat > "/etc/systemd/system/${SERVICE_NAME}-sampler.service" << EOF
+[Unit]
+Description=Proxmox Data Collector /proc Sampler
+
+[Service]
+Type=simple
+ExecStart=/usr/bin/python3 $INSTALL_DIR/$SAMPLER_NAME run --state /var/lib/${SERVICE_NAME}/samples.ring
+StateDirectory=${SERVICE_NAME}
+Restart=on-failure
+Nice=10
+MemoryMax=64M
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 # Create systemd timer file
 log_info "Creating systemd timer..."
 cat > "/etc/systemd/system/${SERVICE_NAME}.timer" << EOF
@@ -139,6 +167,7 @@ cat > "$INSTALL_DIR/cleanup-reports.sh" << EOF
 # Clean up old data collection reports
 find $REPORTS_DIR -name "*.json" -mtime +30 -delete
 find $REPORTS_DIR -name "*.json.gz" -mtime +90 -delete
+find $REPORTS_DIR -name "*.pxs" -mtime +90 -delete
 EOF
 chmod +x "$INSTALL_DIR/cleanup-reports.sh"
 
@@ -152,6 +181,7 @@ systemctl daemon-reload
 # Services are created but not enabled or started
 log_info "Services created but not started - you can enable them later with:"  
 log_info "  systemctl enable --now ${SERVICE_NAME}.timer"
+log_info "  systemctl enable --now ${SERVICE_NAME}-sampler.service    # optional, for load/memory peaks"
 
 # Create manual run script
 log_info "Creating manual run script..."
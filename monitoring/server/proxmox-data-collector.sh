@@ -10,139 +10,291 @@ SCRIPT_VERSION="1.0.0"
 TIMESTAMP=$(date -u +"%Y-%m-%dT%H:%M:%SZ")
 HOSTNAME=$(hostname)
 OUTPUT_FILE=""
+COMPRESS=""
+FORMAT=""
+DELTA_DIR=""
+DELTA_MAX_CHAIN=24
+DELTA_METADATA=""
+JOURNAL_CURSOR_FILE=""
+JOURNAL_PRIORITY="warning"
+JOURNAL_NEXT_CURSOR=""
+SAMPLES_FILE=""
+SAMPLER_SCRIPT="$(dirname "$(readlink -f "${BASH_SOURCE[0]}")")/proxmox-sampler.py"
+MAX_JOBS="${COLLECTOR_MAX_JOBS:-8}"
+COMMAND_TIMEOUT=30
 TEMP_DIR=$(mktemp -d)
+CACHE_DIR="$TEMP_DIR/cache"
+TIMING_DIR="$TEMP_DIR/timings"
+mkdir -p "$CACHE_DIR" "$TIMING_DIR"
 trap 'rm -rf "$TEMP_DIR"' EXIT
 
 # Parse arguments
 while [[ $# -gt 0 ]]; do
     case $1 in
         --output-file) OUTPUT_FILE="$2"; shift 2 ;;
-        --help|-h) echo "Usage: $0 [--output-file /path/to/output.json]"; exit 0 ;;
+        --jobs) MAX_JOBS="$2"; shift 2 ;;
+        --compress) COMPRESS="$2"; shift 2 ;;
+        --format) FORMAT="$2"; shift 2 ;;
+        --delta-dir) DELTA_DIR="$2"; shift 2 ;;
+        --delta-max-chain) DELTA_MAX_CHAIN="$2"; shift 2 ;;
+        --journal-cursor) JOURNAL_CURSOR_FILE="$2"; shift 2 ;;
+        --journal-priority) JOURNAL_PRIORITY="$2"; shift 2 ;;
+        --samples) SAMPLES_FILE="$2"; shift 2 ;;
+        --help|-h) echo "Usage: $0 [--output-file /path/to/output{.json[.gz|.zst]|.pxs}] [--jobs N] [--compress none|gzip|zstd] [--format json|container] [--delta-dir DIR [--delta-max-chain N]] [--journal-cursor FILE [--journal-priority LEVEL]] [--samples RING_FILE]"; exit 0 ;;
         *) echo "Unknown option: $1"; exit 1 ;;
     esac
 done
 
+if ! [[ "$MAX_JOBS" =~ ^[1-9][0-9]*$ ]]; then
+    echo "Invalid --jobs value: $MAX_JOBS"; exit 1
+fi
+if ! [[ "$DELTA_MAX_CHAIN" =~ ^[0-9]+$ ]]; then
+    echo "Invalid --delta-max-chain value: $DELTA_MAX_CHAIN"; exit 1
+fi
+if ! [[ "$JOURNAL_PRIORITY" =~ ^[0-7a-z]+(\.\.[0-7a-z]+)?$ ]]; then
+    echo "Invalid --journal-priority value: $JOURNAL_PRIORITY"; exit 1
+fi
+
+# Format and compression default to the output file extension
+if [[ -z "$FORMAT" ]]; then
+    case "$OUTPUT_FILE" in
+        *.pxs) FORMAT="container" ;;
+        *) FORMAT="json" ;;
+    esac
+fi
+case "$FORMAT" in
+    json|container) ;;
+    *) echo "Invalid --format value: $FORMAT"; exit 1 ;;
+esac
+# Containers compress each output on its own, gzip unless told otherwise
+if [[ -z "$COMPRESS" ]]; then
+    case "$OUTPUT_FILE" in
+        *.gz) COMPRESS="gzip" ;;
+        *.zst) COMPRESS="zstd" ;;
+        *) [[ "$FORMAT" == "container" ]] && COMPRESS="gzip" || COMPRESS="none" ;;
+    esac
+fi
+case "$COMPRESS" in
+    none|gzip|zstd) ;;
+    *) echo "Invalid --compress value: $COMPRESS"; exit 1 ;;
+esac
+
+# Expensive commands that several outputs are filtered from. Each one runs
+# once into $CACHE_DIR and the filtered views are derived from the cache.
+declare -A SOURCE_COMMANDS=(
+    [dmesg]="dmesg"
+    [journal_boot]="journalctl -b"
+    [fsck_journal]="journalctl -u systemd-fsck@* --no-pager"
+    [iostat]="iostat -x 1 3"
+    [diskstats]="cat /proc/diskstats"
+    [apt_upgradable]="apt list --upgradable"
+)
+
 log_info() { echo "[INFO] $1" >&2; }
 log_error() { echo "[ERROR] $1" >&2; }
 
+now_us() { printf -v "$1" '%s' "${EPOCHREALTIME//[.,]/}"; }
+
+# Record wall time and exit code of one command for the metadata
+record_timing() {
+    local name="$1" start_us="$2" rc="$3" end_us
+    now_us end_us
+    local elapsed=$((end_us - start_us))
+    printf '%d.%06d %s\n' $((elapsed / 1000000)) $((elapsed % 1000000)) "$rc" > "$TIMING_DIR/$name"
+}
+
 safe_exec() {
     local cmd="$1"
     local output_file="$2"
+    local name="${output_file##*/}" rc=0 start
+    now_us start
+    {
+        echo "=== Command: $cmd ==="
+        timeout "$COMMAND_TIMEOUT" bash -c "$cmd" 2>&1 || rc=$?
+        echo "=== Exit Code: $rc ==="
+    } > "$output_file" 2>&1
+    record_timing "${name%.out}" "$start" "$rc"
+}
+
+# Wait until fewer than MAX_JOBS background jobs are running
+throttle() {
+    while (( $(jobs -rp | wc -l) >= MAX_JOBS )); do
+        wait -n || true
+    done
+}
+
+# Run a collection command in the background, respecting the job limit
+run_job() {
+    throttle
+    "$@" &
+}
+
+# Run an expensive source command once, caching stdout, stderr and exit code
+fetch_source() {
+    local source="$1" rc=0 start
+    now_us start
+    timeout "$COMMAND_TIMEOUT" bash -c "${SOURCE_COMMANDS[$source]}" \
+        > "$CACHE_DIR/$source" 2> "$CACHE_DIR/$source.err" || rc=$?
+    record_timing "source.$source" "$start" "$rc"
+    # The .rc file doubles as the completion marker for derived views
+    echo "$rc" > "$CACHE_DIR/$source.rc.tmp"
+    mv "$CACHE_DIR/$source.rc.tmp" "$CACHE_DIR/$source.rc"
+}
+
+start_source() {
+    touch "$CACHE_DIR/$1.started"
+    run_job fetch_source "$1"
+}
+
+# Write an output file by filtering a cached source. The header shows the
+# equivalent pipeline ("dmesg | grep ..."), so outputs look the same as
+# when each view ran its own copy of the source command. With an empty
+# filter the source output and exit code are used as-is.
+derive_view() {
+    local source="$1" filter="$2" output_file="$3"
+    local cmd="${SOURCE_COMMANDS[$source]}" name="${output_file##*/}" rc=0 start
+    [[ -e "$CACHE_DIR/$source.started" ]] || return 0
+    [[ -n "$filter" ]] && cmd="$cmd | $filter"
+    until [[ -e "$CACHE_DIR/$source.rc" ]]; do sleep 0.05; done
+    now_us start
     {
         echo "=== Command: $cmd ==="
-        if timeout 30 bash -c "$cmd" 2>&1; then
-            echo "=== Exit Code: 0 ==="
+        cat "$CACHE_DIR/$source.err"
+        if [[ -n "$filter" ]]; then
+            timeout "$COMMAND_TIMEOUT" bash -c "$filter" < "$CACHE_DIR/$source" 2>&1 || rc=$?
         else
-            echo "=== Exit Code: $? ==="
+            cat "$CACHE_DIR/$source"
+            rc=$(< "$CACHE_DIR/$source.rc")
         fi
+        echo "=== Exit Code: $rc ==="
     } > "$output_file" 2>&1
+    record_timing "${name%.out}" "$start" "$rc"
 }
 
 command_exists() { command -v "$1" >/dev/null 2>&1; }
 
+# Start all shared sources first so they overlap with everything else
+start_sources() {
+    log_info "Starting shared sources (max $MAX_JOBS concurrent jobs)..."
+    
+    start_source dmesg
+    # With journal cursors the journal is read incrementally instead (collect_journal)
+    [[ -n "$JOURNAL_CURSOR_FILE" ]] || start_source journal_boot
+    start_source fsck_journal
+    command_exists iostat && start_source iostat
+    start_source diskstats
+    # apt list needs a fresh package index, so it runs after apt update
+    touch "$CACHE_DIR/apt_upgradable.started"
+    run_job eval 'safe_exec "apt update" "$TEMP_DIR/apt_update.out"; fetch_source apt_upgradable'
+}
+
 # System Overview Data Collection
 collect_system_overview() {
     log_info "Collecting system overview data..."
     
-    safe_exec "pveversion" "$TEMP_DIR/pveversion.out"
-    safe_exec "uname -a" "$TEMP_DIR/uname.out"
-    safe_exec "journalctl -b -p err --no-pager" "$TEMP_DIR/boot_errors.out"
-    safe_exec "journalctl -b | grep -i 'error\|fail\|warn' | head -50" "$TEMP_DIR/boot_warnings.out"
-    safe_exec "dmesg | grep -i 'error\|fail\|warn' | head -50" "$TEMP_DIR/dmesg_issues.out"
-    safe_exec "systemctl status pve-cluster --no-pager" "$TEMP_DIR/pve_cluster.out"
-    safe_exec "systemctl status pvedaemon --no-pager" "$TEMP_DIR/pvedaemon.out"
-    safe_exec "systemctl status pveproxy --no-pager" "$TEMP_DIR/pveproxy.out"
-    safe_exec "systemctl status pvestatd --no-pager" "$TEMP_DIR/pvestatd.out"
-    safe_exec "systemctl status pve-firewall --no-pager" "$TEMP_DIR/pve_firewall.out"
+    run_job safe_exec "pveversion" "$TEMP_DIR/pveversion.out"
+    run_job safe_exec "uname -a" "$TEMP_DIR/uname.out"
+    run_job safe_exec "journalctl -b -p err --no-pager" "$TEMP_DIR/boot_errors.out"
+    run_job derive_view journal_boot "grep -i 'error\|fail\|warn' | head -50" "$TEMP_DIR/boot_warnings.out"
+    run_job derive_view dmesg "grep -i 'error\|fail\|warn' | head -50" "$TEMP_DIR/dmesg_issues.out"
+    run_job safe_exec "systemctl status pve-cluster --no-pager" "$TEMP_DIR/pve_cluster.out"
+    run_job safe_exec "systemctl status pvedaemon --no-pager" "$TEMP_DIR/pvedaemon.out"
+    run_job safe_exec "systemctl status pveproxy --no-pager" "$TEMP_DIR/pveproxy.out"
+    run_job safe_exec "systemctl status pvestatd --no-pager" "$TEMP_DIR/pvestatd.out"
+    run_job safe_exec "systemctl status pve-firewall --no-pager" "$TEMP_DIR/pve_firewall.out"
 }
 
 # Hardware Health Data Collection
 collect_hardware_health() {
     log_info "Collecting hardware health data..."
     
-    safe_exec "lscpu" "$TEMP_DIR/lscpu.out"
-    command_exists sensors && safe_exec "sensors" "$TEMP_DIR/sensors.out"
-    safe_exec "free -h" "$TEMP_DIR/free.out"
-    safe_exec "cat /proc/meminfo | grep -E 'MemTotal|MemFree|MemAvailable|Buffers|Cached'" "$TEMP_DIR/meminfo.out"
-    safe_exec "dmesg | grep -i 'memory\|oom'" "$TEMP_DIR/memory_issues.out"
-    safe_exec "cat /proc/buddyinfo" "$TEMP_DIR/buddyinfo.out"
-    safe_exec "dmesg | grep -i 'edac\|ecc\|memory.*error'" "$TEMP_DIR/memory_errors.out"
-    safe_exec "cat /proc/pressure/memory" "$TEMP_DIR/memory_pressure.out"
-    safe_exec "dmesg | grep -i 'hardware\|acpi\|thermal'" "$TEMP_DIR/hardware_issues.out"
-    safe_exec "lspci | grep -E 'VGA|Audio|Network|SATA|USB'" "$TEMP_DIR/pci_devices.out"
+    run_job safe_exec "lscpu" "$TEMP_DIR/lscpu.out"
+    command_exists sensors && run_job safe_exec "sensors" "$TEMP_DIR/sensors.out"
+    run_job safe_exec "free -h" "$TEMP_DIR/free.out"
+    run_job safe_exec "cat /proc/meminfo | grep -E 'MemTotal|MemFree|MemAvailable|Buffers|Cached'" "$TEMP_DIR/meminfo.out"
+    run_job derive_view dmesg "grep -i 'memory\|oom'" "$TEMP_DIR/memory_issues.out"
+    run_job safe_exec "cat /proc/buddyinfo" "$TEMP_DIR/buddyinfo.out"
+    run_job derive_view dmesg "grep -i 'edac\|ecc\|memory.*error'" "$TEMP_DIR/memory_errors.out"
+    run_job safe_exec "cat /proc/pressure/memory" "$TEMP_DIR/memory_pressure.out"
+    run_job derive_view dmesg "grep -i 'hardware\|acpi\|thermal'" "$TEMP_DIR/hardware_issues.out"
+    run_job safe_exec "lspci | grep -E 'VGA|Audio|Network|SATA|USB'" "$TEMP_DIR/pci_devices.out"
 }
 
 # Storage and Filesystem Data Collection
 collect_storage_filesystem() {
     log_info "Collecting storage and filesystem data..."
     
-    safe_exec "lsblk -f" "$TEMP_DIR/lsblk.out"
-    safe_exec "fdisk -l" "$TEMP_DIR/fdisk.out"
-    safe_exec "blkid" "$TEMP_DIR/blkid.out"
-    safe_exec "df -h" "$TEMP_DIR/df_h.out"
-    safe_exec "df -i" "$TEMP_DIR/df_i.out"
-    safe_exec "du -sh /* 2>/dev/null | sort -hr | head -10" "$TEMP_DIR/disk_usage.out"
-    command_exists iostat && safe_exec "iostat -x 1 3" "$TEMP_DIR/iostat.out"
-    safe_exec "cat /proc/diskstats" "$TEMP_DIR/diskstats.out"
-    safe_exec "dmesg | grep -i 'error\|fail\|timeout' | grep -E 'sd[a-z]|nvme|ata'" "$TEMP_DIR/storage_errors.out"
-    safe_exec "journalctl -u systemd-fsck@* --no-pager" "$TEMP_DIR/fsck_logs.out"
+    run_job safe_exec "lsblk -f" "$TEMP_DIR/lsblk.out"
+    run_job safe_exec "fdisk -l" "$TEMP_DIR/fdisk.out"
+    run_job safe_exec "blkid" "$TEMP_DIR/blkid.out"
+    run_job safe_exec "df -h" "$TEMP_DIR/df_h.out"
+    run_job safe_exec "df -i" "$TEMP_DIR/df_i.out"
+    run_job safe_exec "du -sh /* 2>/dev/null | sort -hr | head -10" "$TEMP_DIR/disk_usage.out"
+    run_job derive_view iostat "" "$TEMP_DIR/iostat.out"
+    run_job derive_view diskstats "" "$TEMP_DIR/diskstats.out"
+    run_job derive_view dmesg "grep -i 'error\|fail\|timeout' | grep -E 'sd[a-z]|nvme|ata'" "$TEMP_DIR/storage_errors.out"
+    run_job derive_view fsck_journal "" "$TEMP_DIR/fsck_logs.out"
     
     # SMART data
     for drive in /dev/sda /dev/sdb /dev/nvme0; do
-        [[ -e "$drive" ]] && command_exists smartctl && safe_exec "smartctl -a $drive" "$TEMP_DIR/smart_$(basename $drive).out"
+        [[ -e "$drive" ]] && command_exists smartctl && run_job safe_exec "smartctl -a $drive" "$TEMP_DIR/smart_$(basename $drive).out"
     done
     
     # ZFS
     if command_exists zpool; then
-        safe_exec "zpool status" "$TEMP_DIR/zpool_status.out"
-        safe_exec "zpool list" "$TEMP_DIR/zpool_list.out"
-        safe_exec "zfs list" "$TEMP_DIR/zfs_list.out"
-        safe_exec "zpool iostat -v" "$TEMP_DIR/zpool_iostat.out"
-        safe_exec "zpool history | tail -20" "$TEMP_DIR/zpool_history.out"
-        safe_exec "zfs get all | grep -E 'error|health|checksum'" "$TEMP_DIR/zfs_health.out"
-        safe_exec "zpool events | tail -20" "$TEMP_DIR/zpool_events.out"
-        safe_exec "cat /proc/spl/kstat/zfs/arcstats | grep -E 'hits|miss|size'" "$TEMP_DIR/zfs_arcstats.out"
+        run_job safe_exec "zpool status" "$TEMP_DIR/zpool_status.out"
+        run_job safe_exec "zpool list" "$TEMP_DIR/zpool_list.out"
+        run_job safe_exec "zfs list" "$TEMP_DIR/zfs_list.out"
+        run_job safe_exec "zpool iostat -v" "$TEMP_DIR/zpool_iostat.out"
+        run_job safe_exec "zpool history | tail -20" "$TEMP_DIR/zpool_history.out"
+        run_job safe_exec "zfs get all | grep -E 'error|health|checksum'" "$TEMP_DIR/zfs_health.out"
+        run_job safe_exec "zpool events | tail -20" "$TEMP_DIR/zpool_events.out"
+        run_job safe_exec "cat /proc/spl/kstat/zfs/arcstats | grep -E 'hits|miss|size'" "$TEMP_DIR/zfs_arcstats.out"
     fi
     
     # LVM
     if command_exists pvs; then
-        safe_exec "pvs" "$TEMP_DIR/pvs.out"
-        safe_exec "vgs" "$TEMP_DIR/vgs.out"
-        safe_exec "lvs" "$TEMP_DIR/lvs.out"
-        safe_exec "pvdisplay -v" "$TEMP_DIR/pvdisplay.out"
-        safe_exec "vgdisplay -v" "$TEMP_DIR/vgdisplay.out"
-        safe_exec "lvdisplay -v" "$TEMP_DIR/lvdisplay.out"
-        safe_exec "pvck /dev/sda3" "$TEMP_DIR/pvck.out"
-        safe_exec "vgck pve" "$TEMP_DIR/vgck.out"
+        run_job safe_exec "pvs" "$TEMP_DIR/pvs.out"
+        run_job safe_exec "vgs" "$TEMP_DIR/vgs.out"
+        run_job safe_exec "lvs" "$TEMP_DIR/lvs.out"
+        run_job safe_exec "pvdisplay -v" "$TEMP_DIR/pvdisplay.out"
+        run_job safe_exec "vgdisplay -v" "$TEMP_DIR/vgdisplay.out"
+        run_job safe_exec "lvdisplay -v" "$TEMP_DIR/lvdisplay.out"
+        run_job safe_exec "pvck /dev/sda3" "$TEMP_DIR/pvck.out"
+        run_job safe_exec "vgck pve" "$TEMP_DIR/vgck.out"
     fi
     
-    safe_exec "fsck -n /dev/mapper/pve-root 2>&1 | head -20" "$TEMP_DIR/fsck_root.out"
+    run_job safe_exec "fsck -n /dev/mapper/pve-root 2>&1 | head -20" "$TEMP_DIR/fsck_root.out"
 }
 
 # Network Diagnostics Data Collection
 collect_network_diagnostics() {
     log_info "Collecting network diagnostics data..."
     
-    safe_exec "ip addr show" "$TEMP_DIR/ip_addr.out"
-    safe_exec "ip route show" "$TEMP_DIR/ip_route.out"
-    safe_exec "ping -c 3 8.8.8.8" "$TEMP_DIR/ping_test.out"
-    safe_exec "nslookup google.com" "$TEMP_DIR/dns_test.out"
-    safe_exec "cat /etc/network/interfaces" "$TEMP_DIR/network_interfaces.out"
-    safe_exec "brctl show" "$TEMP_DIR/bridge_show.out"
-    command_exists pve-firewall && safe_exec "pve-firewall status" "$TEMP_DIR/firewall_status.out"
-    safe_exec "ss -tuln" "$TEMP_DIR/listening_ports.out"
+    run_job safe_exec "ip addr show" "$TEMP_DIR/ip_addr.out"
+    run_job safe_exec "ip route show" "$TEMP_DIR/ip_route.out"
+    run_job safe_exec "ping -c 3 8.8.8.8" "$TEMP_DIR/ping_test.out"
+    run_job safe_exec "nslookup google.com" "$TEMP_DIR/dns_test.out"
+    run_job safe_exec "cat /etc/network/interfaces" "$TEMP_DIR/network_interfaces.out"
+    run_job safe_exec "brctl show" "$TEMP_DIR/bridge_show.out"
+    command_exists pve-firewall && run_job safe_exec "pve-firewall status" "$TEMP_DIR/firewall_status.out"
+    run_job safe_exec "ss -tuln" "$TEMP_DIR/listening_ports.out"
 }
 
 # Proxmox Virtualization Data Collection
 collect_proxmox_virtualization() {
     log_info "Collecting Proxmox virtualization data..."
     
-    command_exists qm && safe_exec "qm list" "$TEMP_DIR/qm_list.out"
-    command_exists pct && safe_exec "pct list" "$TEMP_DIR/pct_list.out"
-    command_exists pvesm && safe_exec "pvesm status" "$TEMP_DIR/pvesm_status.out"
+    command_exists qm && run_job safe_exec "qm list" "$TEMP_DIR/qm_list.out"
+    command_exists pct && run_job safe_exec "pct list" "$TEMP_DIR/pct_list.out"
+    command_exists pvesm && run_job safe_exec "pvesm status" "$TEMP_DIR/pvesm_status.out"
+    # Per-guest accounting: every kvm/lxc process (the [x] keeps awk from matching
+    # itself) and the container cgroup counters
+    run_job safe_exec "ps -eo pid,etimes,pcpu,rss,args --sort=-pcpu | awk 'NR == 1 || /kvm -[i]d |lxc-[s]tart |\\[lxc [m]onitor\\]/'" "$TEMP_DIR/guest_processes.out"
+    [[ -d /sys/fs/cgroup/lxc ]] && run_job safe_exec "grep -H '' /sys/fs/cgroup/lxc/*/memory.current /sys/fs/cgroup/lxc/*/memory.max /sys/fs/cgroup/lxc/*/cpu.max; grep -H usage_usec /sys/fs/cgroup/lxc/*/cpu.stat" "$TEMP_DIR/lxc_cgroups.out"
     if command_exists pvecm; then
-        safe_exec "pvecm status" "$TEMP_DIR/pvecm_status.out"
-        safe_exec "corosync-quorumtool -s" "$TEMP_DIR/corosync_quorum.out"
+        run_job safe_exec "pvecm status" "$TEMP_DIR/pvecm_status.out"
+        run_job safe_exec "corosync-quorumtool -s" "$TEMP_DIR/corosync_quorum.out"
     fi
 }
 
@@ -150,81 +302,290 @@ collect_proxmox_virtualization() {
 collect_performance_monitoring() {
     log_info "Collecting performance monitoring data..."
     
-    safe_exec "uptime" "$TEMP_DIR/uptime.out"
-    safe_exec "top -bn1 | head -20" "$TEMP_DIR/top.out"
-    safe_exec "ps aux --sort=-%cpu | head -10" "$TEMP_DIR/top_cpu.out"
-    safe_exec "ps aux --sort=-%mem | head -10" "$TEMP_DIR/top_mem.out"
-    command_exists iostat && safe_exec "iostat -x 1 3" "$TEMP_DIR/iostat_perf.out"
-    safe_exec "cat /proc/loadavg" "$TEMP_DIR/loadavg.out"
-    safe_exec "cat /proc/diskstats" "$TEMP_DIR/diskstats_perf.out"
-    safe_exec "ulimit -a" "$TEMP_DIR/ulimits.out"
-    safe_exec "cat /proc/sys/fs/file-max" "$TEMP_DIR/file_max.out"
-    safe_exec "cat /proc/sys/kernel/pid_max" "$TEMP_DIR/pid_max.out"
+    run_job safe_exec "uptime" "$TEMP_DIR/uptime.out"
+    run_job safe_exec "top -bn1 | head -20" "$TEMP_DIR/top.out"
+    run_job safe_exec "ps aux --sort=-%cpu | head -10" "$TEMP_DIR/top_cpu.out"
+    run_job safe_exec "ps aux --sort=-%mem | head -10" "$TEMP_DIR/top_mem.out"
+    run_job derive_view iostat "" "$TEMP_DIR/iostat_perf.out"
+    run_job safe_exec "cat /proc/loadavg" "$TEMP_DIR/loadavg.out"
+    run_job derive_view diskstats "" "$TEMP_DIR/diskstats_perf.out"
+    run_job safe_exec "ulimit -a" "$TEMP_DIR/ulimits.out"
+    run_job safe_exec "cat /proc/sys/fs/file-max" "$TEMP_DIR/file_max.out"
+    run_job safe_exec "cat /proc/sys/kernel/pid_max" "$TEMP_DIR/pid_max.out"
+    # Load, memory, pressure and disk over the last day from proxmox-sampler.py, if it is running
+    if [[ -n "$SAMPLES_FILE" && -f "$SAMPLES_FILE" ]]; then
+        run_job safe_exec "python3 '$SAMPLER_SCRIPT' summary --state '$SAMPLES_FILE'" "$TEMP_DIR/samples.out"
+    elif [[ -n "$SAMPLES_FILE" ]]; then
+        log_info "No sample ring at $SAMPLES_FILE (sampler not running), skipping samples"
+    fi
+}
+
+# Journal entries at or above JOURNAL_PRIORITY as JSON records, one per line.
+# Reads on from the cursor stored by the previous run, so consecutive runs
+# see every entry exactly once; without a stored cursor (first run, or one
+# journalctl cannot seek to) it reads the current boot. --show-cursor
+# appends the position the next run starts from.
+collect_journal() {
+    local output_file="$1" cursor=""
+    local cmd="journalctl -o json --all --no-pager -q -p $JOURNAL_PRIORITY --show-cursor"
+    cmd+=" --output-fields=PRIORITY,_SYSTEMD_UNIT,SYSLOG_IDENTIFIER,_COMM,MESSAGE"
+    [[ -s "$JOURNAL_CURSOR_FILE" ]] && cursor=$(< "$JOURNAL_CURSOR_FILE")
+    if [[ "$cursor" =~ ^[[:alnum:]=\;]+$ ]]; then
+        safe_exec "$cmd --after-cursor='$cursor'" "$output_file"
+        [[ "$(tail -n 1 "$output_file")" == "=== Exit Code: 0 ===" ]] && return 0
+        log_error "Cannot read the journal after the stored cursor, reading the current boot"
+    fi
+    safe_exec "$cmd -b" "$output_file"
+}
+
+# The next run reads on from the last entry of this snapshot; only stored once the snapshot is complete
+commit_journal_cursor() {
+    [[ -n "$JOURNAL_CURSOR_FILE" && -n "$JOURNAL_NEXT_CURSOR" ]] || return 0
+    mkdir -p "$(dirname "$JOURNAL_CURSOR_FILE")"
+    echo "$JOURNAL_NEXT_CURSOR" > "$JOURNAL_CURSOR_FILE.partial"
+    mv "$JOURNAL_CURSOR_FILE.partial" "$JOURNAL_CURSOR_FILE"
 }
 
 # Log Analysis Data Collection
 collect_log_analysis() {
     log_info "Collecting log analysis data..."
     
-    safe_exec "journalctl --since '1 hour ago' -p err --no-pager" "$TEMP_DIR/recent_errors.out"
-    safe_exec "tail -50 /var/log/pve/tasks/index" "$TEMP_DIR/pve_tasks.out"
-    safe_exec "journalctl -b | grep -i 'error\|fail\|warn\|critical' | tail -50" "$TEMP_DIR/boot_issues.out"
-    safe_exec "dmesg | grep -i 'error\|fail\|warn' | tail -50" "$TEMP_DIR/kernel_issues.out"
-    safe_exec "journalctl -u systemd-fsck@* --no-pager | tail -50" "$TEMP_DIR/fsck_recent.out"
-    safe_exec "journalctl -u pvedaemon --since '1 hour ago' --no-pager" "$TEMP_DIR/pvedaemon_recent.out"
-    safe_exec "journalctl -u pveproxy --since '1 hour ago' --no-pager" "$TEMP_DIR/pveproxy_recent.out"
-    safe_exec "journalctl -u corosync --since '1 hour ago' --no-pager" "$TEMP_DIR/corosync_recent.out"
+    run_job safe_exec "tail -50 /var/log/pve/tasks/index" "$TEMP_DIR/pve_tasks.out"
+    run_job derive_view dmesg "grep -i 'error\|fail\|warn' | tail -50" "$TEMP_DIR/kernel_issues.out"
+    run_job derive_view fsck_journal "tail -50" "$TEMP_DIR/fsck_recent.out"
+    if [[ -n "$JOURNAL_CURSOR_FILE" ]]; then
+        # Replaces the fixed one-hour windows and the truncated boot excerpts below
+        run_job collect_journal "$TEMP_DIR/journal.out"
+        return 0
+    fi
+    run_job safe_exec "journalctl --since '1 hour ago' -p err --no-pager" "$TEMP_DIR/recent_errors.out"
+    run_job derive_view journal_boot "grep -i 'error\|fail\|warn\|critical' | tail -50" "$TEMP_DIR/boot_issues.out"
+    run_job safe_exec "journalctl -u pvedaemon --since '1 hour ago' --no-pager" "$TEMP_DIR/pvedaemon_recent.out"
+    run_job safe_exec "journalctl -u pveproxy --since '1 hour ago' --no-pager" "$TEMP_DIR/pveproxy_recent.out"
+    run_job safe_exec "journalctl -u corosync --since '1 hour ago' --no-pager" "$TEMP_DIR/corosync_recent.out"
 }
 
 # Security and Updates Data Collection
 collect_security_updates() {
     log_info "Collecting security and updates data..."
     
-    safe_exec "apt update" "$TEMP_DIR/apt_update.out"
-    safe_exec "apt list --upgradable" "$TEMP_DIR/apt_upgradable.out"
-    command_exists pvesubscription && safe_exec "pvesubscription get" "$TEMP_DIR/pve_subscription.out"
-    safe_exec "apt list --upgradable | grep -i security" "$TEMP_DIR/security_updates.out"
-    safe_exec "last | head -10" "$TEMP_DIR/last_logins.out"
-    safe_exec "lastb | head -10" "$TEMP_DIR/failed_logins.out"
-    safe_exec "openssl x509 -in /etc/pve/local/pve-ssl.pem -text -noout | grep -A 2 'Not After'" "$TEMP_DIR/cert_expiry.out"
-    safe_exec "openssl x509 -in /etc/pve/local/pve-ssl.pem -checkend 86400" "$TEMP_DIR/cert_check.out"
+    # apt update itself runs with the shared sources (see start_sources)
+    run_job derive_view apt_upgradable "" "$TEMP_DIR/apt_upgradable.out"
+    command_exists pvesubscription && run_job safe_exec "pvesubscription get" "$TEMP_DIR/pve_subscription.out"
+    run_job derive_view apt_upgradable "grep -i security" "$TEMP_DIR/security_updates.out"
+    run_job safe_exec "last | head -10" "$TEMP_DIR/last_logins.out"
+    run_job safe_exec "lastb | head -10" "$TEMP_DIR/failed_logins.out"
+    run_job safe_exec "openssl x509 -in /etc/pve/local/pve-ssl.pem -text -noout | grep -A 2 'Not After'" "$TEMP_DIR/cert_expiry.out"
+    run_job safe_exec "openssl x509 -in /etc/pve/local/pve-ssl.pem -checkend 86400" "$TEMP_DIR/cert_check.out"
+}
+
+# Per-command wall time and exit code as a JSON object
+command_timings_json() {
+    local file seconds rc separator=""
+    printf '{'
+    for file in "$TIMING_DIR"/*; do
+        [[ -f "$file" ]] || continue
+        read -r seconds rc < "$file"
+        printf '%s\n            "%s": {"seconds": %s, "exit_code": %s}' "$separator" "${file##*/}" "$seconds" "$rc"
+        separator=","
+    done
+    printf '\n        }'
+}
+
+compress_stream() {
+    case "$COMPRESS" in
+        gzip) gzip -c ;;
+        zstd) zstd -q -c ;;
+        *) cat ;;
+    esac
+}
+
+# Write the complete JSON document to stdout
+#
+# A single jq process reads every output file once (--rawfile handles the
+# escaping) and prints the document in one pass, so the cost is linear in
+# the total output size rather than one full rewrite per output file.
+assemble_raw_data_json() {
+    local metadata="$1"
+    local -a rawfiles=()
+    local file key
+    for file in "$TEMP_DIR"/*.out; do
+        [[ -f "$file" ]] || continue
+        key="${file##*/}"
+        rawfiles+=(--rawfile "${key%.out}" "$file")
+    done
+    jq -n --argjson metadata "$metadata" "${rawfiles[@]}" \
+        '{metadata: $metadata, raw_outputs: ($ARGS.named | del(.metadata))}'
+}
+
+# Print an unsigned 32-bit integer as 4 little-endian bytes
+print_uint32_le() {
+    local n="$1"
+    printf "$(printf '\\x%02x\\x%02x\\x%02x\\x%02x' \
+        $((n & 255)) $((n >> 8 & 255)) $((n >> 16 & 255)) $((n >> 24 & 255)))"
+}
+
+# Write the snapshot container to stdout
+#
+# Layout: "PXSNAP01", the header length as a little-endian uint32, a JSON
+# header with the metadata and an index of every output (offset after the
+# header, compressed and uncompressed size, codec), then the outputs. Each
+# output is compressed on its own so the analyzer can read any one of them
+# without decompressing the rest.
+assemble_container() {
+    local metadata="$1" index="$TEMP_DIR/container.index" file key i offset=0
+    local -a outputs=() blobs=() sizes=() raw_sizes=()
+    for file in "$TEMP_DIR"/*.out; do
+        [[ -f "$file" ]] && outputs+=("$file")
+    done
+    if (( ${#outputs[@]} > 0 )); then
+        # One compressor process writes a .gz/.zst next to every output
+        case "$COMPRESS" in
+            gzip) gzip -k -n -f "${outputs[@]}"; blobs=("${outputs[@]/%/.gz}") ;;
+            zstd) zstd -q -k -f "${outputs[@]}"; blobs=("${outputs[@]/%/.zst}") ;;
+            *) blobs=("${outputs[@]}") ;;
+        esac
+        mapfile -t sizes < <(stat -c %s "${blobs[@]}")
+        mapfile -t raw_sizes < <(stat -c %s "${outputs[@]}")
+    fi
+    for i in "${!outputs[@]}"; do
+        key="${outputs[i]##*/}"
+        printf '{"key": "%s", "offset": %d, "size": %d, "raw_size": %d}\n' \
+            "${key%.out}" "$offset" "${sizes[i]}" "${raw_sizes[i]}"
+        offset=$((offset + sizes[i]))
+    done > "$index"
+    jq -c -s --argjson metadata "$metadata" --arg codec "$COMPRESS" \
+        '{format_version: 1, metadata: $metadata,
+          outputs: (map({(.key): {offset, size, raw_size, codec: $codec}}) | add // {})}' \
+        "$index" > "$TEMP_DIR/container.header"
+    printf 'PXSNAP01'
+    print_uint32_le "$(stat -c %s "$TEMP_DIR/container.header")"
+    cat "$TEMP_DIR/container.header"
+    (( ${#blobs[@]} == 0 )) || cat "${blobs[@]}"
+}
+
+# Delta snapshots. DELTA_DIR keeps the previous run's outputs and a manifest
+# of their hashes. Outputs whose hash did not change are left out; changed
+# outputs are sent as a line diff (diff -n) against the previous version
+# when that is smaller. The metadata lists the hash of every output and the
+# previous run's timestamp as the base, from which the analyzer restores
+# the rest. Every DELTA_MAX_CHAIN runs a full snapshot starts a new chain.
+prepare_delta() {
+    local hashes="$TEMP_DIR/output.hashes" next="$TEMP_DIR/delta.next" key hash base="" chain=0
+    local manifest="$DELTA_DIR/manifest.json" patched="" unchanged=0 patches=0 rc
+    local -A previous=()
+    (cd "$TEMP_DIR" && sha256sum -- *.out) | while read -r hash key; do
+        printf '%s\t%s\n' "${key%.out}" "${hash:0:16}"
+    done > "$hashes"
+    # Full outputs of this run become the next run's base
+    mkdir -p "$next/outputs"
+    cp "$TEMP_DIR"/*.out "$next/outputs/"
+    
+    if [[ -f "$manifest" ]] && [[ "$(jq -r '.hostname // ""' "$manifest" 2>/dev/null)" == "$HOSTNAME" ]]; then
+        chain=$(( $(jq -r '.chain // 0' "$manifest") + 1 ))
+        if (( chain <= DELTA_MAX_CHAIN )); then
+            base=$(jq -r '.timestamp' "$manifest")
+            while IFS=$'\t' read -r key hash; do
+                previous[$key]="$hash"
+            done < <(jq -r '.hashes | to_entries[] | "\(.key)\t\(.value)"' "$manifest")
+        fi
+    fi
+    if [[ -z "$base" ]]; then
+        chain=0
+    else
+        while IFS=$'\t' read -r key hash; do
+            local old="$DELTA_DIR/outputs/$key.out" new="$TEMP_DIR/$key.out"
+            if [[ "${previous[$key]:-}" == "$hash" ]]; then
+                rm -f "$new"
+                unchanged=$((unchanged + 1))
+            elif [[ -n "${previous[$key]:-}" && -f "$old" ]] \
+                    && [[ "$(sha256sum < "$old" | cut -c1-16)" == "${previous[$key]}" ]] \
+                    && [[ -z "$(tail -c 1 "$old")" && -z "$(tail -c 1 "$new")" ]]; then
+                # diff exits 1 when the files differ, 2 on trouble; only a smaller patch replaces the output
+                rc=0
+                diff -n "$old" "$new" > "$new.patch" || rc=$?
+                (( rc <= 1 )) || return 1
+                if (( $(stat -c %s "$new.patch") < $(stat -c %s "$new") / 2 )); then
+                    mv "$new.patch" "$new"
+                    patched+="${patched:+, }\"$key\": \"${previous[$key]}\""
+                    patches=$((patches + 1))
+                else
+                    rm -f "$new.patch"
+                fi
+            fi
+        done < "$hashes"
+        log_info "Delta snapshot against $base: $unchanged of $(wc -l < "$hashes") outputs unchanged, $patches sent as diffs"
+    fi
+    
+    jq -R -s --arg timestamp "$TIMESTAMP" --arg hostname "$HOSTNAME" --argjson chain "$chain" \
+        '{timestamp: $timestamp, hostname: $hostname, chain: $chain,
+          hashes: (split("\n") | map(select(length > 0) | split("\t") | {(.[0]): .[1]}) | add // {})}' \
+        < "$hashes" > "$next/manifest.json"
+    DELTA_METADATA=",
+    \"output_hashes\": $(jq -c '.hashes' "$next/manifest.json")"
+    if [[ -n "$base" ]]; then
+        DELTA_METADATA+=",
+    \"delta\": {\"base\": \"$base\", \"chain\": $chain, \"patched\": {$patched}}"
+    fi
+}
+
+# The next run is a delta against this snapshot; only stored once the snapshot is complete.
+# The manifest goes last: an interrupted update leaves outputs that fail their hash check.
+commit_delta() {
+    [[ -n "$DELTA_DIR" ]] || return 0
+    mkdir -p "$DELTA_DIR"
+    rm -rf "$DELTA_DIR/outputs.old"
+    [[ ! -d "$DELTA_DIR/outputs" ]] || mv "$DELTA_DIR/outputs" "$DELTA_DIR/outputs.old"
+    mv "$TEMP_DIR/delta.next/outputs" "$DELTA_DIR/outputs"
+    rm -rf "$DELTA_DIR/outputs.old"
+    mv "$TEMP_DIR/delta.next/manifest.json" "$DELTA_DIR/manifest.json.partial"
+    mv "$DELTA_DIR/manifest.json.partial" "$DELTA_DIR/manifest.json"
+}
+
+# Write the snapshot in the selected format to stdout
+write_snapshot() {
+    if [[ "$FORMAT" == "container" ]]; then
+        assemble_container "$1"
+    else
+        assemble_raw_data_json "$1" | compress_stream
+    fi
 }
 
 # Generate raw data JSON
 generate_raw_data_json() {
     log_info "Generating raw data JSON..."
+    if [[ -f "$TEMP_DIR/journal.out" ]]; then
+        JOURNAL_NEXT_CURSOR=$(sed -n 's/^-- cursor: //p' "$TEMP_DIR/journal.out" | tail -n 1)
+    fi
+    # Called outside a condition, so set -e still applies inside prepare_delta
+    if [[ -n "$DELTA_DIR" ]]; then
+        prepare_delta
+    fi
     
-    local final_json="$TEMP_DIR/raw_data.json"
-    
-    # Create base structure
-    cat > "$final_json" << EOF
+    local metadata
+    metadata=$(cat << EOF
 {
-    "metadata": {
-        "script_version": "$SCRIPT_VERSION",
-        "timestamp": "$TIMESTAMP",
-        "hostname": "$HOSTNAME",
-        "collection_type": "raw_data"
-    },
-    "raw_outputs": {}
+    "script_version": "$SCRIPT_VERSION",
+    "timestamp": "$TIMESTAMP",
+    "hostname": "$HOSTNAME",
+    "collection_type": "raw_data",
+    "max_parallel_jobs": $MAX_JOBS,
+    "collection_seconds": $COLLECTION_SECONDS,
+    "command_timings": $(command_timings_json)$DELTA_METADATA
 }
 EOF
+)
     
-    # Add all output files to JSON
-    for file in "$TEMP_DIR"/*.out; do
-        [[ -f "$file" ]] || continue
-        local basename=$(basename "$file" .out)
-        local content=$(cat "$file" | jq -Rs . 2>/dev/null || echo '""')
-        jq --arg key "$basename" --argjson content "$content" '.raw_outputs[$key] = $content' "$final_json" > "$TEMP_DIR/temp.json"
-        mv "$TEMP_DIR/temp.json" "$final_json"
-    done
-    
-    # Output final JSON
+    # Output the snapshot, renamed into place so readers never see a partial file
     if [[ -n "$OUTPUT_FILE" ]]; then
-        cp "$final_json" "$OUTPUT_FILE"
+        write_snapshot "$metadata" > "$OUTPUT_FILE.partial"
+        mv "$OUTPUT_FILE.partial" "$OUTPUT_FILE"
         log_info "Raw data saved to: $OUTPUT_FILE"
     else
-        cat "$final_json"
+        write_snapshot "$metadata"
     fi
+    commit_delta
+    commit_journal_cursor
 }
 
 # Main execution
@@ -235,7 +596,10 @@ main() {
     log_info "Timestamp: $TIMESTAMP"
     log_info "Hostname: $HOSTNAME"
     
-    # Run all data collection
+    # Run all data collection; commands run concurrently up to MAX_JOBS
+    local collect_start
+    now_us collect_start
+    start_sources
     collect_system_overview
     collect_hardware_health
     collect_storage_filesystem
@@ -244,6 +608,10 @@ main() {
     collect_performance_monitoring
     collect_log_analysis
     collect_security_updates
+    wait
+    local collect_end
+    now_us collect_end
+    COLLECTION_SECONDS=$(printf '%d.%06d' $(((collect_end - collect_start) / 1000000)) $(((collect_end - collect_start) % 1000000)))
     
     # Generate raw data JSON
     generate_raw_data_json
@@ -254,9 +622,15 @@ main() {
     log_info "Data collection completed in ${total_time} seconds"
 }
 
+# Allow sourcing the functions (see benchmark-json-assembly.sh) without collecting
+[[ "${BASH_SOURCE[0]}" == "$0" ]] || return 0
+
 # Check dependencies
 missing_tools=()
-for tool in jq timeout; do
+required_tools=(jq timeout)
+[[ -n "$DELTA_DIR" ]] && required_tools+=(sha256sum diff)
+[[ "$COMPRESS" != "none" ]] && required_tools+=("$COMPRESS")
+for tool in "${required_tools[@]}"; do
     command_exists "$tool" || missing_tools+=("$tool")
 done
 
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Proxmox /proc Sampler
+Samples load, CPU, memory, pressure and disk counters every few seconds into
+a fixed-size ring buffer file; the data collector embeds a downsampled
+summary of it in each snapshot (--samples).
+
+Only the Python standard library is used, and sampling never forks: the
+/proc files are opened once and re-read with pread().
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import resource
+import signal
+import struct
+import sys
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+
+DEFAULT_INTERVAL_SECONDS = 5.0
+# Ring buffer size: a day of samples plus slack for a late collector run
+DEFAULT_RETENTION_SECONDS = 26 * 3600
+DEFAULT_WINDOW_SECONDS = 24 * 3600
+DEFAULT_BUCKET_SECONDS = 300
+
+# Ring file: header (padded to a page), then capacity records of len(FIELDS) doubles
+RING_MAGIC = b'PXRING01'
+RING_HEADER = struct.Struct('<8sIIdQddQ')
+RING_DATA_OFFSET = 4096
+
+# One record per sample; rates and pressure are over the interval since the
+# previous sample (NaN for the first one)
+FIELDS = (
+    'time',
+    'load1', 'load5', 'procs_running', 'procs_blocked',
+    'cpu_busy_percent', 'cpu_iowait_percent', 'cpu_steal_percent',
+    'mem_used_percent', 'mem_available_mb', 'swap_used_percent',
+    'psi_cpu_some', 'psi_memory_some', 'psi_memory_full', 'psi_io_some', 'psi_io_full',
+    'disk_read_mbps', 'disk_write_mbps', 'disk_busy_max_percent',
+)
+PRESSURE_RESOURCES = ('cpu', 'memory', 'io')
+# Whole disks only; partitions and device-mapper volumes would count their I/O twice
+DISK_PHYSICAL_RE = re.compile(r'^(?:(?:[hsv]d|xvd)[a-z]+|nvme\d+n\d+|mmcblk\d+)$')
+SECTOR_BYTES = 512
+
+NAN = float('nan')
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class ProcReader:
+    """Open /proc files, re-read in place on every sample"""
+
+    def __init__(self):
+        self.fds: Dict[str, int] = {}
+        for name in ('loadavg', 'stat', 'meminfo', 'diskstats'):
+            self.fds[name] = os.open(f'/proc/{name}', os.O_RDONLY)
+        for name in PRESSURE_RESOURCES:
+            try:
+                self.fds[f'pressure/{name}'] = os.open(f'/proc/pressure/{name}', os.O_RDONLY)
+            except OSError:
+                # Kernel without PSI (or psi=0): those fields stay NaN
+                continue
+        self.previous: Optional[Dict[str, Any]] = None
+
+    def read(self, name: str) -> bytes:
+        fd = self.fds.get(name)
+        if fd is None:
+            return b''
+        chunks = []
+        offset = 0
+        while True:
+            chunk = os.pread(fd, 65536, offset)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+            offset += len(chunk)
+
+    def counters(self) -> Dict[str, Any]:
+        """Raw readings; counters are turned into rates against the previous sample"""
+        loadavg = self.read('loadavg').split()
+        current = {
+            "time": time.time(),
+            "monotonic": time.monotonic(),
+            "load1": float(loadavg[0]),
+            "load5": float(loadavg[1]),
+            "procs_running": float(loadavg[3].split(b'/')[0]),
+        }
+        for line in self.read('stat').split(b'\n'):
+            if line.startswith(b'cpu '):
+                current["cpu"] = [int(value) for value in line.split()[1:9]]
+            elif line.startswith(b'procs_blocked '):
+                current["procs_blocked"] = float(line.split()[1])
+
+        meminfo = {}
+        for line in self.read('meminfo').split(b'\n'):
+            key, _, value = line.partition(b':')
+            if key in (b'MemTotal', b'MemAvailable', b'SwapTotal', b'SwapFree'):
+                meminfo[key] = int(value.split()[0])
+        current["meminfo"] = meminfo
+
+        for name in PRESSURE_RESOURCES:
+            for line in self.read(f'pressure/{name}').split(b'\n'):
+                if line.startswith((b'some ', b'full ')):
+                    current[f"psi_{name}_{line[:4].decode()}"] = int(line.rpartition(b'total=')[2])
+
+        read_sectors = write_sectors = 0
+        busy_ms = {}
+        for line in self.read('diskstats').split(b'\n'):
+            parts = line.split()
+            if len(parts) >= 14 and DISK_PHYSICAL_RE.match(parts[2].decode()):
+                read_sectors += int(parts[5])
+                write_sectors += int(parts[9])
+                busy_ms[parts[2]] = int(parts[12])
+        current["disk"] = (read_sectors, write_sectors, busy_ms)
+        return current
+
+    def sample(self) -> List[float]:
+        """One record in FIELDS order"""
+        current = self.counters()
+        previous, self.previous = self.previous, current
+        record = dict.fromkeys(FIELDS, NAN)
+        for key in ('time', 'load1', 'load5', 'procs_running', 'procs_blocked'):
+            record[key] = current.get(key, NAN)
+
+        meminfo = current["meminfo"]
+        if meminfo.get(b'MemTotal'):
+            record['mem_used_percent'] = (1 - meminfo.get(b'MemAvailable', 0) / meminfo[b'MemTotal']) * 100
+            record['mem_available_mb'] = meminfo.get(b'MemAvailable', 0) / 1024
+        if meminfo.get(b'SwapTotal'):
+            record['swap_used_percent'] = (1 - meminfo.get(b'SwapFree', 0) / meminfo[b'SwapTotal']) * 100
+
+        if previous is None:
+            return [record[field] for field in FIELDS]
+        elapsed = current["monotonic"] - previous["monotonic"]
+        if elapsed <= 0:
+            return [record[field] for field in FIELDS]
+
+        # user nice system idle iowait irq softirq steal
+        if "cpu" in current and "cpu" in previous:
+            deltas = [now - before for now, before in zip(current["cpu"], previous["cpu"])]
+            total = sum(deltas)
+            if total > 0:
+                record['cpu_busy_percent'] = (total - deltas[3] - deltas[4]) / total * 100
+                record['cpu_iowait_percent'] = deltas[4] / total * 100
+                record['cpu_steal_percent'] = deltas[7] / total * 100
+
+        # PSI totals are stall time in microseconds
+        for name in PRESSURE_RESOURCES:
+            for kind in ('some', 'full'):
+                key = f"psi_{name}_{kind}"
+                if key in current and key in previous and key in record:
+                    record[key] = (current[key] - previous[key]) / (elapsed * 1e6) * 100
+
+        read_sectors, write_sectors, busy_ms = current["disk"]
+        before_read, before_write, before_busy = previous["disk"]
+        record['disk_read_mbps'] = (read_sectors - before_read) * SECTOR_BYTES / elapsed / 1e6
+        record['disk_write_mbps'] = (write_sectors - before_write) * SECTOR_BYTES / elapsed / 1e6
+        busy = [(ms - before_busy[name]) / (elapsed * 1000) * 100
+                for name, ms in busy_ms.items() if name in before_busy]
+        if busy:
+            record['disk_busy_max_percent'] = min(max(busy), 100.0)
+        return [record[field] for field in FIELDS]
+
+
+class SampleRing:
+    """Fixed-size ring buffer of sample records in a memory-mapped file
+
+    The header holds the number of records ever written; record n lives
+    in slot n % capacity. The writer fills a slot before advancing the
+    count, so a reader only has to skip the oldest slot, which the writer
+    may be overwriting. The header also carries the sampler's own CPU
+    time and peak RSS, so its overhead is reported with its data.
+    """
+
+    def __init__(self, path: str, capacity: int = 0, interval: float = DEFAULT_INTERVAL_SECONDS,
+                 writable: bool = False):
+        self.path = path
+        self.width = len(FIELDS)
+        if writable:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            size = RING_DATA_OFFSET + capacity * self.width * 8
+            if os.fstat(fd).st_size != size or not self._valid(fd, capacity, interval):
+                # New ring, or one with another size, interval or field layout: start over
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                header = RING_HEADER.pack(RING_MAGIC, self.width, capacity, interval, 0, time.time(), 0.0, 0)
+                os.pwrite(fd, header, 0)
+        else:
+            fd = os.open(path, os.O_RDONLY)
+        try:
+            self.map = mmap.mmap(fd, 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, width, self.capacity, self.interval, _, self.started, _, _ = RING_HEADER.unpack_from(self.map, 0)
+        if magic != RING_MAGIC or width != self.width:
+            raise ValueError(f"{path} is not a sample ring of this sampler version")
+        self.data = memoryview(self.map)[RING_DATA_OFFSET:].cast('d')
+
+    def _valid(self, fd: int, capacity: int, interval: float) -> bool:
+        magic, width, stored_capacity, stored_interval = RING_HEADER.unpack(os.pread(fd, RING_HEADER.size, 0))[:4]
+        return (magic, width, stored_capacity, stored_interval) == (RING_MAGIC, self.width, capacity, interval)
+
+    @property
+    def written(self) -> int:
+        return RING_HEADER.unpack_from(self.map, 0)[4]
+
+    def append(self, record: List[float]):
+        written = self.written
+        slot = written % self.capacity * self.width
+        self.data[slot:slot + self.width] = array('d', record)
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        RING_HEADER.pack_into(self.map, 0, RING_MAGIC, self.width, self.capacity, self.interval, written + 1,
+                              self.started, usage.ru_utime + usage.ru_stime, usage.ru_maxrss)
+
+    def records(self, since: float = 0.0) -> List[List[float]]:
+        """Stored records in time order, newer than since"""
+        written = self.written
+        first = max(0, written - self.capacity + 1)
+        records = []
+        for index in range(first, written):
+            slot = index % self.capacity * self.width
+            record = self.data[slot:slot + self.width].tolist()
+            if record[0] > since:
+                records.append(record)
+        return records
+
+    def overhead(self) -> Dict[str, Any]:
+        """The sampler's own CPU use since it started, and its peak memory"""
+        _, _, _, _, written, started, cpu_seconds, max_rss_kb = RING_HEADER.unpack_from(self.map, 0)
+        running = max(time.time() - started, 1e-9)
+        return {
+            "running_seconds": round(running),
+            "cpu_seconds": round(cpu_seconds, 3),
+            "cpu_percent": round(cpu_seconds / running * 100, 4),
+            "max_rss_kb": max_rss_kb,
+            "samples_written": written
+        }
+
+    def close(self):
+        self.data.release()
+        self.map.close()
+
+
+def summarize(records: List[List[float]], bucket_seconds: int) -> Dict[str, Any]:
+    """Downsample records into min/avg/max/p99 per field and time bucket (null where no value)"""
+    buckets: Dict[int, List[List[float]]] = {}
+    for record in records:
+        buckets.setdefault(int(record[0] // bucket_seconds * bucket_seconds), []).append(record)
+
+    series = {field: {"min": [], "avg": [], "max": [], "p99": []} for field in FIELDS[1:]}
+    counts = []
+    for start in sorted(buckets):
+        rows = buckets[start]
+        counts.append(len(rows))
+        for column, field in enumerate(FIELDS[1:], start=1):
+            values = sorted(row[column] for row in rows if not math.isnan(row[column]))
+            stats = series[field]
+            if not values:
+                for name in stats:
+                    stats[name].append(None)
+                continue
+            stats["min"].append(round(values[0], 2))
+            stats["avg"].append(round(sum(values) / len(values), 2))
+            stats["max"].append(round(values[-1], 2))
+            stats["p99"].append(round(percentile(values, 99), 2))
+    return {
+        "bucket_seconds": bucket_seconds,
+        "start": sorted(buckets),
+        "count": counts,
+        "series": series
+    }
+
+
+def run_main(args: argparse.Namespace):
+    capacity = max(2, int(args.retention / args.interval))
+    ring = SampleRing(args.state, capacity, args.interval, writable=True)
+    reader = ProcReader()
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+
+    print(f"Sampling every {args.interval:g}s into {args.state} ({capacity} samples)", file=sys.stderr)
+    deadline = time.monotonic()
+    while not stopping:
+        ring.append(reader.sample())
+        # Fixed schedule, so a slow sample does not shift the following ones
+        deadline += args.interval
+        delay = deadline - time.monotonic()
+        if delay < 0:
+            deadline = time.monotonic()
+            continue
+        time.sleep(delay)
+    ring.map.flush()
+    ring.close()
+
+
+def summary_main(args: argparse.Namespace):
+    try:
+        ring = SampleRing(args.state)
+    except (OSError, ValueError) as e:
+        print(f"Error: cannot read sample ring: {e}", file=sys.stderr)
+        sys.exit(1)
+    records = ring.records(time.time() - args.window)
+    summary = {
+        "interval_seconds": ring.interval,
+        "samples": len(records),
+        "first": records[0][0] if records else None,
+        "last": records[-1][0] if records else None,
+        "sampler": ring.overhead()
+    }
+    summary.update(summarize(records, args.bucket))
+    ring.close()
+    print(json.dumps(summary, separators=(',', ':')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sample /proc into a ring buffer for the data collector')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Sample until stopped (SIGTERM)')
+    run_parser.add_argument('--state', required=True, help='Ring buffer file')
+    run_parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL_SECONDS,
+                            help=f'Seconds between samples (default: {DEFAULT_INTERVAL_SECONDS:g})')
+    run_parser.add_argument('--retention', type=float, default=DEFAULT_RETENTION_SECONDS,
+                            help=f'Seconds of samples kept (default: {DEFAULT_RETENTION_SECONDS})')
+
+    summary_parser = subparsers.add_parser('summary', help='Print downsampled min/avg/max/p99 series as JSON')
+    summary_parser.add_argument('--state', required=True, help='Ring buffer file')
+    summary_parser.add_argument('--window', type=float, default=DEFAULT_WINDOW_SECONDS,
+                                help=f'Summarize the last N seconds (default: {DEFAULT_WINDOW_SECONDS})')
+    summary_parser.add_argument('--bucket', type=int, default=DEFAULT_BUCKET_SECONDS,
+                                help=f'Seconds per summary point (default: {DEFAULT_BUCKET_SECONDS})')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        if args.interval <= 0 or args.retention < args.interval:
+            print("Error: --interval must be positive and no longer than --retention", file=sys.stderr)
+            sys.exit(1)
+        run_main(args)
+    else:
+        if args.bucket <= 0:
+            print("Error: --bucket must be positive", file=sys.stderr)
+            sys.exit(1)
+        summary_main(args)
+
+
+if __name__ == '__main__':
+    main()